@@ -0,0 +1,126 @@
+###############################################################################
+# Top-level program to process a flight from the command line, without the
+# GUI, e.g. to reprocess a campaign on a machine without a display.
+#
+# Process a flight listed in the production setup files:
+#     python3 MTPbatch.py --config <proj.yml> --fltno rf01
+# or a .RAW file and NetCDF file directly:
+#     python3 MTPbatch.py --config <proj.yml> --raw <file> --nc <file>
+# or every flight in the project, a few at a time:
+#     python3 MTPbatch.py --config <proj.yml> --all --jobs 4
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import sys
+import logging
+import argparse
+from proc.batch import MTPbatch
+from proc.campaign import MTPcampaign
+from EOLpython.logger.messageHandler import Logger
+
+logger = Logger("EOLlogger")
+
+
+def parse_args():
+    """ Instantiate a command line argument parser """
+
+    # Define command line arguments which can be provided
+    parser = argparse.ArgumentParser(
+        description="Script to process MTP flights without the GUI")
+    parser.add_argument(
+        '--config', type=str, required=True,
+        help='File containing project-specific MTP configuration info.')
+    parser.add_argument(
+        '--fltno', type=str, default=None,
+        help='Flight to process, e.g. rf01. The RAW and NetCDF files are ' +
+        'read from the setup file for the flight in PRODdir, unless --raw ' +
+        'is given.')
+    parser.add_argument(
+        '--raw', type=str, default=None, help='RAW file to process')
+    parser.add_argument(
+        '--nc', type=str, default=None,
+        help='RAF Low-Rate NetCDF file that goes with the RAW file')
+    parser.add_argument(
+        '--icartt', type=str, default=None,
+        help='ICARTT file to write. Defaults to MP_<platform>_<date>_' +
+        '<revision>.ict in datadir.')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='Number of processes used to read the RAW file and do the ' +
+        'retrievals. Defaults to ingest_workers and retrieval_workers in ' +
+        'the config file.')
+    parser.add_argument(
+        '--all', action='store_true',
+        help='Process every flight with a setup file in PRODdir. Flights ' +
+        'done in a previous run are skipped, unless their RAW file changed.')
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='Number of flights to process at once with --all')
+    parser.add_argument(
+        '--manifest', type=str, default=None,
+        help='File the state of each flight is saved to with --all. ' +
+        'Defaults to MTPcampaign.json in datadir.')
+    parser.add_argument(
+        '--rerun', action='store_true',
+        help='With --all, process flights done in a previous run again')
+    parser.add_argument(
+        '--debug', dest='loglevel', action='store_const',
+        const=logging.DEBUG, default=logging.INFO,
+        help="Show debug log messages")
+    parser.add_argument(
+        '--logmod', type=str, default=None, help="Limit logging to " +
+        "given module")
+
+    # Parse the command line arguments
+    args = parser.parse_args()
+
+    if args.fltno is None and args.raw is None and not args.all:
+        parser.error("One of --fltno, --raw or --all is required")
+
+    return args
+
+
+def main():
+
+    # Process command line arguments.
+    args = parse_args()
+
+    # Configure logging. There is no GUI, so log with the plain logger,
+    # which never opens message boxes.
+    logger.initStream(sys.stdout, args.loglevel, args.logmod)
+
+    if args.all:
+        campaign = MTPcampaign(args.config, args.jobs, args.manifest)
+        status = campaign.run(args.rerun)
+
+        # Report the state of each flight
+        print(campaign.getReport())
+
+        sys.exit(0 if status else 1)
+
+    batch = MTPbatch(args.config, args.workers)
+
+    # Find the files to process
+    rawfile = args.raw
+    ncfile = args.nc
+    if args.fltno is not None:
+        batch.client.setFltno(args.fltno)
+        if rawfile is None:
+            try:
+                [rawfile, ncfile] = batch.getFlightFiles(args.fltno)
+            except FileNotFoundError as err:
+                logger.error(str(err))
+                sys.exit(1)
+
+    status = batch.run(rawfile, ncfile, args.icartt)
+
+    # Report how long each stage took
+    print(batch.getTimingReport())
+
+    sys.exit(0 if status else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -47,7 +47,7 @@ def main():
 
     # Instantiate the GUI
     viewer = MTPviewer(client, app, args)
-    viewer.loadJson(client.getMtpRealTimeFilename())
+    viewer.loadJson(client.getRestartFilename())
     viewer.show()
 
     # Run the application until the user closes it
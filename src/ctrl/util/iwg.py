@@ -101,7 +101,10 @@ class MTPiwg():
                 self.iwgrecord['asciiPacket'] = \
                     self.dataI.rstrip('\r')
 
-        self.scanIWGlist.append(copy.deepcopy(self.iwgrecord))
+        # Only the values change from packet to packet, so only save those.
+        self.scanIWGlist.append({'values': {
+            var: {'val': values['val']}
+            for var, values in self.iwgrecord['values'].items()}})
 
     def clearIWG(self):
         """ Clear the list of IWG records """
@@ -8,10 +8,23 @@
 import os
 import yaml
 from lib.rootdir import getrootdir
-from EOLpython.util.fileselector import FileSelector
-from EOLpython.Qlogger.messageHandler import QLogger
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
+
+# Keys that may be left out of the config file, and the value getVal returns
+# when they are.
+OPTIONAL_KEYS = {
+    # If no json_file defined, then write json_file to projdir
+    'json_file': '',
+    'filelist': None,  # If no filelist, all RCF files are used
+    'RCAvgWt_cache_size': None,  # Weighted RC sets cached per RCF. Default 0
+    'RCAvgWt_cache_tolerance': None,  # Weight step for sharing cached sets
+    'RCF_top_k': 0,  # Number of templates ranked per scan. 0 ranks them all
+    'ingest_workers': 1,  # Number of processes used to read a .RAW file
+    'retrieval_workers': 1,  # Number of processes used to do retrievals
+    'retrieval_cache_size': 0,  # MB of retrievals cached. Default 0 (off)
+}
 
 
 class config():
@@ -49,7 +62,9 @@ class config():
         logger.error("config file" + self.yamlfile + " doesn't " +
                      "exist. Click OK to select correct file.")
 
-        # Launch a file selector for user to select correct config file
+        # Launch a file selector for user to select correct config file.
+        # Imported here so the config can be read without a GUI.
+        from EOLpython.util.fileselector import FileSelector
         self.loader = FileSelector()
         self.loader.set_filename("loadConfig", getrootdir())
         self.yamlfile = os.path.join(getrootdir(), self.loader.get_file())
@@ -86,17 +101,12 @@ class config():
         if key in self.projConfig.keys():
             return self.projConfig[key]
         else:
-            # if no json_file defined, then write json_file to projdir
-            # If no filelist, all RCF files are used
-            if key != 'json_file' and key != 'filelist':
+            if key not in OPTIONAL_KEYS:
                 logger.error(key + " not defined in configfile " +
                              self.yamlfile)
                 exit(1)
 
-            if key == 'json_file':
-                return ''
-            else:
-                return None
+            return OPTIONAL_KEYS[key]
 
     def getInt(self, key):
         """ Read a param from the config file that should be an integer """
@@ -116,7 +126,12 @@ class config():
         newpath = self.prependDir(key, self.getProjDir())
         return newpath
 
-    def prependDir(self, key, projdir):
+    def prependDir(self, key, projdir, check=True):
+        """
+        Return the path for key, relative to projdir. If check is True and
+        the path doesn't exist, ask the user to fix the config file. Pass
+        check=False when there is no user to ask, e.g. in batch mode.
+        """
         val = self.getVal(key)
         # Split the path into components - OS-independent
         path_components = val.split('/')
@@ -128,7 +143,7 @@ class config():
         newpath = os.path.join(projdir, *path_components)
 
         # Check that new path exists. If not, warn user
-        if not os.path.exists(newpath):
+        if check and not os.path.exists(newpath):
             logger.error('Invalid path given in config file: ' +
                          newpath + " Edit config file " + self.yamlfile +
                          " then click OK to reload it")
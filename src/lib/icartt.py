@@ -19,9 +19,9 @@
 import os
 from datetime import datetime
 from lib.rootdir import getrootdir
-from EOLpython.Qlogger.messageHandler import QLogger
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
 
 
 class ICARTT():
@@ -370,25 +370,46 @@ class ICARTT():
     def saveData(self, filename):
         """ Loop through flightData and save to ICARTT file """
         fd = self.client.reader.flightData
+        times = self.client.reader.getTimeIndex()
 
+        records = []
         for index in range(len(fd)):
             if index < len(fd)-1:
-                endtime = fd[index+1]['Aline']['values']['TIME']['val']-1
+                # Scan ends the second before the next scan starts. Use the
+                # times from the index so the duration is right across
+                # midnight.
+                duration = int(times.getTime(index+1) -
+                               times.getTime(index)) - 1
             else:
                 # Assume 17 second scan for last scan
-                endtime = fd[index]['Aline']['values']['TIME']['val']+16
+                duration = 16
+            endtime = fd[index]['Aline']['values']['TIME']['val'] + duration
 
-            # Save a record to the ICARTT file
-            self.build_record(fd[index], endtime)
+            # Save a record to the ICARTT file. build_record() leaves
+            # self.data empty for a scan without a retrieval.
+            self.data = ""
+            self.build_record(fd[index], endtime, index)
+            records.append(self.data)
 
-        # Write record to output file
+        # Write records to output file
         with open(filename, 'a') as f:
-            f.write(self.data)
+            f.write("".join(records))
 
-    def build_record(self, rec, endtime):
+    def getAval(self, rec, var, index=None):
+        """
+        Return the value of an A line variable in rec as a float. If the index
+        of rec in flightData is given, the value is taken from the flight
+        table, where it was converted when the scan was archived.
+        """
+        if index is not None:
+            return self.client.reader.getColumn('Aline', var)[index]
+        return float(rec['Aline']['values'][var]['val'])
+
+    def build_record(self, rec, endtime, index=None):
         """
         A record consists of a single dependent unbounded line followed by NX
-        dependent bounded lines
+        dependent bounded lines. index is the index of rec in flightData, if
+        it is known.
         """
         # On Windows, sometimes there is an empty flightData rec at the end
         # of the array, which wreaks havoc in this routine. So check for it
@@ -411,14 +432,13 @@ class ICARTT():
         self.data += "%5d, " % endtime
 
         # barometric_altitude
-        self.data += "%5.3f, " % float(rec['Aline']['values']['SAPALT']['val'])
+        self.data += "%5.3f, " % self.getAval(rec, 'SAPALT', index)
 
         # platform_pitch
-        self.data += \
-            "%4.1f, " % float(rec['Aline']['values']['SAPITCH']['val'])
+        self.data += "%4.1f, " % self.getAval(rec, 'SAPITCH', index)
 
         # platform_roll
-        self.data += "%4.1f, " % float(rec['Aline']['values']['SAROLL']['val'])
+        self.data += "%4.1f, " % self.getAval(rec, 'SAROLL', index)
 
         self.data += "-999.9, "  # horizontal brightness temperature
         self.data += "-99.9, "   # tropopause_alt_1
@@ -427,12 +447,10 @@ class ICARTT():
         self.data += "-999.9, "  # tropopause_potential_temperature_2
 
         # latitude
-        self.data += \
-            "%7.3f, " % float(rec['Aline']['values']['SALAT']['val'])
+        self.data += "%7.3f, " % self.getAval(rec, 'SALAT', index)
 
         # longitude
-        self.data += \
-            "%8.3f, " % float(rec['Aline']['values']['SALON']['val'])
+        self.data += "%8.3f, " % self.getAval(rec, 'SALON', index)
 
         self.data += "-99.9, "    # air_temperature_lapse_rate
 
@@ -0,0 +1,42 @@
+###############################################################################
+# Logger for the modules that are shared by the GUIs and the command line
+# batch processor (MTPbatch.py).
+#
+# EOLpython's QLogger imports PyQt so that it can show errors in message
+# boxes. The batch processor has to run on machines without a display, so the
+# shared modules must not import it. MTPlogger waits until the first message
+# is logged and then uses QLogger if a GUI has loaded PyQt, or the plain
+# EOLpython Logger if not. Both log through the same python logger, so
+# handlers set up by the top-level program apply either way.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import sys
+
+# Modules whose presence means the program is running a GUI
+QT_MODULES = ['PyQt6', 'PyQt5']
+
+
+class MTPlogger():
+
+    def __init__(self, name):
+        self.name = name
+        self.logger = None
+
+    def getLogger(self):
+        """ Return the EOLpython logger, creating it on first use """
+        if self.logger is None:
+            if any(module in sys.modules for module in QT_MODULES):
+                from EOLpython.Qlogger.messageHandler import QLogger
+                self.logger = QLogger(self.name)
+            else:
+                from EOLpython.logger.messageHandler import Logger
+                self.logger = Logger(self.name)
+
+        return self.logger
+
+    def __getattr__(self, name):
+        """ Pass logging calls, e.g. logger.error(), on to the logger """
+        return getattr(self.getLogger(), name)
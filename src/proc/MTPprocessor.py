@@ -13,9 +13,12 @@ from lib.icartt import ICARTT
 from matplotlib.backends.backend_qt5agg import (
        NavigationToolbar2QT as NavigationToolbar)
 from util.readGVnc import readGVnc
+from util.raw_tail import RawTail
 from proc.file_struct import data_files
+from proc.ingest import ingestRawFile
+from proc.retrieve import retrieveFlight
 from proc.plotTimeSeries import TimeSeries
-from PyQT6.QtCore import Qt
+from PyQT6.QtCore import Qt, pyqtSignal
 from PyQT6.QtWidgets import QMainWindow, QGridLayout, QWidget, QAction, \
                             QListWidget, QLabel
 from PyQT6.QtGui import QFont
@@ -26,6 +29,10 @@ logger = QLogger("EOLlogger")
 
 class MTPprocessor(QMainWindow):
 
+    # Emitted with the number of scans done so far while doing the
+    # retrievals for a flight in worker processes
+    retrievalProgress = pyqtSignal(int)
+
     def __init__(self, viewer, client, parent=None):
         """
         Create a window to be the post-flight processing environment.
@@ -39,9 +46,11 @@ class MTPprocessor(QMainWindow):
         super().__init__(parent)
         self.filelist = []
         self.raw_data_file = None
+        self.rawTail = None  # Follows the raw data file as it is written
         self.quit = False  # Flag to tell this method to force quit
 
         self.initUI()
+        self.retrievalProgress.connect(self.showRetrievalProgress)
 
         # Initialize window pointers - allows more generic code
         self.ts = False
@@ -85,6 +94,14 @@ class MTPprocessor(QMainWindow):
         self.loadFlight.triggered.connect(self.flightSelectWindow)
         self.menubar.addAction(self.loadFlight)
 
+        # Add a menu option to read scans added to the raw data file since it
+        # was loaded, e.g. if it is still being written
+        self.readNew = QAction('ReadNewScans', self)
+        self.readNew.setToolTip('Read scans added to the raw data file ' +
+                                'since it was loaded')
+        self.readNew.triggered.connect(self.readNewScans)
+        self.menubar.addAction(self.readNew)
+
         # Add menu option to process loaded data
         self.procFlight = QAction('ProcessFlight', self)
         self.procFlight.setToolTip('Process loaded flight data')
@@ -146,6 +163,40 @@ class MTPprocessor(QMainWindow):
         # Clear all displayed data
         self.viewer.resetView()
 
+        # If new gain constants from a tbfit have been copied to the config
+        # file since the flight was loaded, recalibrate the flight with them
+        # rather than reading the RAW file again
+        self.client.updateCalibration()
+
+        if self.client.retrievalCache is not None:
+            self.client.retrievalCache.resetStats()
+
+        # The retrieval cache is only used when the flight is processed in
+        # chunks
+        if self.client._retrievalFlag and (
+                self.client.retrievalWorkers > 1 or
+                self.client.retrievalCache is not None):
+            self.processFlightParallel()
+        else:
+            self.processFlightSerial()
+
+        # Report how many scans didn't need to be retrieved again
+        self.client.reportRetrievalCache()
+
+        # Set display to first scan
+        self.viewer.displayScan(0)
+
+        # Reset the curtain plot with new data
+        self.viewer.curtain.initUI()    # Clear previous display data
+        self.viewer.curtain.initData()  # ...
+        self.viewer.calcCurtain()       # Re-generate display data
+        self.viewer.curtain.draw()      # Redraw plot
+
+        # Save processed data to json file
+        self.client.exportData()
+
+    def processFlightSerial(self):
+        """ Do the retrievals for the flight one scan at a time """
         for index in range(len(self.client.reader.flightData)):
             # Process any events generated by the GUI so it stays responsive
             # to the user.
@@ -163,6 +214,10 @@ class MTPprocessor(QMainWindow):
                 # flightData index being pointed at by rawscan.
                 self.client.createProfile()
 
+                # Save processed values to the flight store on disk
+                self.client.reader.updateStore(
+                    self.client.getFlightStoreFilename(), index)
+
                 self.viewer.viewScanIndex = index
                 # Update display plots so user knows code is working. This
                 # really slows down the code, so if choose not to use it...
@@ -175,27 +230,34 @@ class MTPprocessor(QMainWindow):
                 # warn user profile will not be generated.
                 self.viewer.reportFailedRetrieval(err, index)
 
-        # Set display to first scan
-        self.viewer.displayScan(0)
-
-        # Reset the curtain plot with new data
-        self.viewer.curtain.initUI()    # Clear previous display data
-        self.viewer.curtain.initData()  # ...
-        self.viewer.calcCurtain()       # Re-generate display data
-        self.viewer.curtain.draw()      # Redraw plot
-
-        # Save processed data to json file
-        self.client.reader.removeJSON(self.client.getMtpRealTimeFilename())
-        for index in range(len(self.client.reader.flightData)):
-            # set rawscan to current flightData index
-            self.client.reader.setRawscan(index)
-            self.client.reader.save(self.client.getMtpRealTimeFilename())
-            self.viewer.app.processEvents()
-            # If user clicks Quit in the main GUI window, we want to stop
-            # looping and exit the app. To do this, the Quit click sets
-            # self.quit to True, so check for that here.
+    def processFlightParallel(self):
+        """
+        Do the retrievals for the flight in chunks of scans, in parallel
+        worker processes if retrieval_workers is more than 1 (see
+        proc/retrieve.py)
+        """
+        def update(count):
+            # If user clicks Quit in the main GUI window, stop processing.
+            # The worker processes are stopped when the pool is closed.
             if self.quit:
                 exit()
+            self.retrievalProgress.emit(count)
+
+        failed = retrieveFlight(self.client, self.client.retrievalWorkers,
+                                update)
+        for [index, err] in failed:
+            # warn user profile will not be generated.
+            self.viewer.reportFailedRetrieval(err, index)
+
+    def showRetrievalProgress(self, count):
+        """ Show the index of the last scan retrieved """
+        if count > 0:
+            self.viewer.viewScanIndex = count - 1
+            self.viewer.index.setText(str(count - 1))
+
+        # Process any events generated by the GUI so it stays responsive
+        # to the user.
+        self.viewer.app.processEvents()
 
     def plotTimeseries(self):
         """ Add a timeseries plot window """
@@ -260,83 +322,34 @@ class MTPprocessor(QMainWindow):
         self.gvreader = readGVnc()
         self.gvreader.getNGvalues(selectedNCfile)
 
-        # Open the raw data file
-        self.raw_data_file = open(selectedRawFile, 'r')
+        # Follow the raw data file, so scans added to it later can be read
+        # without reading it again
+        self.rawTail = RawTail(selectedRawFile)
 
         # Have the flight selection box change somehow to show that the
         # user has sucessfully selected a flight
         # TBD**
 
         # Loop and read in all the raw data
-        haveData = True
         self.viewer.viewScanIndex = 0
-        while haveData:
-            # If user clicks Quit in the main GUI window, we want to stop
-            # looping and exit the app. To do this, the Quit click sets
-            # self.quit to True, so check for that here.
-            if self.quit:
-                exit()
-
-            # Read raw_data_file until get a single complete rawscan
-            # Returns False when reaches EOF
-            # Each record is saved to the flightData array
-            haveData = self.client.reader.readRawScan(self.raw_data_file)
-
-            if haveData is True:  # Found a complete raw scan
-                # Combine the separate lines from a raw scan into a UDP
-                # packet
-                packet = self.client.reader.getAsciiPacket()
-
-                # Parse the packet and store values in data dictionary
-                try:
-                    self.client.reader.parseAsciiPacket(packet)
-                except Exception:
-                    continue
-
-                # Perform calcs on the raw MTP data
-                self.client.processScan()
-                self.client.createRecord()
-
-                # Skip doing retrievals and speed up reading in raw data file.
-                # The idea then is to wait until after doing a tbfit to process
-                # the data. May change this later so leave code here for now
-                # so can uncomment later if change my mind.
-                # try:
-                #     self.client.createProfile()
-                # except Exception as err:
-                #     # retrieval failed
-                #     # warn user profile will not be generated.
-                #     self.viewer.reportFailedRetrieval(err)
-
-                # Save this record to the flight library and
-                # Append to JSON file on disk
-                self.client.saveData()
-
-                # Update the parent display
-                self.viewer.viewScanIndex = self.viewer.viewScanIndex + 1
-                # Run these two lines if not running plotData()
-                self.viewer.writeDate()
-                self.viewer.index.setText(str(self.viewer.viewScanIndex))
-                # For now, don't plot data because it slows down reading in
-                # raw data file. This is post-processing mode, so in theory
-                # Julie already saw all the scans during the flight. But
-                # confirm her preference. TBD**
-                # self.viewer.plotData()
-                # self.viewer.updateCurtainPlot() # Only works if profile
-                #                                 # created above
-
-                # Process any events generated by the GUI so it stays
-                # responsive to the user.
-                self.viewer.app.processEvents()
+        if self.client.ingestWorkers > 1:
+            self.readRawFileParallel(selectedRawFile)
+            # Skip the scans just read
+            self.rawTail.readNewData()
+        else:
+            self.readRawFile()
 
         # If viewScanIndex is still zero, there were no complete scans in the
         # raw data file.
         if self.viewer.viewScanIndex == 0:
             self.client.reader.reportScanStatus(selectedRawFile)
+        elif self.client.reader.incompleteScans > 0:
+            logger.warning("Skipped " +
+                           str(self.client.reader.incompleteScans) +
+                           " incomplete scans in " + selectedRawFile)
 
         # Set scan index to last scan in flightData
         self.viewer.setScanIndex()
-        self.closeRawFile()  # Done reading raw file, so close it
 
         # Now that selected file has been successfully loaded, replace the file
         # selection box with a timeseries plot widget
@@ -344,6 +357,107 @@ class MTPprocessor(QMainWindow):
         self.lbl.close()
         self.plotTimeseries()
 
+    def readNewScans(self):
+        """
+        Action to take when ReadNewScans button is clicked. Read, parse and
+        calibrate the scans added to the raw data file since it was loaded.
+        """
+        if self.rawTail is None:
+            logger.error("Please load a flight first")
+            return
+
+        self.viewer.viewScanIndex = len(self.client.reader.flightData)
+        self.readRawFile()
+
+        # Set scan index to last scan in flightData
+        self.viewer.setScanIndex()
+
+    def readRawFile(self):
+        """
+        Read, parse and calibrate the scans in the raw data file in order,
+        starting after the last scan read
+        """
+        # Read the raw data file one complete rawscan at a time
+        # Each record is saved to the flightData array
+        for rawscan in self.rawTail.readNewScans(self.client.reader):
+            # If user clicks Quit in the main GUI window, we want to stop
+            # looping and exit the app. To do this, the Quit click sets
+            # self.quit to True, so check for that here.
+            if self.quit:
+                exit()
+
+            # Combine the separate lines from a raw scan into a UDP
+            # packet
+            packet = self.client.reader.getAsciiPacket()
+
+            # Parse the packet and store values in data dictionary
+            try:
+                self.client.reader.parseAsciiPacket(packet)
+            except Exception:
+                continue
+
+            # Perform calcs on the raw MTP data
+            self.client.processScan()
+            self.client.createRecord()
+
+            # Skip doing retrievals and speed up reading in raw data file.
+            # The idea then is to wait until after doing a tbfit to process
+            # the data. May change this later so leave code here for now
+            # so can uncomment later if change my mind.
+            # try:
+            #     self.client.createProfile()
+            # except Exception as err:
+            #     # retrieval failed
+            #     # warn user profile will not be generated.
+            #     self.viewer.reportFailedRetrieval(err)
+
+            # Save this record to the flight library and
+            # Append to JSON file on disk
+            self.client.saveData()
+
+            # Update the parent display
+            self.viewer.viewScanIndex = self.viewer.viewScanIndex + 1
+            # Run these two lines if not running plotData()
+            self.viewer.writeDate()
+            self.viewer.index.setText(str(self.viewer.viewScanIndex))
+            # For now, don't plot data because it slows down reading in
+            # raw data file. This is post-processing mode, so in theory
+            # Julie already saw all the scans during the flight. But
+            # confirm her preference. TBD**
+            # self.viewer.plotData()
+            # self.viewer.updateCurtainPlot() # Only works if profile
+            #                                 # created above
+
+            # Process any events generated by the GUI so it stays
+            # responsive to the user.
+            self.viewer.app.processEvents()
+
+    def readRawFileParallel(self, selectedRawFile):
+        """
+        Read, parse and calibrate the scans in selectedRawFile in chunks, in
+        parallel worker processes (see proc/ingest.py)
+        """
+        def update(count):
+            # If user clicks Quit in the main GUI window, stop reading. The
+            # worker processes are stopped when the pool is closed.
+            if self.quit:
+                exit()
+
+            # Update the parent display with the date of the last scan read
+            self.viewer.viewScanIndex = count
+            if count > 0:
+                self.client.reader.setRawscan(count - 1)
+                self.viewer.writeDate()
+                self.client.reader.resetRawscan()
+            self.viewer.index.setText(str(self.viewer.viewScanIndex))
+
+            # Process any events generated by the GUI so it stays responsive
+            # to the user.
+            self.viewer.app.processEvents()
+
+        self.client.reader.incompleteScans = ingestRawFile(
+            self.client, selectedRawFile, self.client.ingestWorkers, update)
+
     def saveICARTT(self):
         """ Action to take when SaveICARTT button is clicked """
         filename = self.icartt.getICARTT()
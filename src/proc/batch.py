@@ -0,0 +1,223 @@
+###############################################################################
+# Routines to process a flight from the command line, without the GUI. This
+# does the same steps as the post-processor (proc/MTPprocessor.py):
+#   - read, parse and calibrate the scans in the .RAW file
+#   - read the RAF Low-Rate (LRT) NetCDF file
+#   - do the retrieval for each scan, which also finds the tropopause
+#   - export the flight to the JSON file and write the ICARTT file
+# and reports how long each step took. Nothing here imports PyQt or
+# matplotlib, so it can be run on a machine without a display.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import time
+from lib.config import config
+from lib.icartt import ICARTT
+from util.readGVnc import readGVnc
+from proc.ingest import ingestRawFile
+from proc.retrieve import retrieveFlight
+from viewer.MTPclient import MTPclient
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+
+def getFlightFiles(configfile, fltno):
+    """
+    Return the [rawfile, ncfile] listed for flight fltno in the production
+    setup file (setup_<fltno>.yml in PRODdir) of the project config
+    configfile
+    """
+    prod_dir = configfile.getPath('PRODdir')
+    setupfile = os.path.join(prod_dir, 'setup_' + fltno + '.yml')
+    if not os.path.isfile(setupfile):
+        raise FileNotFoundError("No setup file for flight " + fltno +
+                                " in " + prod_dir)
+
+    # Read flight setup from setup file, and prepend the project dir to
+    # the filenames. MTPbatch.run() checks that they exist.
+    setup = config(setupfile)
+    projdir = configfile.getProjDir()
+    return [setup.prependDir('raw_file', projdir, check=False),
+            setup.prependDir('nc_file', projdir, check=False)]
+
+
+class MTPbatch():
+
+    def __init__(self, configfile_name, workers=None):
+        """
+        configfile_name is the project config file. workers is the number of
+        processes used to read the .RAW file and do the retrievals, which
+        default to ingest_workers and retrieval_workers in the config file.
+        """
+        self.client = MTPclient()
+        self.client.configfile_name = configfile_name
+        self.client.readConfig(configfile_name)
+        if workers is not None:
+            self.client.ingestWorkers = workers
+            self.client.retrievalWorkers = workers
+
+        # Instantiate an IWG reader. Needs path to ascii_parms file.
+        self.client.initIWG()
+
+        # Instantiate an RCF retriever. Unlike the GUI, don't prompt for the
+        # RCF dir if it is missing. Just skip the retrievals.
+        if not os.path.isdir(self.client.RCFdir):
+            logger.error("RCF dir " + self.client.RCFdir + " doesn't exist." +
+                         " Retrievals will not be done.")
+            self.client._retrievalFlag = False
+        else:
+            try:
+                self.client.initRetriever()
+            except Exception as err:
+                logger.error("Could not read RCF files: " + str(err) +
+                             ". Retrievals will not be done.")
+                self.client._retrievalFlag = False
+
+        self.timing = []  # [stage, seconds] for each stage run
+
+    def getFlightFiles(self, fltno):
+        """
+        Return the [rawfile, ncfile] listed for flight fltno in the
+        production setup file (setup_<fltno>.yml in PRODdir)
+        """
+        return getFlightFiles(self.client.configfile, fltno)
+
+    def timeStage(self, stage, function, *args):
+        """ Run function(*args), and save how long it took """
+        start = time.perf_counter()
+        result = function(*args)
+        self.timing.append([stage, time.perf_counter() - start])
+        return result
+
+    def readRawFile(self, rawfile):
+        """
+        Read, parse and calibrate the scans in rawfile in order, and save
+        them to flightData and the flight store
+        """
+        if self.client.ingestWorkers > 1:
+            self.client.reader.incompleteScans = ingestRawFile(
+                self.client, rawfile, self.client.ingestWorkers)
+        else:
+            reader = self.client.reader
+            records = []
+            for rawscan in reader.iter_scans(rawfile):
+                # Combine the separate lines from a raw scan into a UDP packet
+                packet = reader.getAsciiPacket()
+
+                # Parse the packet and store values in data dictionary
+                try:
+                    reader.parseAsciiPacket(packet)
+                except Exception:
+                    continue
+
+                # Perform calcs on the raw MTP data
+                self.client.processScan()
+                self.client.createRecord()
+
+                records.append(reader.copyValues(reader.getRawscan()))
+
+            # Save the records to the flight library and the flight store
+            self.client.saveRecords(records)
+
+        if self.client.reader.incompleteScans > 0:
+            logger.warning("Skipped " +
+                           str(self.client.reader.incompleteScans) +
+                           " incomplete scans in " + rawfile)
+        logger.info("Read " + str(len(self.client.reader.flightData)) +
+                    " scans from " + rawfile)
+
+    def readNGfile(self, ncfile):
+        """ Read the RAF Low-Rate (LRT) NetCDF file """
+        self.gvreader = readGVnc()
+        self.gvreader.getNGvalues(ncfile)
+
+    def processFlight(self):
+        """
+        Do the retrieval, and find the tropopause, for each scan. Returns the
+        number of scans the retrieval failed for.
+        """
+        numscans = len(self.client.reader.flightData)
+        if self.client.retrievalCache is not None:
+            self.client.retrievalCache.resetStats()
+
+        def update(count):
+            logger.info("Processed " + str(count) + " of " + str(numscans) +
+                        " scans")
+
+        failed = retrieveFlight(self.client,
+                                max(1, self.client.retrievalWorkers), update)
+        for [index, err] in failed:
+            logger.debug("Could not perform retrieval on scan " +
+                         str(index + 1) + " -- " + err)
+        failed = len(failed)
+
+        # Report how many scans didn't need to be retrieved again
+        self.client.reportRetrievalCache()
+
+        if failed > 0:
+            logger.warning("Retrieval failed for " + str(failed) + " of " +
+                           str(numscans) + " scans")
+        return failed
+
+    def saveICARTT(self, filename=None):
+        """
+        Write the flight to an ICARTT file. filename defaults to the name
+        the post-processor uses. Returns the name of the file written, or
+        None.
+        """
+        icartt = ICARTT(self.client)
+        if filename is None:
+            filename = icartt.getICARTT()
+        if filename is None:
+            return None
+
+        if icartt.saveHeader(filename):  # Write header to output file
+            icartt.saveData(filename)    # Write data to output file
+            logger.info("Wrote " + filename)
+            return filename
+        return None
+
+    def run(self, rawfile, ncfile=None, icarttfile=None):
+        """
+        Process the flight in rawfile, and optional NetCDF file ncfile, and
+        write the JSON and ICARTT files
+        """
+        if not os.path.isfile(rawfile):
+            logger.error("RAW file " + rawfile + " doesn't exist")
+            return False
+
+        # Start from an empty flight, as the post-processor does
+        self.client.clearData()
+        self.timing = []
+
+        self.timeStage("Read RAW file", self.readRawFile, rawfile)
+        if len(self.client.reader.flightData) == 0:
+            logger.error("No complete scans found in " + rawfile)
+            return False
+
+        if ncfile is not None:
+            if os.path.isfile(ncfile):
+                self.timeStage("Read NetCDF file", self.readNGfile, ncfile)
+            else:
+                logger.warning("NetCDF file " + ncfile + " doesn't exist. " +
+                               "Skipping it.")
+
+        if self.client._retrievalFlag:
+            self.timeStage("Retrievals and tropopause", self.processFlight)
+
+        self.timeStage("Export JSON", self.client.exportData)
+        self.timeStage("Write ICARTT", self.saveICARTT, icarttfile)
+        return True
+
+    def getTimingReport(self):
+        """ Return a table of how long each stage took, and the total """
+        lines = []
+        for [stage, seconds] in self.timing:
+            lines.append("%-28s %10.3f s" % (stage, seconds))
+        total = sum(seconds for [stage, seconds] in self.timing)
+        lines.append("%-28s %10.3f s" % ("Total", total))
+        return "\n".join(lines)
@@ -0,0 +1,233 @@
+###############################################################################
+# Routines to process every flight in a project from the command line. The
+# flights are the ones the post-processor lists, i.e. those with a setup
+# file (setup_<fltno>.yml) in PRODdir. Each flight is processed by
+# proc/batch.py. With more than one job, each flight is processed in its own
+# worker process, a bounded number at a time.
+#
+# The flights with the largest .RAW files are started first, so that a long
+# flight doesn't start last and hold up the end of the run while the other
+# workers are idle.
+#
+# The state of each flight is saved to a JSON manifest as soon as it changes.
+# If a run is interrupted, the next run skips the flights that finished,
+# unless their .RAW file has changed since, and processes the rest.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import re
+import json
+import time
+import functools
+import multiprocessing
+from lib.config import config
+from proc.batch import MTPbatch, getFlightFiles
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+MANIFEST_VERSION = 1
+
+
+def processFlight(job, workers=None):
+    """
+    Process one flight. job is [configfile_name, fltno, rawfile, ncfile].
+    workers is the number of processes the flight is read and retrieved
+    with, which defaults to ingest_workers and retrieval_workers in the
+    config file. Returns a dictionary holding the flight number, its
+    new state ('done' or 'failed'), how long it took and how long each
+    stage took, and the error if it failed.
+    """
+    [configfile_name, fltno, rawfile, ncfile] = job
+    start = time.perf_counter()
+    result = {'fltno': fltno, 'status': 'failed', 'error': None,
+              'timing': []}
+    try:
+        batch = MTPbatch(configfile_name, workers)
+        batch.client.setFltno(fltno)
+        if batch.run(rawfile, ncfile):
+            result['status'] = 'done'
+        else:
+            result['error'] = "See log for details"
+        result['timing'] = batch.timing
+    except Exception as err:
+        result['error'] = str(err)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+class MTPcampaign():
+
+    def __init__(self, configfile_name, jobs=1, manifest=None):
+        """
+        configfile_name is the project config file. jobs is the number of
+        flights processed at once. manifest is the file the state of each
+        flight is saved to, which defaults to MTPcampaign.json in datadir.
+        """
+        self.configfile_name = configfile_name
+        self.jobs = jobs
+
+        # Only the file names are needed here. Each flight is read and
+        # processed by its own MTPbatch.
+        self.configfile = config(configfile_name)
+        self.prod_dir = self.configfile.getPath('PRODdir')
+        if manifest is None:
+            manifest = os.path.join(self.configfile.getPath('datadir'),
+                                    'MTPcampaign.json')
+        self.manifest = manifest
+
+        self.flights = {}  # State of each flight, saved to the manifest
+        self.readManifest()
+
+    def readManifest(self):
+        """ Read the state of each flight saved by a previous run """
+        if not os.path.isfile(self.manifest):
+            return
+        try:
+            with open(self.manifest, 'r') as f:
+                contents = json.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning("Could not read manifest " + self.manifest +
+                           ": " + str(err) + ". Processing all flights.")
+            return
+
+        if contents.get('version') != MANIFEST_VERSION:
+            logger.warning("Manifest " + self.manifest + " is from a " +
+                           "different version. Processing all flights.")
+            return
+        self.flights = contents['flights']
+
+    def writeManifest(self):
+        """
+        Save the state of each flight. Write to a temporary file and rename
+        it so that an interrupted write doesn't lose the previous state.
+        """
+        tmpfile = self.manifest + ".tmp"
+        with open(tmpfile, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION,
+                       'config': self.configfile_name,
+                       'flights': self.flights}, f, indent=2)
+        os.replace(tmpfile, self.manifest)
+
+    def getFlights(self):
+        """
+        Return [fltno, rawfile, ncfile] for each flight with a setup file in
+        PRODdir, in flight number order
+        """
+        flights = []
+        for setupfile in sorted(os.listdir(self.prod_dir)):
+            # Vet that this is a setup file, i.e. name starts with "setup_"
+            m = re.match("^setup_(.*)\\.yml$", setupfile)
+            if m:
+                fltno = m.group(1)
+                [rawfile, ncfile] = getFlightFiles(self.configfile, fltno)
+                flights.append([fltno, rawfile, ncfile])
+        return flights
+
+    def getRawStat(self, rawfile):
+        """ Return [size, mtime_ns] of a .RAW file """
+        stat = os.stat(rawfile)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def isDone(self, fltno, rawfile):
+        """
+        Return True if the flight finished in a previous run and its .RAW
+        file hasn't changed since
+        """
+        state = self.flights.get(fltno)
+        return (state is not None and state['status'] == 'done' and
+                state['rawFile'] == rawfile and
+                state['rawStat'] == self.getRawStat(rawfile))
+
+    def getJobs(self, rerun=False):
+        """
+        Return the jobs for processFlight() for the flights that still need
+        to be processed, largest .RAW file first. If rerun is True, flights
+        that finished in a previous run are processed again.
+        """
+        jobs = []
+        for [fltno, rawfile, ncfile] in self.getFlights():
+            if not os.path.isfile(rawfile):
+                logger.error("RAW file " + rawfile + " for flight " + fltno +
+                             " doesn't exist. Skipping it.")
+                self.flights[fltno] = {'status': 'failed',
+                                       'rawFile': rawfile,
+                                       'rawStat': None,
+                                       'error': "RAW file doesn't exist"}
+                continue
+            if not rerun and self.isDone(fltno, rawfile):
+                logger.info("Flight " + fltno + " was already processed. " +
+                            "Skipping it.")
+                continue
+            jobs.append([self.configfile_name, fltno, rawfile, ncfile])
+
+        jobs.sort(key=lambda job: os.path.getsize(job[2]), reverse=True)
+        return jobs
+
+    def saveResult(self, result):
+        """ Save the state of a flight after it has been processed """
+        fltno = result['fltno']
+        self.flights[fltno].update({
+            'status': result['status'],
+            'seconds': round(result['seconds'], 3),
+            'timing': [[stage, round(seconds, 3)]
+                       for [stage, seconds] in result['timing']],
+            'error': result['error']})
+        self.writeManifest()
+
+        if result['status'] == 'done':
+            logger.info("Flight " + fltno + " done in " +
+                        "%.1f" % result['seconds'] + " s")
+        else:
+            logger.error("Flight " + fltno + " failed: " +
+                         str(result['error']))
+
+    def run(self, rerun=False):
+        """
+        Process the flights that still need to be processed. Returns True if
+        every flight has been processed.
+        """
+        jobs = self.getJobs(rerun)
+
+        # Mark the flights as pending, so the manifest of an interrupted run
+        # shows which ones didn't finish. They are processed next time. Save
+        # the size and time of the .RAW file now, so a file that changes
+        # while it is processed is processed again next time.
+        for [configfile_name, fltno, rawfile, ncfile] in jobs:
+            self.flights[fltno] = {'status': 'pending', 'rawFile': rawfile,
+                                   'rawStat': self.getRawStat(rawfile)}
+        self.writeManifest()
+
+        logger.info("Processing " + str(len(jobs)) + " flights, " +
+                    str(min(self.jobs, max(len(jobs), 1))) + " at a time")
+        if self.jobs > 1 and len(jobs) > 1:
+            # Start a new process for each flight, so memory used by one
+            # flight is freed before the next one starts. imap_unordered
+            # starts the flights in the order of jobs and returns each
+            # result as soon as the flight is done. Each flight gets one
+            # process, since worker processes can't start pools of their
+            # own.
+            with multiprocessing.Pool(self.jobs, maxtasksperchild=1) as pool:
+                for result in pool.imap_unordered(
+                        functools.partial(processFlight, workers=1), jobs):
+                    self.saveResult(result)
+        else:
+            for job in jobs:
+                self.saveResult(processFlight(job))
+
+        return all(state['status'] == 'done'
+                   for state in self.flights.values())
+
+    def getReport(self):
+        """ Return a table of the state of each flight and how long it took """
+        lines = []
+        for fltno in sorted(self.flights):
+            state = self.flights[fltno]
+            seconds = state.get('seconds')
+            lines.append("%-10s %-8s %10s" % (
+                fltno, state['status'],
+                "" if seconds is None else "%.3f s" % seconds))
+        return "\n".join(lines)
@@ -0,0 +1,122 @@
+###############################################################################
+# Routines to read a .RAW file in parallel. The file is split into byte
+# ranges that each start with an A line, so no scan is split between two
+# ranges. Each range is parsed and calibrated (processScan() and
+# createRecord()) in a worker process, and the records are archived in the
+# order they are in the file.
+#
+# The worker functions are at module level so that they can be sent to the
+# worker processes.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import io
+import multiprocessing
+from viewer.MTPclient import MTPclient
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# Split the file into more chunks than workers, so that the workers finish
+# at about the same time and the caller hears back more often.
+CHUNKS_PER_WORKER = 4
+
+# The client each worker process uses to calibrate its scans
+_client = None
+
+
+def splitRawFile(filename, nchunks):
+    """
+    Split a .RAW file into at most nchunks byte ranges of about the same
+    size. Each range after the first starts at an A line. Returns a list of
+    [filename, start, end, firstline], where firstline is the line number of
+    the first line in the range.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    starts = [0]
+    for i in range(1, nchunks):
+        start = data.find(b'\nA ', len(data) * i // nchunks)
+        if start < 0:
+            break
+        if start + 1 > starts[-1]:
+            starts.append(start + 1)
+
+    chunks = []
+    firstline = 1
+    for start, end in zip(starts, starts[1:] + [len(data)]):
+        chunks.append([filename, start, end, firstline])
+        firstline += data.count(b'\n', start, end)
+    return chunks
+
+
+def initWorker(configfile_name):
+    """ Set up the client used to calibrate scans in a worker process """
+    global _client
+    _client = MTPclient()
+    _client.readConfig(configfile_name)
+
+    # Set up the IWG section of each scan from the ascii_parms file, as the
+    # client reading the file in order does
+    _client.initIWG()
+
+
+def ingestChunk(chunk):
+    """
+    Parse and calibrate the scans in one chunk from splitRawFile(). Returns
+    the list of records and the number of incomplete scans skipped.
+    """
+    [filename, start, end, firstline] = chunk
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        # Decode the same way as a file opened with open(filename, 'r')
+        raw_data_file = io.TextIOWrapper(io.BytesIO(f.read(end - start)))
+
+    reader = _client.reader
+    records = []
+    for rawscan in reader.iter_scans(raw_data_file, firstline):
+        # Combine the separate lines from a raw scan into a UDP packet
+        packet = reader.getAsciiPacket()
+
+        # Parse the packet and store values in data dictionary
+        try:
+            reader.parseAsciiPacket(packet)
+        except Exception:
+            continue
+
+        # Perform calcs on the raw MTP data
+        _client.processScan()
+        _client.createRecord()
+
+        records.append(reader.copyValues(reader.getRawscan()))
+
+    return [records, reader.incompleteScans]
+
+
+def ingestRawFile(client, filename, workers, callback=None):
+    """
+    Read, parse and calibrate the scans in a .RAW file using workers
+    processes, and save them to the client's flightData and flight store in
+    the order they are in the file. If callback is given, it is called with
+    the number of scans saved so far after each chunk is saved, e.g. to keep
+    a GUI responsive. Returns the number of incomplete scans skipped.
+    """
+    chunks = splitRawFile(filename, workers * CHUNKS_PER_WORKER)
+    logger.debug("Reading " + filename + " in " + str(len(chunks)) +
+                 " chunks using " + str(workers) + " processes")
+
+    incompleteScans = 0
+    configfile_name = client.configfile.yamlfile
+    with multiprocessing.Pool(workers, initializer=initWorker,
+                              initargs=(configfile_name,)) as pool:
+        # imap returns the results in the order of the chunks
+        for [records, skipped] in pool.imap(ingestChunk, chunks):
+            client.saveRecords(records)
+            incompleteScans += skipped
+            if callback is not None:
+                callback(len(client.reader.flightData))
+
+    return incompleteScans
@@ -5,6 +5,7 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import numpy
 import datetime
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
@@ -66,17 +67,18 @@ class TimeSeries():
             return
 
         # Find the date in the data (YYYYMMDD) and convert to base
-        # datetime object
-        startdate = self.client.reader.getVarArray('Aline', 'DATE')
-        base = []
-        for date in startdate:
-            base.append(datetime.datetime.strptime(date, "%Y%m%d"))
+        # datetime object. Scans from the same day share a base.
+        startdate = self.client.reader.getColumn('Aline', 'DATE')
+        bases = {}
+        for date in numpy.unique(startdate):
+            bases[date] = datetime.datetime.strptime(date, "%Y%m%d")
 
         # Convert seconds in file to numpy datetime object
-        x = self.client.reader.getVarArray('Aline', 'TIME')  # seconds
+        x = self.client.reader.getColumn('Aline', 'TIME')  # seconds
         dates = []
         for i in range(len(x)):
-            dates.append(base[i] + datetime.timedelta(seconds=x[i]))
+            dates.append(bases[startdate[i]] +
+                         datetime.timedelta(seconds=float(x[i])))
 
         # Format the ticks
         minutes = mdates.MinuteLocator(byminute=[0])  # every hour on the hour
@@ -85,20 +87,16 @@ class TimeSeries():
         self.ax.xaxis.set_major_formatter(minutes_fmt)
 
         # Read in the values in the E line by index (index 0 is Channel 1,
-        # ND on, etc) and plot
+        # ND on, etc) and plot. Each column of y is a view into the flight
+        # table, so no values are copied.
         # Eline SHOULD NOT BE HARDCODED - TBD**
-        y = self.client.reader.getVarArrayi('Eline', text, 0)  # Ch 1, ND on
-        self.plotDataXY(dates, y, 'red')
-        y = self.client.reader.getVarArrayi('Eline', text, 1)  # Ch 2, ND on
-        self.plotDataXY(dates, y, 'grey')
-        y = self.client.reader.getVarArrayi('Eline', text, 2)  # Ch 3, ND on
-        self.plotDataXY(dates, y, 'blue')
-        y = self.client.reader.getVarArrayi('Eline', text, 3)  # Ch 1, ND off
-        self.plotDataXY(dates, y, 'pink')
-        y = self.client.reader.getVarArrayi('Eline', text, 4)  # Ch 2, ND off
-        self.plotDataXY(dates, y, 'lightgrey')
-        y = self.client.reader.getVarArrayi('Eline', text, 5)  # Ch 3, ND off
-        self.plotDataXY(dates, y, 'lightblue')
+        y = self.client.reader.getColumn('Eline', text)
+        self.plotDataXY(dates, y[:, 0], 'red')        # Ch 1, ND on
+        self.plotDataXY(dates, y[:, 1], 'grey')       # Ch 2, ND on
+        self.plotDataXY(dates, y[:, 2], 'blue')       # Ch 3, ND on
+        self.plotDataXY(dates, y[:, 3], 'pink')       # Ch 1, ND off
+        self.plotDataXY(dates, y[:, 4], 'lightgrey')  # Ch 2, ND off
+        self.plotDataXY(dates, y[:, 5], 'lightblue')  # Ch 3, ND off
 
         # rotate labels
         for label in self.ax.get_xmajorticklabels():
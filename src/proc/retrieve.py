@@ -0,0 +1,242 @@
+###############################################################################
+# Routines to do the retrievals for a flight in batches of scans. The scans
+# in flightData are split into chunks of consecutive scans. The profiles of
+# all the scans in a chunk are retrieved at once with
+# Retriever.retrieve_batch(), and their tropopauses found at once with
+# TropopauseBatch. The best weighted RC set and the temperature profile (with
+# tropopauses) for each scan are saved to flightData and the flight store in
+# scan order.
+#
+# With more than one worker, the chunks are sent to worker processes. The
+# RCF templates are placed in shared memory, which each worker attaches to
+# instead of reading the RCF files, and only the brightness temperatures and
+# aircraft altitude of each scan are sent to the workers.
+#
+# The retrieval for each scan doesn't depend on any other scan, so the
+# results are the same as doing the retrievals one scan at a time with
+# MTPclient.createProfile(). Scans found in the retrieval cache (see
+# util/retrieval_cache.py) are not retrieved again.
+#
+# The worker functions are at module level so that they can be sent to the
+# worker processes.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import numpy
+import multiprocessing
+from util.rcf_stack import RetrievalCoefficientStack
+from util.retriever import Retriever
+from util.tropopause import TropopauseBatch
+from util.profile_structs import newATP
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# Split the flight into more chunks than workers, so that the workers finish
+# at about the same time and the caller hears back more often.
+CHUNKS_PER_WORKER = 4
+
+# The retriever each worker process uses, attached to the shared templates
+_retriever = None
+
+
+def splitScans(client, nchunks, indices=None):
+    """
+    Split the scans in the client's flightData into at most nchunks chunks
+    of consecutive scans. Each chunk is a list of [index, tbi, SAPALT] for
+    the scans in it. If indices is given, only those scans are included.
+    """
+    flightData = client.reader.flightData
+    if indices is None:
+        indices = range(len(flightData))
+    numscans = len(indices)
+    nchunks = max(1, min(nchunks, numscans))
+    chunks = []
+    for i in range(nchunks):
+        chunk = []
+        for index in indices[numscans * i // nchunks:
+                             numscans * (i + 1) // nchunks]:
+            rawscan = flightData[index]
+            chunk.append([index, rawscan['tbi'],
+                          rawscan['Aline']['values']['SAPALT']['val']])
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def getAltitude(sapalt):
+    """ Return the aircraft altitude in km, or NaN if it is missing """
+    try:
+        return float(sapalt)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def getIndex(value):
+    """ Return a level index from a float array as an int, or NaN """
+    if numpy.isnan(value):
+        return numpy.nan
+    return int(value)
+
+
+def retrieveScans(retriever, scans):
+    """
+    Do the retrievals for a list of [index, tbi, SAPALT] scans at once, and
+    find their tropopauses. Returns a list of [index, RCSetRef, ATP, error]
+    for the scans, where RCSetRef is the compact reference saved with the
+    scan (see RetrievalCoefficientFileSet.compactRCSet()), and error is None
+    unless the retrieval failed. ATP is made as MTPclient.getProfile() does.
+    As with createProfile(), nothing is saved to the scan if the retrieval
+    failed, so RCSetRef and ATP are None.
+    """
+    try:
+        ScanBTs = numpy.array([tbi for [index, tbi, sapalt] in scans],
+                              dtype=numpy.float64)
+        ACAltKm = [getAltitude(sapalt) for [index, tbi, sapalt] in scans]
+        Profiles = retriever.retrieve_batch(ScanBTs, ACAltKm)
+    except Exception as err:
+        # Do one scan at a time, so only the scans that can't be retrieved
+        # fail
+        if len(scans) > 1:
+            return [result for scan in scans
+                    for result in retrieveScans(retriever, [scan])]
+        return [[scans[0][0], None, None, str(err)]]
+
+    trop = TropopauseBatch(Profiles['Temperatures'],
+                           Profiles['Altitudes']).findTropopauses()
+
+    results = []
+    for n in range(len(scans)):
+        index = scans[n][0]
+        RCSetRef = Profiles['RCSetRefs'][n]
+        if RCSetRef is None:
+            results.append([index, None, None, "Aircraft altitude must " +
+                            "exist and be greater than zero to match " +
+                            "template to scan"])
+            continue
+
+        ATP = newATP()
+        ATP['Temperatures'] = Profiles['Temperatures'][n].tolist()
+        ATP['Altitudes'] = Profiles['Altitudes'][n].tolist()
+
+        # If all the temperatures are missing, leave all the derived params
+        # (and the tropopauses) missing
+        if not numpy.isnan(Profiles['Temperatures'][n]).all():
+            ATP['RCFIndex'] = RCSetRef['RCFIndex']
+            ATP['RCFALT1Index'] = getIndex(Profiles['RCFALT1Index'][n])
+            ATP['RCFALT2Index'] = getIndex(Profiles['RCFALT2Index'][n])
+            ATP['RCFMRIndex']['val'] = RCSetRef['SumLnProb']
+            for i in range(len(ATP['trop']['val'])):
+                ATP['trop']['val'][i]['idx'] = getIndex(trop['idx'][n, i])
+                ATP['trop']['val'][i]['altc'] = trop['altc'][n, i].item()
+                ATP['trop']['val'][i]['tempc'] = trop['tempc'][n, i].item()
+
+        results.append([index, RCSetRef, ATP, None])
+
+    return results
+
+
+def initWorker(shared, topK):
+    """
+    Set up the retriever used in a worker process. It attaches to the RCF
+    templates shared by retrieveFlight(), instead of reading the RCF files.
+    """
+    global _retriever
+    _retriever = Retriever.fromStack(RetrievalCoefficientStack.attach(shared))
+    _retriever.rcf_set.setTopK(topK)
+
+
+def retrieveChunk(chunk):
+    """ Do the retrievals for one chunk from splitScans() in a worker """
+    return retrieveScans(_retriever, chunk)
+
+
+def retrieveFlight(client, workers, callback=None):
+    """
+    Do the retrievals for all the scans in the client's flightData using
+    workers processes, and save the results to flightData and the flight
+    store. If callback is given, it is called with the number of scans done
+    so far after each chunk is saved, e.g. to update a GUI. Returns a list
+    of [index, error] for the scans the retrieval failed for.
+    """
+    reader = client.reader
+    storefile = client.getFlightStoreFilename()
+    failed = []
+    done = 0
+
+    def save(index, RCSetRef, ATP, error):
+        """ Save the results to the scan, as createProfile() does """
+        reader.setRawscan(index)
+        if RCSetRef is not None:
+            reader.saveBestWtdRCSet(RCSetRef)
+        if error is not None:
+            failed.append([index, error])
+            return
+        reader.saveATP(ATP)
+
+        # Save processed values to the flight store on disk
+        reader.updateStore(storefile, index)
+
+    # Use the saved results for the scans that were retrieved before
+    cache = client.retrievalCache
+    keys = {}
+    indices = None
+    if cache is not None:
+        indices = []
+        for index in range(len(reader.flightData)):
+            rawscan = reader.flightData[index]
+            key = cache.getKey(
+                rawscan['tbi'], rawscan['Aline']['values']['SAPALT']['val'])
+            cached = cache.get(key)
+            if cached is None:
+                keys[index] = key
+                indices.append(index)
+            else:
+                save(index, cached[0], cached[1], None)
+                done += 1
+        if done > 0 and callback is not None:
+            callback(done)
+
+    # The templates are shared with the workers, which needs them stacked.
+    # If they can't be, do the retrievals in this process.
+    retriever = client.retriever
+    if workers > 1 and not retriever.rcf_set.getStack().isStackable():
+        logger.debug("RCF templates can't be shared, so doing retrievals " +
+                     "in one process")
+        workers = 1
+
+    chunks = splitScans(client, workers * CHUNKS_PER_WORKER, indices)
+    logger.debug("Doing retrievals in " + str(len(chunks)) +
+                 " chunks using " + str(workers) + " processes")
+
+    def saveChunks(results):
+        """ Save the results of each chunk, and save them to the cache """
+        nonlocal done
+        for chunkResults in results:
+            for [index, RCSetRef, ATP, error] in chunkResults:
+                save(index, RCSetRef, ATP, error)
+                if error is None and index in keys:
+                    cache.put(keys[index], RCSetRef, ATP)
+
+            done += len(chunkResults)
+            if callback is not None:
+                callback(done)
+
+    if workers > 1:
+        stack = retriever.rcf_set.getStack()
+        shared = stack.share()
+        try:
+            with multiprocessing.Pool(
+                    workers, initializer=initWorker,
+                    initargs=(shared, retriever.rcf_set.getTopK())) as pool:
+                # imap returns the results in the order of the chunks
+                saveChunks(pool.imap(retrieveChunk, chunks))
+        finally:
+            stack.unlink()
+    else:
+        saveChunks(retrieveScans(retriever, chunk) for chunk in chunks)
+
+    reader.resetRawscan()
+    return failed
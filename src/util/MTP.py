@@ -258,3 +258,8 @@ MTPrecord = {
     'BestWtdRCSet': "",  # Will hold an RC_Set_4Retrieval dictionary
     'ATP': "",  # Will hold an AtmosphericTemperatureProfile dictionary
 }
+
+# The keys in a variable dictionary that hold a measured or calculated value.
+# All other keys (idx, name, fact, short_name, units, long_name, _FillValue)
+# and the line regular expressions are the same for every scan.
+VALUE_KEYS = ['val', 'tb', 'volts', 'temperature', 'resistance']
@@ -16,6 +16,9 @@ class BrightnessTemperature():
         The constants GOF and GEC don't change in real-time mode. To initialize
         a new project, copy the latest values from the previous project to this
         project's config file.
+
+        The config file is only read here, so build one instance for a config
+        file and use it for every scan.
         """
         # Number of channels
         self.channels = configfile.getInt('NUM_CHANNELS')
@@ -35,8 +38,32 @@ class BrightnessTemperature():
         self.tb = [None] * self.channels * self.angles
 
         # Gain Offset and per channel Gain Eqn Constants (slope and intercept)
-        self.GOF = float(configfile.getVal('GOF'))
-        self.GEC = configfile.getVal('GEC')
+        self.setGainConstants(configfile.getVal('GOF'),
+                              configfile.getVal('GEC'))
+
+    def setGainConstants(self, GOF, GEC):
+        """
+        Set the gain offset GOF and the per channel gain equation constants
+        GEC, e.g. to see how a different calibration changes the brightness
+        temperatures of a flight without changing the config file.
+        """
+        self.GOF = float(GOF)
+        self.GEC = GEC
+
+        # Per channel constants as arrays, for calculating all the channels
+        # at once
+        constants = numpy.array(
+            [[float(val) for val in GEC[i]] for i in range(self.channels)])
+        self._intercept = constants[:, 0]
+        self._slope = constants[:, 1]
+
+    def hasGainConstants(self, GOF, GEC):
+        """ Return True if GOF and GEC are the gain constants being used """
+        constants = numpy.array(
+            [[float(val) for val in GEC[i]] for i in range(self.channels)])
+        return float(GOF) == self.GOF and \
+            numpy.array_equal(constants[:, 0], self._intercept) and \
+            numpy.array_equal(constants[:, 1], self._slope)
 
 #   def calcTB(self):
 #       """
@@ -83,18 +110,64 @@ class BrightnessTemperature():
         This routine combines the routines TBcalculation(), GainCalculation()
         and GainGE() from the real-time MTPbin code:
         MTP-VB6/MTP_realtime/VB6/VBP/Main/MOAP/MTPbin.frm
+
+        This is calculate() for a single scan, so it gives the same results
+        as TB_batch(). Returns a new list of brightness temperatures each time
+        it is called, so the results of earlier scans are kept.
         """
-        for i in range(0, self.channels):
-            self.Geqn[i] = float(self.GEC[i][0]) + \
-                           (Tifa - self.GOF) * float(self.GEC[i][1])
-            # Mask out gains that are too big or too small
-            if (self.Geqn[i] < self.GeqnMin) or (self.Geqn[i] > self.GeqnMax):
-                self.Geqn[i] = numpy.nan
+        [Geqn, tb] = self.calculate([Tifa], [float(OAT)], [scnt])
+        self.Geqn = Geqn[0].tolist()
+        self.tb = tb[0].tolist()
+
+        return list(self.tb)
+
+    def TB_batch(self, Tifa, OAT, scnt):
+        """
+        Brightness Temperature Calculations for N scans at once, e.g. a whole
+        flight. Gives the same results as calling TBcalculationRT() on each
+        scan.
+
+        Tifa and OAT are arrays of the N mixer and outside air temperatures.
+        scnt is an (N, NUM_CHANNELS * NUM_SCAN_ANGLES) array of the scan
+        counts, ordered cnts[angle, channel] as in the B line.
+
+        Returns an array of brightness temperatures the same shape and order
+        as scnt.
+        """
+        return self.calculate(Tifa, OAT, scnt)[1]
+
+    def getGains(self, Tifa):
+        """
+        Return the gain of each channel for N mixer temperatures Tifa, as an
+        (N, NUM_CHANNELS) array. Gains that are too big or too small are NaN.
+        """
+        Tifa = numpy.asarray(Tifa, dtype=numpy.float64)
+        Geqn = self._intercept + \
+            (Tifa[:, numpy.newaxis] - self.GOF) * self._slope
+
+        # Mask out gains that are too big or too small
+        Geqn[(Geqn < self.GeqnMin) | (Geqn > self.GeqnMax)] = numpy.nan
+        return Geqn
+
+    def calculate(self, Tifa, OAT, scnt):
+        """
+        Return the [gains, brightness temperatures] for N scans, as arrays.
+        See getGains() and TB_batch().
+        """
+        OAT = numpy.asarray(OAT, dtype=numpy.float64)
+        scnt = numpy.asarray(scnt)
+        if scnt.dtype.kind not in 'iuf':
+            scnt = scnt.astype(numpy.int64)
+        N = len(OAT)
+
+        Geqn = self.getGains(Tifa)
 
-            CHor = int(scnt[i + self.LocHor*3])
+        # Counts[scan, angle, channel], and the counts of the horizontal scan
+        # for each scan and channel
+        C = scnt.reshape(N, self.angles, self.channels)
+        CHor = C[:, self.LocHor:self.LocHor + 1, :]
 
-            for j in range(0, 10):
-                C = int(scnt[i + j*3])  # MTP Scan Counts[Angle, Channel]
-                self.tb[i + j*3] = float(OAT) + (C - CHor) / self.Geqn[i]
+        tb = OAT[:, numpy.newaxis, numpy.newaxis] + \
+            (C - CHor) / Geqn[:, numpy.newaxis, :]
 
-        return self.tb
+        return [Geqn, tb.reshape(scnt.shape)]
@@ -30,11 +30,18 @@ class decodeM01():
 
         # Volts = constant * cnts/1000
         # Constants for each engineering value are hardcoded in MTP.py
+        # Counts converted to ints when the packet was parsed
+        counts = self.reader.getTypedValues('M01line')
+        if counts is not None:
+            counts = counts.tolist()
         for var in self.reader.getVarList('M01line'):
-            fact = self.reader.rawscan['M01line']['values'][var]['fact']
+            fact = self.reader.get_metadata('M01line', var, 'fact')
             val = self.reader.rawscan['M01line']['values'][var]['val']
             if val == '':  # Value missing from MTP UDP string
                 V = numpy.nan
+            elif counts is not None:
+                idx = int(self.reader.rawscan['M01line']['values'][var]['idx'])
+                V = self.math.calcV(counts[idx], fact)
             else:
                 V = self.math.calcV(int(val), fact)
 
@@ -28,8 +28,17 @@ class decodeM02():
 
     def calcVals(self):
 
+        # Counts converted to ints when the packet was parsed
+        counts = self.reader.getTypedValues('M02line')
+        if counts is not None:
+            counts = counts.tolist()
         for var in self.reader.getVarList('M02line'):
-            val = float(self.reader.rawscan['M02line']['values'][var]['val'])
+            if counts is not None:
+                idx = int(self.reader.rawscan['M02line']['values'][var]['idx'])
+                val = float(counts[idx])
+            else:
+                val = float(
+                    self.reader.rawscan['M02line']['values'][var]['val'])
             if val == '':  # Value missing from MTP UDP string
                 T = numpy.nan
             else:
@@ -26,6 +26,15 @@ class decodePt():
         self.reader = reader
         self.math = MTPmath()
 
+    def getCount(self, counts, value):
+        """
+        Get the count of a variable from the typed counts, or from its string
+        if the counts couldn't be converted when the packet was parsed.
+        """
+        if counts is None:
+            return int(value['val'])
+        return counts[int(value['idx'])]
+
     def calcTemp(self):
 
         # Set some defaults
@@ -33,9 +42,15 @@ class decodePt():
         R[0] = 350           # rref low
         R[7] = 600           # rref high
 
+        # Counts converted to ints when the packet was parsed
+        counts = self.reader.getTypedValues('Ptline')
+        if counts is not None:
+            counts = counts.tolist()
+        values = self.reader.rawscan['Ptline']['values']
+
         Ct = [numpy.nan] * 8  # Empty array to hold counts
-        Ct[0] = int(self.reader.getVar('Ptline', 'TR350CNTP'))  # low
-        Ct[7] = int(self.reader.getVar('Ptline', 'TR600CNTP'))  # hi
+        Ct[0] = self.getCount(counts, values['TR350CNTP'])  # low
+        Ct[7] = self.getCount(counts, values['TR600CNTP'])  # hi
 
         T = [numpy.nan] * 8  # Empty array to hold temperatures
 
@@ -51,7 +66,7 @@ class decodePt():
             #                  " Not sure why so this code doesn't do that." +
             #                  " Dismiss this warning to display this scan.")
 
-            Ctvar = int(self.reader.getVar('Ptline', var))
+            Ctvar = self.getCount(counts, values[var])
             T = self.math.calcPtT(Ct[0], Ctvar, Ct[7])
 
             self.reader.setCalcVal('Ptline', var, T, 'temperature')
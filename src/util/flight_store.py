@@ -0,0 +1,261 @@
+###############################################################################
+# This class stores the scans from a flight on disk so that a flight can be
+# reloaded if the viewer is restarted, and so that processed values can be
+# saved as they are calculated.
+#
+# The store is two files. The data file holds one record per scan, written
+# one after another. The index file (<data file>.idx) holds the offset and
+# size of each record in the data file as two little-endian uint64s, so
+# record i is found without reading the records before it.
+#
+# - Appending a scan writes its record to the end of the data file and its
+#   entry to the end of the index.
+# - Updating a scan (e.g. after a retrieval) overwrites its record in place
+#   if the new record fits, otherwise the new record is appended and the
+#   index entry is rewritten. Nothing else in the store is rewritten.
+#
+# A record is an 8-byte length, a JSON skeleton of the scan dictionary, then
+# a float64 array. Lists of floats in the scan (brightness temperatures,
+# profiles) are stored in the float64 array and referenced from the
+# skeleton as {"__array__": [start, count]}, so they are read without being
+# parsed from text.
+#
+# The store can be exported to the JSON lines format of .mtpRealTime.json.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import numpy
+import struct
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# Version of the flight store file layout. Bump this if the layout changes.
+FLIGHT_STORE_VERSION = 1
+FLIGHT_STORE_MAGIC = b'MTPstore'
+HEADER = struct.Struct('<8sI')   # Magic, version
+ENTRY = struct.Struct('<QQ')     # Record offset, record size
+LENGTH = struct.Struct('<Q')     # Length of record skeleton
+
+
+class FlightStore():
+
+    def __init__(self, filename):
+        """ filename is the full path to the store data file """
+        self._filename = filename
+        self._indexfile = filename + '.idx'
+
+    def getFileName(self):
+        """ Return the name of the store data file """
+        return self._filename
+
+    def exists(self):
+        """ Return True if the store files exist """
+        return (os.path.isfile(self._filename) and
+                os.path.isfile(self._indexfile))
+
+    def __len__(self):
+        """ Return the number of scans in the store """
+        if not self.exists():
+            return 0
+        return os.path.getsize(self._indexfile) // ENTRY.size
+
+    def create(self):
+        """ Create an empty store, replacing any existing store """
+        with open(self._filename, 'wb') as f:
+            f.write(HEADER.pack(FLIGHT_STORE_MAGIC, FLIGHT_STORE_VERSION))
+        with open(self._indexfile, 'wb'):
+            pass
+
+    def remove(self):
+        """ Delete the store files """
+        for filename in [self._filename, self._indexfile]:
+            try:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            except Exception as err:
+                logger.error("Failed to remove flight store file " +
+                             filename + ": " + str(err))
+
+    def append(self, scan):
+        """ Add a scan to the end of the store. Returns its index. """
+        return self.extend([scan]) - 1
+
+    def extend(self, scans):
+        """
+        Add a list of scans to the end of the store. Returns the number of
+        scans in the store.
+        """
+        if not self.exists():
+            self.create()
+        count = self._checkIndex()
+
+        entries = []
+        with open(self._filename, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            for scan in scans:
+                record = self.encode(scan)
+                f.write(record)
+                entries.append(ENTRY.pack(offset, len(record)))
+                offset += len(record)
+
+        # The index is written after the records so an entry never points
+        # past the end of the data file.
+        with open(self._indexfile, 'ab') as f:
+            f.write(b''.join(entries))
+
+        return count + len(scans)
+
+    def update(self, index, scan):
+        """ Replace the scan at index with a new version of the scan """
+        [offset, size] = self.getEntry(index)
+        record = self.encode(scan)
+
+        with open(self._filename, 'r+b') as f:
+            if len(record) > size:
+                # Doesn't fit, so write it to the end of the file. The old
+                # record is left in place but is no longer indexed.
+                offset = f.seek(0, os.SEEK_END)
+            else:
+                f.seek(offset)
+            f.write(record)
+
+        with open(self._indexfile, 'r+b') as f:
+            f.seek(index * ENTRY.size)
+            f.write(ENTRY.pack(offset, len(record)))
+
+    def getEntries(self):
+        """ Return the [offset, size] of the record for every scan """
+        entries = numpy.fromfile(self._indexfile, dtype='<u8')
+        return entries[:len(entries) - len(entries) % 2].reshape(-1, 2)
+
+    def getEntry(self, index):
+        """ Return the [offset, size] of the record for the scan at index """
+        if index < 0 or index >= len(self):
+            raise IndexError("Scan " + str(index) + " is not in flight " +
+                             "store " + self._filename)
+        with open(self._indexfile, 'rb') as f:
+            f.seek(index * ENTRY.size)
+            return list(ENTRY.unpack(f.read(ENTRY.size)))
+
+    def read(self, index):
+        """ Return the scan dictionary at index """
+        [offset, size] = self.getEntry(index)
+        return self.decode(self.readRecord(offset, size))
+
+    def readRecord(self, offset, size):
+        """ Return the record at offset in the data file """
+        with open(self._filename, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def readAll(self):
+        """ Return a list of all the scan dictionaries in the store """
+        return [self.decode(record) for record in self.readRecords()]
+
+    def readRecords(self):
+        """ Return a list of all the records in the store """
+        if not self.exists():
+            return []
+
+        with open(self._filename, 'rb') as f:
+            data = f.read()
+        [magic, version] = HEADER.unpack(data[0:HEADER.size])
+        if magic != FLIGHT_STORE_MAGIC or version != FLIGHT_STORE_VERSION:
+            raise ValueError(self._filename + " is not a version " +
+                             str(FLIGHT_STORE_VERSION) + " flight store")
+
+        return [data[offset:offset + size]
+                for [offset, size] in self.getEntries().tolist()]
+
+    def exportJSON(self, jsonfile):
+        """ Write the scans in the store to a JSON file, one scan per line """
+        with open(jsonfile, 'w') as f:
+            for scan in self.readAll():
+                json.dump(scan, f)
+                f.write('\n')
+
+    def encode(self, scan):
+        """ Convert a scan dictionary to a store record """
+        arrays = []
+        skeleton = json.dumps(self._pack(scan, arrays, [0])).encode()
+        if len(arrays) > 0:
+            floats = numpy.concatenate(arrays).astype('<f8').tobytes()
+        else:
+            floats = b''
+        return LENGTH.pack(len(skeleton)) + skeleton + floats
+
+    def decode(self, record):
+        """ Convert a store record back to a scan dictionary """
+        [skeleton, decoder] = self.getSkeleton(record)
+        return decoder.decode(skeleton)
+
+    def getSkeleton(self, record):
+        """
+        Return the JSON skeleton of a record, and a JSON decoder that puts
+        the lists of floats back when decoding all or part of it.
+        """
+        length = LENGTH.unpack(record[0:LENGTH.size])[0]
+        start = LENGTH.size + length
+        floats = numpy.frombuffer(record, dtype='<f8', offset=start)
+
+        def unpack(obj):
+            if len(obj) == 1 and '__array__' in obj:
+                [first, count] = obj['__array__']
+                return floats[first:first + count].tolist()
+            return obj
+
+        return [record[LENGTH.size:start].decode(),
+                json.JSONDecoder(object_hook=unpack)]
+
+    def _pack(self, obj, arrays, count):
+        """
+        Return obj with each list of floats replaced by a reference to the
+        float64 array. The lists are added to arrays, and count holds the
+        number of floats added so far.
+        """
+        if isinstance(obj, dict):
+            return {key: self._pack(val, arrays, count)
+                    for key, val in obj.items()}
+
+        if isinstance(obj, numpy.ndarray):
+            if obj.dtype.kind == 'f' and obj.ndim == 1:
+                return self._addArray(obj, arrays, count)
+            obj = obj.tolist()
+
+        if isinstance(obj, (list, tuple)):
+            # Only lists that are all floats are moved, so ints (e.g.
+            # indices) and strings (e.g. raw counts) keep their type.
+            if len(obj) > 0 and all(isinstance(val, float) for val in obj):
+                return self._addArray(obj, arrays, count)
+            return [self._pack(val, arrays, count) for val in obj]
+
+        if isinstance(obj, numpy.generic):
+            return obj.item()
+
+        return obj
+
+    def _addArray(self, values, arrays, count):
+        """ Add values to the float64 array and return a reference to it """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        arrays.append(values)
+        ref = {'__array__': [count[0], len(values)]}
+        count[0] += len(values)
+        return ref
+
+    def _checkIndex(self):
+        """
+        Drop a partial entry from the end of the index, e.g. if a write was
+        interrupted, and return the number of complete entries.
+        """
+        size = os.path.getsize(self._indexfile)
+        if size % ENTRY.size != 0:
+            logger.warning("Dropping partial entry from flight store index " +
+                           self._indexfile)
+            with open(self._indexfile, 'r+b') as f:
+                f.truncate(size - size % ENTRY.size)
+        return size // ENTRY.size
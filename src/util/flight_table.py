@@ -0,0 +1,167 @@
+###############################################################################
+# This class holds the values from every scan of a flight in columns, one
+# numpy array per variable, so that a timeseries of a variable can be
+# fetched without looping through the list of MTPrecord dictionaries.
+#
+# A column is named by the line type, variable, and key in the MTPrecord
+# dictionary, e.g. ('Aline', 'SAPALT', 'val') or ('Bline', 'SCNT', 'tb').
+# Lines that hold an array of values per scan (B, E) and the profile arrays
+# (tbi, ATP) are stored as 2-D columns with one row per scan.
+#
+# The columns are preallocated and doubled in size when they fill up, so
+# appending a scan is amortized O(1). getColumn() returns a view of the
+# filled rows, not a copy. A view is only valid until the next append that
+# grows the table.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import numpy
+from util.MTP import VALUE_KEYS
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# The lines from the raw data that are stored in the table
+LINETYPES = ['Aline', 'Bline', 'M01line', 'M02line', 'Ptline', 'Eline']
+
+# Columns that hold strings. Everything else is stored as float64.
+STRING_COLUMNS = {('Aline', 'DATE', 'val'): 'U8',
+                  ('Aline', 'timestr', 'val'): 'U8'}
+
+
+class FlightTable():
+
+    def __init__(self, capacity=1024):
+        self._capacity = capacity
+        self._n = 0           # Number of rows filled
+        self._columns = {}    # numpy array for each column, by column name
+
+    def __len__(self):
+        return self._n
+
+    def clear(self):
+        """ Remove all rows from the table """
+        self._n = 0
+        self._columns = {}
+
+    def append(self, rawscan):
+        """ Add the values from an MTPrecord dictionary as a new row """
+        if self._n == self._capacity:
+            self._grow(2 * self._capacity)
+        self._n += 1
+        self.update(self._n - 1, rawscan)
+
+    def extend(self, rawscans):
+        """ Add a row for each MTPrecord dictionary in a list """
+        needed = self._n + len(rawscans)
+        if needed > self._capacity:
+            self._grow(max(needed, 2 * self._capacity))
+        for rawscan in rawscans:
+            self.append(rawscan)
+
+    def update(self, index, rawscan):
+        """
+        Overwrite row index with the values from an MTPrecord dictionary,
+        e.g. after a retrieval has added a profile to the scan.
+        """
+        for name, value in self._rowValues(rawscan):
+            if name not in self._columns:
+                self._addColumn(name, value)
+            self._setValue(name, index, value)
+
+    def getColumn(self, linetype, var=None, key='val'):
+        """
+        Return a view of the values of a variable for every scan, or None if
+        no scan has a value for that variable.
+        """
+        column = self._columns.get((linetype, var, key))
+        if column is None:
+            return None
+        return column[:self._n]
+
+    def getColumnNames(self):
+        """ Return the names of the columns in the table """
+        return list(self._columns)
+
+    def _rowValues(self, rawscan):
+        """
+        Yield the column name and value of each value in a scan. The scan
+        can be part of an MTPrecord dictionary (see LazyFlightData), in which
+        case only the parts it has are yielded.
+        """
+        for linetype in LINETYPES:
+            if linetype not in rawscan:
+                continue
+            for var, values in rawscan[linetype]['values'].items():
+                for key in VALUE_KEYS:
+                    if key in values:
+                        yield (linetype, var, key), values[key]
+
+        # The profile values are empty strings until a retrieval is done
+        if len(rawscan.get('tbi', "")) > 0:
+            yield ('tbi', None, 'val'), rawscan['tbi']
+        if rawscan.get('ATP', "") != "":
+            ATP = rawscan['ATP']
+            yield ('ATP', 'Temperatures', 'val'), ATP['Temperatures']
+            yield ('ATP', 'Altitudes', 'val'), ATP['Altitudes']
+            yield ('ATP', 'RCFMRIndex', 'val'), ATP['RCFMRIndex']['val']
+            for key in ['idx', 'altc', 'tempc']:
+                yield ('ATP', 'trop', key), \
+                    [trop[key] for trop in ATP['trop']['val']]
+        if rawscan.get('BestWtdRCSet', "") != "":
+            yield ('BestWtdRCSet', 'SumLnProb', 'val'), \
+                rawscan['BestWtdRCSet']['SumLnProb']
+
+    def _addColumn(self, name, value):
+        """ Create an empty column shaped to hold value """
+        if name in STRING_COLUMNS:
+            column = numpy.full(self._capacity, '', STRING_COLUMNS[name])
+        elif numpy.ndim(value) == 0:
+            column = numpy.full(self._capacity, numpy.nan)
+        else:
+            column = numpy.full((self._capacity, len(value)), numpy.nan)
+        self._columns[name] = column
+
+    def _setValue(self, name, index, value):
+        """ Save value to row index of a column """
+        column = self._columns[name][:self._n]
+        if name in STRING_COLUMNS:
+            column[index] = str(value)
+            return
+
+        try:
+            value = numpy.asarray(value, dtype=numpy.float64)
+        except ValueError:
+            # Missing values are written to the raw data as blanks
+            column[index] = numpy.nan
+            return
+
+        if column.ndim == 1:
+            column[index] = value
+        else:
+            if len(value) > column.shape[1]:
+                self._widen(name, len(value))
+                column = self._columns[name][:self._n]
+            column[index] = numpy.nan
+            column[index, :len(value)] = value
+
+    def _grow(self, capacity):
+        """ Reallocate every column to hold capacity rows """
+        for name, column in self._columns.items():
+            fill = '' if name in STRING_COLUMNS else numpy.nan
+            grown = numpy.full((capacity,) + column.shape[1:], fill,
+                               column.dtype)
+            grown[:self._n] = column[:self._n]
+            self._columns[name] = grown
+        self._capacity = capacity
+
+    def _widen(self, name, width):
+        """ Reallocate a 2-D column to hold width values per row """
+        column = self._columns[name]
+        logger.debug("Widening column " + str(name) + " from " +
+                     str(column.shape[1]) + " to " + str(width) + " values")
+        widened = numpy.full((self._capacity, width), numpy.nan)
+        widened[:, :column.shape[1]] = column
+        self._columns[name] = widened
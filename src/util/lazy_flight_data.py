@@ -0,0 +1,179 @@
+###############################################################################
+# This class reads the scans of a flight from a .mtpRealTime.json file or a
+# flight store (see flight_store.py) only when they are needed, so that the
+# viewer can display a flight soon after it is restarted, however long the
+# flight is.
+#
+# When a file is opened it is read once, to find where each scan is in the
+# file and to decode the parts of each scan that the curtain and timeseries
+# plots need (the data lines, TBs, the profile and the MRI, but not the
+# rest of the BestWtdRCSet, which is most of each scan). A scan dictionary
+# is only decoded from the file when the scan is indexed, e.g. when the user
+# navigates to it with Back, Fwd or Go, and is kept once it has been.
+#
+# It can be used in place of the flightData list of scan dictionaries.
+# Scans appended after the file was opened are kept in memory.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import json
+from util.flight_store import FlightStore
+from util.flight_table import LINETYPES
+
+# The top-level parts of each scan that are decoded when the file is opened
+TABLE_KEYS = LINETYPES + ['tbi', 'ATP']
+
+
+class LazyFlightData():
+
+    def __init__(self, filename):
+        """ filename is a .mtpRealTime.json file or a flight store """
+        self._filename = filename
+        self._store = FlightStore(filename)
+        if not self._store.exists():
+            self._store = None
+
+        self._entries = []     # [offset, size] of each scan in the file
+        self._tableScans = []  # Parts of each scan used by the plots
+        self._scans = {}       # Scans that have been decoded, by index
+        self._appended = []    # Scans added since the file was read
+
+        self.readIndex()
+
+    def getFileName(self):
+        """ Return the name of the file the scans are read from """
+        return self._filename
+
+    def readIndex(self):
+        """
+        Read through the file once, saving the location of each scan and
+        decoding the parts of each scan used by the plots.
+        """
+        if self._store is not None:
+            records = self._store.readRecords()
+            self._entries = self._store.getEntries().tolist()
+            for record in records:
+                [skeleton, decoder] = self._store.getSkeleton(record)
+                self._tableScans.append(self.decodeParts(skeleton, decoder))
+        else:
+            decoder = json.JSONDecoder()
+            offset = 0
+            with open(self._filename, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        self._entries.append([offset, len(line)])
+                        self._tableScans.append(
+                            self.decodeParts(line.decode(), decoder))
+                    offset += len(line)
+
+    def decodeParts(self, text, decoder):
+        """
+        Decode just the parts of a JSON scan that are in TABLE_KEYS, and the
+        SumLnProb of the BestWtdRCSet. This relies on the keys being written
+        as '"key": ' by json.dump(). If they aren't found, decode it all.
+        """
+        parts = {}
+        for key in TABLE_KEYS:
+            pos = text.find('"' + key + '": ')
+            if pos < 0:
+                return self.selectParts(decoder.decode(text))
+            parts[key] = decoder.raw_decode(text, pos + len(key) + 4)[0]
+
+        # Only the SumLnProb of the BestWtdRCSet is needed, and the rest of
+        # it can be large.
+        pos = text.find('"BestWtdRCSet": ')
+        if pos < 0:
+            return self.selectParts(decoder.decode(text))
+        pos = pos + len('"BestWtdRCSet": ')
+        if text[pos] == '{':
+            pos = text.find('"SumLnProb": ', pos)
+            parts['BestWtdRCSet'] = {'SumLnProb': decoder.raw_decode(
+                text, pos + len('"SumLnProb": '))[0]}
+        else:
+            parts['BestWtdRCSet'] = ""
+
+        return parts
+
+    def selectParts(self, scan):
+        """ Return the parts of a decoded scan used by the plots """
+        parts = {key: scan[key] for key in TABLE_KEYS}
+        if scan['BestWtdRCSet'] != "":
+            parts['BestWtdRCSet'] = \
+                {'SumLnProb': scan['BestWtdRCSet']['SumLnProb']}
+        else:
+            parts['BestWtdRCSet'] = ""
+        return parts
+
+    def getTableScans(self):
+        """
+        Return a list holding, for each scan, the parts used by the plots, or
+        the whole scan if it was added after the file was read.
+        """
+        return self._tableScans + self._appended
+
+    def decodeScan(self, index):
+        """ Read and decode the scan at index from the file """
+        [offset, size] = self._entries[index]
+        if self._store is not None:
+            return self._store.decode(self._store.readRecord(offset, size))
+
+        with open(self._filename, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(size))
+
+    def decodeAll(self):
+        """ Decode every scan that hasn't been decoded yet """
+        for index in range(len(self._entries)):
+            self[index]
+
+    def __len__(self):
+        return len(self._entries) + len(self._appended)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = self._checkIndex(index)
+        if index >= len(self._entries):
+            return self._appended[index - len(self._entries)]
+
+        if index not in self._scans:
+            self._scans[index] = self.decodeScan(index)
+        return self._scans[index]
+
+    def __setitem__(self, index, scan):
+        index = self._checkIndex(index)
+        if index >= len(self._entries):
+            self._appended[index - len(self._entries)] = scan
+        else:
+            self._scans[index] = scan
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def append(self, scan):
+        """ Add a scan to the end of the flight """
+        self._appended.append(scan)
+
+    def extend(self, scans):
+        """ Add a list of scans to the end of the flight """
+        self._appended.extend(scans)
+
+    def clear(self):
+        """ Remove all scans, including those in the file """
+        self._entries = []
+        self._tableScans = []
+        self._scans = {}
+        self._appended = []
+
+    def _checkIndex(self, index):
+        """ Convert a negative index and check the index is in range """
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("list index out of range")
+        return index
@@ -35,3 +35,18 @@ AtmosphericTemperatureProfile = {
         'long_name': 'Tropopause',
         '_FillValue': "-99.9"},
 }
+
+
+def newATP():
+    """
+    Return a new, empty AtmosphericTemperatureProfile for one scan. The
+    metadata is shared with AtmosphericTemperatureProfile, but the values are
+    not, so the profile can be saved with a scan without copying it.
+    """
+    ATP = dict(AtmosphericTemperatureProfile)
+    ATP['Temperatures'] = []
+    ATP['Altitudes'] = []
+    ATP['RCFMRIndex'] = dict(AtmosphericTemperatureProfile['RCFMRIndex'])
+    ATP['trop'] = dict(AtmosphericTemperatureProfile['trop'],
+                       val=[dict(TropopauseRecord), dict(TropopauseRecord)])
+    return ATP
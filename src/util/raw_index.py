@@ -0,0 +1,255 @@
+###############################################################################
+# This class keeps an index of the scans in an MTP .RAW file in a sidecar
+# file (<raw file>.idx), so that a scan, or the scans in a time range, can be
+# read by seeking to them instead of reading the file from the start.
+#
+# The index file is a header holding the size and modification time of the
+# .RAW file it was built from, followed by one entry per scan:
+#     offset, size, time, complete
+# as a little-endian uint64, uint64, float64 and uint8. offset and size are
+# the byte range of the scan's lines in the .RAW file, time is the time of
+# its A line in seconds since midnight (NaN if it has no A line) and
+# complete is 1 if all its lines were found. Scans are split the same way
+# as readMTP.iter_scans() splits them, so scan i of the index is the i'th
+# scan iter_scans() yields. Incomplete scans are kept in the index, but are
+# not counted when scans are looked up by number.
+#
+# If the .RAW file has changed since the index was built (e.g. it is still
+# being written in real-time mode) the index is rebuilt when it is loaded.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import io
+import os
+import numpy
+import struct
+from util.readmtp import LINE_PATTERNS, LINE_PREFIXES
+from util.time_index import TimeIndex
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# Version of the index file layout. Bump this if the layout changes.
+RAW_INDEX_VERSION = 1
+RAW_INDEX_MAGIC = b'MTPrawix'
+HEADER = struct.Struct('<8sIQQ')  # Magic, version, RAW size, RAW mtime (ns)
+ENTRY = struct.Struct('<QQdB')    # Scan offset, size, time, complete
+ENTRY_DTYPE = numpy.dtype([('offset', '<u8'), ('size', '<u8'),
+                           ('time', '<f8'), ('complete', 'u1')])
+
+
+def findScans(raw_data_file, offset=0):
+    """
+    Find the scans in a .RAW file, splitting them the same way as
+    readMTP.iter_scans() does. raw_data_file is an open file, opened with
+    newline='' so line endings aren't translated, and offset is the byte
+    offset in the .RAW file of the first line in it.
+
+    Returns a list of (offset, size, time, complete) for each scan that has
+    ended, i.e. that has all its lines or that is followed by the A line of
+    the next scan, and the (offset, size, time, complete) of the scan at the
+    end of the file if it hasn't ended, else None.
+    """
+    entries = []
+    found = set()
+    start = offset
+    time = numpy.nan
+    for line in raw_data_file:
+        linestart = offset
+        offset += len(line.encode(raw_data_file.encoding))
+        if line.endswith('\r\n'):
+            line = line[:-2] + '\n'
+        elif line.endswith('\r'):
+            line = line[:-1] + '\n'
+
+        linetype = LINE_PREFIXES.get(line[:1])
+        if linetype is None:
+            linetype = LINE_PREFIXES.get(line[:3])
+        if linetype is None:
+            continue
+        m = LINE_PATTERNS[linetype].match(line)
+        if not m:
+            continue
+
+        # An A line starts a new scan
+        if linetype == 'Aline' and found:
+            entries.append((start, linestart - start, time, 0))
+            found.clear()
+
+        if not found:
+            start = linestart
+            time = numpy.nan
+        if linetype == 'Aline':
+            time = int(m.group(2)) * 3600 + int(m.group(3)) * 60 + \
+                int(m.group(4))
+
+        found.add(linetype)
+        if len(found) == len(LINE_PATTERNS):
+            entries.append((start, offset - start, time, 1))
+            found.clear()
+
+    if found:
+        return [entries, (start, offset - start, time, 0)]
+    return [entries, None]
+
+
+class RawIndex():
+
+    def __init__(self, rawfile, indexfile=None):
+        """
+        rawfile is the full path to the .RAW file. indexfile is the full path
+        to the index file, which defaults to <rawfile>.idx
+        """
+        self._rawfile = rawfile
+        self._indexfile = indexfile if indexfile is not None \
+            else rawfile + '.idx'
+        self._entries = None   # Index entries of all scans
+        self._complete = None  # Entry numbers of the complete scans
+        self.timeIndex = TimeIndex()  # Times of the complete scans
+
+    def __len__(self):
+        """ Return the number of complete scans in the .RAW file """
+        self.load()
+        return len(self._complete)
+
+    def getFileName(self):
+        """ Return the name of the index file """
+        return self._indexfile
+
+    def getRawStat(self):
+        """ Return the size and modification time of the .RAW file """
+        stat = os.stat(self._rawfile)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def isCurrent(self):
+        """ Return True if the index file matches the .RAW file """
+        try:
+            with open(self._indexfile, 'rb') as f:
+                header = f.read(HEADER.size)
+        except OSError:
+            return False
+        if len(header) != HEADER.size:
+            return False
+
+        [magic, version, size, mtime] = HEADER.unpack(header)
+        return (magic == RAW_INDEX_MAGIC and version == RAW_INDEX_VERSION and
+                [size, mtime] == self.getRawStat())
+
+    def build(self):
+        """
+        Find the scans in the .RAW file and write the index file. Returns the
+        entries, as a numpy array with fields offset, size, time and complete.
+        """
+        [size, mtime] = self.getRawStat()
+
+        # Read the lines the same way as a file opened with open(rawfile,
+        # 'r'), but without translating line endings so that the size of
+        # each line in bytes is known.
+        with open(self._rawfile, 'r', newline='') as f:
+            [entries, pending] = findScans(f)
+        if pending is not None:
+            entries.append(pending)
+
+        try:
+            with open(self._indexfile, 'wb') as f:
+                f.write(HEADER.pack(RAW_INDEX_MAGIC, RAW_INDEX_VERSION, size,
+                                    mtime))
+                f.write(b''.join(ENTRY.pack(*entry) for entry in entries))
+        except OSError as err:
+            # The index can still be used, it just has to be built again the
+            # next time.
+            logger.warning("Failed to write .RAW index file " +
+                           self._indexfile + ": " + str(err))
+
+        return numpy.array(entries, dtype=ENTRY_DTYPE)
+
+    def load(self):
+        """
+        Read the index file, building it first if it is missing or the .RAW
+        file has changed since it was built.
+        """
+        if self._entries is not None and self.isCurrent():
+            return
+
+        if self.isCurrent():
+            self._entries = numpy.fromfile(self._indexfile, dtype=ENTRY_DTYPE,
+                                           offset=HEADER.size)
+        else:
+            logger.debug("Building index of " + self._rawfile)
+            self._entries = self.build()
+
+        self._complete = numpy.flatnonzero(self._entries['complete'])
+        self.timeIndex = TimeIndex(
+            self._entries['time'][self._complete].tolist())
+
+    def getEntries(self):
+        """
+        Return the index entries of all scans, including incomplete ones, as
+        a numpy array with fields offset, size, time and complete.
+        """
+        self.load()
+        return self._entries
+
+    def getEntry(self, index):
+        """ Return the [offset, size, time] of complete scan number index """
+        self.load()
+        if index < 0 or index >= len(self._complete):
+            raise IndexError("Scan " + str(index) + " is not in " +
+                             self._rawfile)
+        entry = self._entries[self._complete[index]]
+        return [int(entry['offset']), int(entry['size']),
+                float(entry['time'])]
+
+    def readScans(self, reader, start, stop):
+        """
+        Generator that reads complete scans start to stop - 1 from the .RAW
+        file and yields each one. As in readMTP.iter_scans(), each scan is
+        stored in the reader's rawscan, and rawscan is yielded. The Ascii
+        packet of each scan is parsed, so the values are set. A scan whose
+        packet can't be parsed is reported and skipped.
+        """
+        self.load()
+        [start, stop, step] = slice(start, stop).indices(len(self._complete))
+        if start >= stop:
+            return
+
+        first = self._entries[self._complete[start]]
+        last = self._entries[self._complete[stop - 1]]
+        begin = int(first['offset'])
+        end = int(last['offset']) + int(last['size'])
+        with open(self._rawfile, 'rb') as f:
+            f.seek(begin)
+            # Decode the same way as a file opened with open(rawfile, 'r')
+            raw_data_file = io.TextIOWrapper(io.BytesIO(f.read(end - begin)))
+
+        for rawscan in reader.iter_scans(raw_data_file):
+            try:
+                reader.parseAsciiPacket(reader.getAsciiPacket())
+            except Exception as err:
+                logger.warning("Skipping scan at " +
+                               rawscan['Aline']['date'] + ": " + str(err))
+                continue
+            yield rawscan
+
+    def readScan(self, reader, index):
+        """
+        Read complete scan number index from the .RAW file into the reader's
+        rawscan and return rawscan. Returns None if the scan's packet can't
+        be parsed.
+        """
+        self.getEntry(index)  # Raises IndexError if index is out of range
+        for rawscan in self.readScans(reader, index, index + 1):
+            return rawscan
+        return None
+
+    def readTimeRange(self, reader, start, end):
+        """
+        Generator that reads the complete scans from time start to time end,
+        inclusive, in seconds since midnight, and yields each one as
+        readScans() does.
+        """
+        self.load()
+        scans = self.timeIndex.getRange(start, end)
+        yield from self.readScans(reader, scans.start, scans.stop)
@@ -0,0 +1,84 @@
+###############################################################################
+# This class follows an MTP .RAW file while it is being written (e.g. by
+# ctrl/mtp_client.py), and reads only the scans added since it last looked.
+#
+# It remembers the byte offset of the first line it hasn't read. Each time it
+# is asked for new scans it reads from that offset to the end of the file,
+# finds the scans that have ended (see raw_index.findScans()), and leaves the
+# scan still being written, and any partly written line, to be read next
+# time. So the work done for each scan doesn't grow as the file grows.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import io
+import os
+from util.raw_index import findScans
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+
+class RawTail():
+
+    def __init__(self, rawfile):
+        """ rawfile is the full path to the .RAW file to follow """
+        self._rawfile = rawfile
+        self.offset = 0   # Byte offset of the first line not read yet
+        self.linenum = 1  # Line number of the first line not read yet
+        self.incompleteScans = 0  # Number of incomplete scans skipped
+
+    def getFileName(self):
+        """ Return the name of the .RAW file being followed """
+        return self._rawfile
+
+    def readNewData(self):
+        """
+        Return the bytes of the scans that have ended since the last call,
+        and move the offset past them.
+        """
+        try:
+            if os.path.getsize(self._rawfile) < self.offset:
+                logger.warning(self._rawfile + " is shorter than when it " +
+                               "was last read. Reading it from the start.")
+                self.offset = 0
+                self.linenum = 1
+            with open(self._rawfile, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError as err:
+            logger.warning("Failed to read " + self._rawfile + ": " +
+                           str(err))
+            return b''
+
+        # Leave a line that is still being written for next time
+        data = data[0:data.rfind(b'\n') + 1]
+
+        # Leave the scan that is still being written for next time
+        raw_data_file = io.TextIOWrapper(io.BytesIO(data), newline='')
+        [entries, pending] = findScans(raw_data_file, self.offset)
+        if pending is not None:
+            data = data[0:pending[0] - self.offset]
+
+        self.offset += len(data)
+        self.linenum += data.count(b'\n')
+        return data
+
+    def readNewScans(self, reader):
+        """
+        Generator that reads the scans added to the .RAW file since the last
+        call and yields each complete scan. As in readMTP.iter_scans(), each
+        scan is stored in the reader's rawscan, and rawscan is yielded. The
+        scans are only read once, so the caller should process every scan
+        yielded.
+        """
+        firstline = self.linenum
+        data = self.readNewData()
+        if len(data) == 0:
+            return
+
+        # Decode the same way as a file opened with open(rawfile, 'r')
+        raw_data_file = io.TextIOWrapper(io.BytesIO(data))
+        yield from reader.iter_scans(raw_data_file, firstline)
+        self.incompleteScans += reader.incompleteScans
@@ -27,29 +27,69 @@
 ###############################################################################
 import os
 import copy
-import struct
+import numpy
+from collections import OrderedDict
 import inspect
 from util.rcf_structs import RCF_HDR, RCF_FL
-from EOLpython.Qlogger.messageHandler import QLogger
-
-logger = QLogger("EOLlogger")
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+
+def FlightLevelDtype(NUM_BRT_TEMPS, NUM_RETR_LVLS):
+    """
+    Return the numpy structured dtype that maps a single flight level record
+    of an RCF file. Values are stored as little-endian 4-byte floats. Src is
+    stored column major, i.e. [observable][retrieval level].
+    """
+    return numpy.dtype([
+        ('sBP', '<f4'),
+        ('sOBrms', '<f4', (NUM_BRT_TEMPS,)),
+        ('sOBav', '<f4', (NUM_BRT_TEMPS,)),
+        ('sBPrl', '<f4', (NUM_RETR_LVLS,)),
+        ('sRTav', '<f4', (NUM_RETR_LVLS,)),
+        ('sRMSa', '<f4', (NUM_RETR_LVLS,)),
+        ('sRMSe', '<f4', (NUM_RETR_LVLS,)),
+        ('Src', '<f4', (NUM_BRT_TEMPS, NUM_RETR_LVLS)),
+        ('Spare', '<f4', (67,)),
+        ])
 
 
 class RetrievalCoefficientFile():
 
-    def __init__(self, Filename):
-        """ Constructor """
+    def __init__(self, Filename, data=None):
+        """
+        Constructor
+
+        Filename is the full path to the RCF file.
+
+        data is an optional bytes object holding the contents of the RCF
+        file, e.g. from the RCF set cache. If given, the file is not read.
+        """
         self._RCFHdr = copy.deepcopy(RCF_HDR)
         self._RCFFileName = Filename
 
+        # LRU cache of weighted average RC sets returned by getRCAvgWt(),
+        # keyed by the bracketing flight levels and the (quantized) weight.
+        # Off unless turned on with setRCAvgWtCache().
+        self._RCAvgWtCache = OrderedDict()
+        self._RCAvgWtCacheSize = 0
+        self._RCAvgWtCacheTolerance = 0.0
+        self.clearRCAvgWtCache()
+
         # Extract the RCFId from the full file path.
         self._RCFId = os.path.splitext(os.path.basename(self._RCFFileName))[0]
 
-        # Open the RCF file
-        try:
-            self.openRCF()  # Open the RCF file
-        except Exception:
-            raise  # Pass error back up to calling function
+        # Open the RCF file and read the whole thing into memory in one go.
+        # The header and flight levels are then decoded from this buffer.
+        if data is None:
+            try:
+                self.openRCF()  # Open the RCF file
+                data = self.rcf.read()
+            except Exception:
+                raise  # Pass error back up to calling function
+            self.closeRCF()
+        self._buffer = data
 
         self.getRCF()  # Read in header
 
@@ -62,14 +102,15 @@ class RetrievalCoefficientFile():
         self.NUM_BRT_TEMPS = self._RCFHdr['Nlo'] * self._RCFHdr['Nel']
         self.NUM_RETR_LVLS = self._RCFHdr['Nret']
 
+        # Map all the flight levels onto numpy arrays
+        self.getFLArrays()
+
         # Read in each of the flight levels
         self._RCFFl = []  # Array of dictionaries to hold the flight levels
         for i in range(self._RCFHdr['NFL']):  # Number of Flight Levels
-            self._RCFFl.append(copy.deepcopy(RCF_FL))
+            self._RCFFl.append(copy.copy(RCF_FL))
             self.get_FL(i)
 
-        self.closeRCF()
-
     def openRCF(self):
         """ Open the RCF file as binary """
         try:
@@ -93,124 +134,100 @@ class RetrievalCoefficientFile():
         """ Return the number of retrieval levels from this RCF file """
         return self.NUM_RETR_LVLS
 
+    def _unpack(self, dtype, count=1):
+        """
+        Decode count values of type dtype from the file buffer at the current
+        offset and advance the offset. Returns a list of python values.
+        """
+        vals = numpy.frombuffer(self._buffer, dtype=dtype, count=count,
+                                offset=self._offset)
+        self._offset += vals.nbytes
+        return vals.tolist()
+
+    def _bytes(self, count):
+        """ Return count raw bytes from the file buffer and advance offset """
+        vals = self._buffer[self._offset:self._offset + count]
+        self._offset += count
+        return vals
+
     def getRCF(self):
         """
         Unpack the binary values into the RCF_HDR dictionary
-        A type of 'H' is unsigned short, 'f' is float
+        A type of '<u2' is unsigned short, '<f4' is float
         """
-        self._RCFHdr['RCformat'] = struct.unpack('H', self.rcf.read(2))[0]
+        self._offset = 0
+        self._RCFHdr['RCformat'] = self._unpack('<u2')[0]
         # Tom never figured out how to decode CreationDateTime. So read bytes
         # into struct and let them sit.
-        self._RCFHdr['CreationDateTime'] = self.rcf.read(8)
-        self._RCFHdr['RAOBfilename'] = self.rcf.read(80).decode()
-        self._RCFHdr['RCfilename'] = self.rcf.read(80).decode()
-        self._RCFHdr['RAOBcount'] = struct.unpack('H', self.rcf.read(2))[0]
-        self._RCFHdr['LR1'] = struct.unpack('f', self.rcf.read(4))[0]
-        self._RCFHdr['zLRb'] = struct.unpack('f', self.rcf.read(4))[0]
-        self._RCFHdr['LR2'] = struct.unpack('f', self.rcf.read(4))[0]
-        self._RCFHdr['RecordStep'] = struct.unpack('f', self.rcf.read(4))[0]
-        self._RCFHdr['RAOBmin'] = struct.unpack('f', self.rcf.read(4))[0]
-        self._RCFHdr['ExcessTamplitude'] = \
-            struct.unpack('f', self.rcf.read(4))[0]
+        self._RCFHdr['CreationDateTime'] = self._bytes(8)
+        self._RCFHdr['RAOBfilename'] = self._bytes(80).decode()
+        self._RCFHdr['RCfilename'] = self._bytes(80).decode()
+        self._RCFHdr['RAOBcount'] = self._unpack('<u2')[0]
+        [self._RCFHdr['LR1'], self._RCFHdr['zLRb'], self._RCFHdr['LR2'],
+         self._RCFHdr['RecordStep'], self._RCFHdr['RAOBmin'],
+         self._RCFHdr['ExcessTamplitude']] = self._unpack('<f4', 6)
         # Number of observables
-        self._RCFHdr['Nobs'] = struct.unpack('H', self.rcf.read(2))[0]
+        self._RCFHdr['Nobs'] = self._unpack('<u2')[0]
         # Number of retrieval levels (Nret)
-        self._RCFHdr['Nret'] = struct.unpack('H', self.rcf.read(2))[0]
+        self._RCFHdr['Nret'] = self._unpack('<u2')[0]
         # Array of retrieval offset levels wrt flight level
-        for i in range(self._RCFHdr['Nret']):
-            self._RCFHdr['dZ'].append(struct.unpack('f', self.rcf.read(4))[0])
+        self._RCFHdr['dZ'] = self._unpack('<f4', self._RCFHdr['Nret'])
         # Number of flight levels (NFL)
-        self._RCFHdr['NFL'] = struct.unpack('H', self.rcf.read(2))[0]
+        self._RCFHdr['NFL'] = self._unpack('<u2')[0]
         # Array of flight levels (Km)
-        for i in range(20):
-            self._RCFHdr['Zr'].append(struct.unpack('f', self.rcf.read(4))[0])
+        self._RCFHdr['Zr'] = self._unpack('<f4', 20)
         # Number of LO channels
-        self._RCFHdr['Nlo'] = struct.unpack('H', self.rcf.read(2))[0]
+        self._RCFHdr['Nlo'] = self._unpack('<u2')[0]
         # LO frequencies (GHz)
-        for i in range(self._RCFHdr['Nlo']):
-            self._RCFHdr['LO'].append(struct.unpack('f', self.rcf.read(4))[0])
+        self._RCFHdr['LO'] = self._unpack('<f4', self._RCFHdr['Nlo'])
         # Scan mirror elevation angles
-        self._RCFHdr['Nel'] = struct.unpack('H', self.rcf.read(2))[0]
-        for i in range(self._RCFHdr['Nel']):
-            self._RCFHdr['El'].append(struct.unpack('f', self.rcf.read(4))[0])
+        self._RCFHdr['Nel'] = self._unpack('<u2')[0]
+        self._RCFHdr['El'] = self._unpack('<f4', self._RCFHdr['Nel'])
         # IF frequency offsets (GHz)
-        self._RCFHdr['Nif'] = struct.unpack('H', self.rcf.read(2))[0]
-        for i in range(48):
-            self._RCFHdr['IFoff'].append(struct.unpack('f',
-                                                       self.rcf.read(4))[0])
-        for i in range(48):
-            self._RCFHdr['IFwt'].append(struct.unpack('f',
-                                                      self.rcf.read(4))[0])
+        self._RCFHdr['Nif'] = self._unpack('<u2')[0]
+        self._RCFHdr['IFoff'] = self._unpack('<f4', 48)
+        self._RCFHdr['IFwt'] = self._unpack('<f4', 48)
         # Spare
-        self._RCFHdr['Spare'] = struct.unpack('f'*130, self.rcf.read(4*130))
-        self._RCFHdr['SURC'] = self.rcf.read(4).decode()
-        for i in range(3):
-            self._RCFHdr['CHnLSBloss'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-        self._RCFHdr['RAOBbias'] = struct.unpack('f', self.rcf.read(4))[0]
-        self._RCFHdr['CH1LSBloss'] = struct.unpack('f', self.rcf.read(4))[0]
-        for i in range(15*3*10):
-            self._RCFHdr['SmatrixN1'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-        for i in range(15*3*10):
-            self._RCFHdr['SmatrixN2'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
+        self._RCFHdr['Spare'] = tuple(self._unpack('<f4', 130))
+        self._RCFHdr['SURC'] = self._bytes(4).decode()
+        self._RCFHdr['CHnLSBloss'] = self._unpack('<f4', 3)
+        self._RCFHdr['RAOBbias'] = self._unpack('<f4')[0]
+        self._RCFHdr['CH1LSBloss'] = self._unpack('<f4')[0]
+        self._RCFHdr['SmatrixN1'] = self._unpack('<f4', 15*3*10)
+        self._RCFHdr['SmatrixN2'] = self._unpack('<f4', 15*3*10)
+
+    def getFLArrays(self):
+        """
+        Map every flight level in the file buffer onto a structured numpy
+        array in a single pass and store each field as an (NFL, ...) float64
+        array. Src is converted from column major storage so it is
+        [NFL][retrieval level][observable].
+        """
+        dtype = FlightLevelDtype(self.NUM_BRT_TEMPS, self.NUM_RETR_LVLS)
+        records = numpy.frombuffer(self._buffer, dtype=dtype,
+                                   count=self._RCFHdr['NFL'],
+                                   offset=self._offset)
+        self._offset += records.nbytes
+
+        self._FLArrays = {}
+        for name in dtype.names:
+            self._FLArrays[name] = records[name].astype(numpy.float64)
+        self._FLArrays['Src'] = numpy.ascontiguousarray(
+            self._FLArrays['Src'].transpose(0, 2, 1))
 
     def get_FL(self, lvl):
         """
         lvl is the index of the flight level
 
-        Because I am copying the dictionary from the previous flight level to
-        create this level, I need to clear it before appending new data.
+        Populate the flight level dictionary with views into the flight level
+        arrays. Src is flattened so element [i*NUM_BRT_TEMPS + j] holds
+        retrieval level i, observable j.
         """
-        self._RCFFl[lvl]['sBP'] = struct.unpack('f', self.rcf.read(4))[0]
-
-        self._RCFFl[lvl]['sOBrms'] = []
-        for i in range(self.NUM_BRT_TEMPS):
-            self._RCFFl[lvl]['sOBrms'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['sOBav'] = []
-        for i in range(self.NUM_BRT_TEMPS):
-            self._RCFFl[lvl]['sOBav'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['sBPrl'] = []
-        for i in range(self.NUM_RETR_LVLS):
-            self._RCFFl[lvl]['sBPrl'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['sRTav'] = []
-        for i in range(self.NUM_RETR_LVLS):
-            self._RCFFl[lvl]['sRTav'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['sRMSa'] = []
-        for i in range(self.NUM_RETR_LVLS):
-            self._RCFFl[lvl]['sRMSa'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['sRMSe'] = []
-        for i in range(self.NUM_RETR_LVLS):
-            self._RCFFl[lvl]['sRMSe'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['Src'] = []
-        for i in range(self.NUM_BRT_TEMPS * self.NUM_RETR_LVLS):
-            self._RCFFl[lvl]['Src'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        self._RCFFl[lvl]['Spare'] = []
-        for i in range(67):
-            self._RCFFl[lvl]['Spare'].append(
-                struct.unpack('f', self.rcf.read(4))[0])
-
-        # Convert Retrieval coefficients from column major storage
-        temp = self._RCFFl[lvl]['Src'].copy()
-        for j in range(self.NUM_BRT_TEMPS):
-            for i in range(self.NUM_RETR_LVLS):
-                self._RCFFl[lvl]['Src'][i*self.NUM_BRT_TEMPS + j] = \
-                    temp[j*self.NUM_RETR_LVLS + i]
+        self._RCFFl[lvl]['sBP'] = float(self._FLArrays['sBP'][lvl])
+        for name in ['sOBrms', 'sOBav', 'sBPrl', 'sRTav', 'sRMSa', 'sRMSe',
+                     'Spare']:
+            self._RCFFl[lvl][name] = self._FLArrays[name][lvl]
+        self._RCFFl[lvl]['Src'] = self._FLArrays['Src'][lvl].reshape(-1)
 
     def getId(self):
         """ Return a string containing the RCF ID """
@@ -220,6 +237,10 @@ class RetrievalCoefficientFile():
         """ Return a string containing the name of the RCF file """
         return self._RCFFileName
 
+    def getData(self):
+        """ Return the raw contents of the RCF file as bytes """
+        return self._buffer
+
     def getRCF_HDR(self):
         """
         When using getRCF_HDR, be advised that char arrays have no endstring!
@@ -229,70 +250,37 @@ class RetrievalCoefficientFile():
     def getFL_RC_Vec(self):
         return self._RCFFl
 
-    def getRCAvgWt(self, PAltKm):
+    def getFL_RC_Arrays(self):
         """
-        Get the weighted average Retrieval Coefficient Set
-        PAltKm  = pressure altitude in KM at which to weight the elements
-        of the set: the observables and rmms vectors as well as the retrieval
-        coefficient matrices from flight levels above and below PAltKm are
-        averaged with a weight factor based on nearness of PAltkm to the
-        pressure altitude of the flight level as described in the RCF header.
+        Return a dictionary of the flight level values as numpy arrays, e.g.
+        'sOBav' is (NFL, NUM_BRT_TEMPS) and 'Src' is (NFL, NUM_RETR_LVLS,
+        NUM_BRT_TEMPS). The flight level dictionaries returned by
+        getFL_RC_Vec() are views into these arrays.
         """
-        RcSetAvWt = copy.deepcopy(RCF_FL)
-        # print(RcSetAvWt['Src'])  # I want this to be empty at this point
+        return self._FLArrays
 
-        # First check to see if PAltKm is outside the range of Flight Level
-        # PAltKms
-        #  - if so then the weighted average observable will be the average
-        #    observable associated with the flight level whose PAltKm is
-        #    closest. Assumption is that the Flight Level Retrieval Coefficient
-        #    Set vector is stored in increasing Palt (decreasing aircraft
-        #    altitude). Zr contains the most common aircraft flight levels
+    def getFlightLevelBracket(self, PAltKm):
+        """
+        Find the two flight levels that are above and below PAltKm and the
+        weight to give the level below.
 
+        Returns [Top, Bot, BotWt] where Top and Bot are flight level indices.
+        If PAltKm is outside the range of flight levels, Top and Bot are both
+        the index of the closest flight level.
+        """
         # If aircraft level is above highest flight level
         if PAltKm >= self._RCFHdr['Zr'][0]:
-            RcSetAvWt['sBP'] = self._RCFFl[0]['sBP']
-            for j in range(self.NUM_RETR_LVLS):
-                RcSetAvWt['sBPrl'].append(self._RCFFl[0]['sBPrl'][j])
-                RcSetAvWt['sRTav'].append(self._RCFFl[0]['sRTav'][j])
-                RcSetAvWt['sRMSa'].append(self._RCFFl[0]['sRMSa'][j])
-                RcSetAvWt['sRMSe'].append(self._RCFFl[0]['sRMSe'][j])
-            for i in range(self.NUM_BRT_TEMPS):
-                RcSetAvWt['sOBav'].append(self._RCFFl[0]['sOBav'][i])
-                RcSetAvWt['sOBrms'].append(self._RCFFl[0]['sOBrms'][i])
-                for j in range(self.NUM_RETR_LVLS):
-                    RcSetAvWt['Src'].append(
-                        self._RCFFl[0]['Src'][j * self.NUM_BRT_TEMPS + i])
-            return RcSetAvWt
+            return [0, 0, 0.0]
 
         # If aircraft level is below lowest flight level
         if (PAltKm <= self._RCFHdr['Zr'][self._RCFHdr['NFL']-1]):
-            RcSetAvWt['sBP'] = self._RCFFl[self._RCFHdr['NFL']-1]['sBP']
-            for j in range(self.NUM_RETR_LVLS):
-                RcSetAvWt['sBPrl'].append(
-                    self._RCFFl[self._RCFHdr['NFL']-1]['sBPrl'][j])
-                RcSetAvWt['sRTav'].append(
-                    self._RCFFl[self._RCFHdr['NFL']-1]['sRTav'][j])
-                RcSetAvWt['sRMSa'].append(
-                    self._RCFFl[self._RCFHdr['NFL']-1]['sRMSa'][j])
-                RcSetAvWt['sRMSe'].append(
-                    self._RCFFl[self._RCFHdr['NFL']-1]['sRMSe'][j])
-            for i in range(self.NUM_BRT_TEMPS):
-                RcSetAvWt['sOBav'].append(
-                    self._RCFFl[self._RCFHdr['NFL']-1]['sOBav'][i])
-                RcSetAvWt['sOBrms'].append(
-                    self._RCFFl[self._RCFHdr['NFL']-1]['sOBrms'][i])
-                for j in range(self.NUM_RETR_LVLS):
-                    RcSetAvWt['Src'].append(
-                        self._RCFFl[self._RCFHdr['NFL']-1]['Src'][j * self.
-                                                                  NUM_BRT_TEMPS
-                                                                  + i])
-            return RcSetAvWt
+            return [self._RCFHdr['NFL']-1, self._RCFHdr['NFL']-1, 1.0]
 
         # Find two Flight Level Sets that are above and below the PAltKm
         # provided.  Calculate the weight for averaging and identify the RC
         # sets.
         BotWt = 0.0
+        Top = Bot = None
         i = 0
         for it in range(self._RCFHdr['NFL']):
             if (PAltKm <= self._RCFHdr['Zr'][i] and
@@ -300,38 +288,147 @@ class RetrievalCoefficientFile():
                 BotWt = 1.0 - ((PAltKm - self._RCFHdr['Zr'][i + 1]) /
                                (self._RCFHdr['Zr'][i] -
                                 self._RCFHdr['Zr'][i + 1]))
-                Topit = self._RCFFl[it]
-                Botit = self._RCFFl[it + 1]
+                Top = it
+                Bot = it + 1
             i += 1
+
+        if Top is None:
+            raise ValueError("Unable to find flight levels bracketing " +
+                             "PAltKm " + str(PAltKm) + " for RCFID: " +
+                             self.getId())
+
+        return [Top, Bot, BotWt]
+
+    def setRCAvgWtCache(self, maxsize=None, tolerance=None):
+        """
+        Configure the cache of weighted average RC sets used by getRCAvgWt()
+        Settings that are None are left unchanged. Defaults are 0 (no cache)
+        and 0.
+
+        maxsize is the number of sets to keep. The least recently used set is
+        dropped when the cache is full. Set to 0 to turn off the cache.
+
+        tolerance is the step the flight level weight is quantized to before
+        looking it up in the cache, e.g. a tolerance of 0.01 means altitudes
+        within 1% of the distance between two flight levels share a set.
+        The weight is a continuous function of altitude, so consecutive scans
+        only share a set if the tolerance is more than 0. The set is then
+        built for an altitude up to half a tolerance step (as a fraction of
+        the flight level spacing) from the aircraft's, so the retrieved
+        temperatures change slightly. A tolerance of 0 only reuses a set for
+        exactly the same weight, so the results are the same as with no
+        cache.
+        """
+        if maxsize is not None:
+            self._RCAvgWtCacheSize = int(maxsize)
+        if tolerance is not None:
+            self._RCAvgWtCacheTolerance = float(tolerance)
+        self.clearRCAvgWtCache()
+
+    def clearRCAvgWtCache(self):
+        """ Empty the RC set cache and reset the hit and miss counters """
+        self._RCAvgWtCache.clear()
+        self._RCAvgWtCacheHits = 0
+        self._RCAvgWtCacheMisses = 0
+
+    def getRCAvgWtCacheStats(self):
+        """
+        Return a dictionary of the RC set cache hits and misses, the number
+        of sets currently cached and the cache settings.
+        """
+        return {'hits': self._RCAvgWtCacheHits,
+                'misses': self._RCAvgWtCacheMisses,
+                'size': len(self._RCAvgWtCache),
+                'maxsize': self._RCAvgWtCacheSize,
+                'tolerance': self._RCAvgWtCacheTolerance}
+
+    def getRCAvgWt(self, PAltKm):
+        """
+        Get the weighted average Retrieval Coefficient Set
+        PAltKm  = pressure altitude in KM at which to weight the elements
+        of the set: the observables and rmms vectors as well as the retrieval
+        coefficient matrices from flight levels above and below PAltKm are
+        averaged with a weight factor based on nearness of PAltkm to the
+        pressure altitude of the flight level as described in the RCF header.
+
+        If the cache is on (see setRCAvgWtCache), the returned set may be
+        shared with other callers and should not be modified.
+        """
+        [Top, Bot, BotWt] = self.getRCAvgWtBracket(PAltKm)
+        if self._RCAvgWtCacheSize <= 0:
+            return self.getRCAvgWtSet(Top, Bot, BotWt)
+
+        key = (Top, Bot, BotWt)
+        if key in self._RCAvgWtCache:
+            self._RCAvgWtCacheHits += 1
+            self._RCAvgWtCache.move_to_end(key)
+            return self._RCAvgWtCache[key]
+
+        self._RCAvgWtCacheMisses += 1
+        RcSetAvWt = self.getRCAvgWtSet(Top, Bot, BotWt)
+        self._RCAvgWtCache[key] = RcSetAvWt
+        if len(self._RCAvgWtCache) > self._RCAvgWtCacheSize:
+            self._RCAvgWtCache.popitem(last=False)
+
+        return RcSetAvWt
+
+    def getRCAvgWtBracket(self, PAltKm):
+        """
+        Return the [Top, Bot, BotWt] flight levels and weight that
+        getRCAvgWt() uses to build the weighted average RC set for PAltKm.
+        When the cache is on and has a weight tolerance, BotWt is quantized
+        so nearby altitudes share a set.
+        """
+        [Top, Bot, BotWt] = self.getFlightLevelBracket(PAltKm)
+
+        tolerance = self._RCAvgWtCacheTolerance
+        if self._RCAvgWtCacheSize > 0 and tolerance > 0 and Top != Bot:
+            BotWt = min(max(round(BotWt / tolerance) * tolerance, 0.0), 1.0)
+
+        return [Top, Bot, BotWt]
+
+    def getRCAvgWtSet(self, Top, Bot, BotWt):
+        """
+        Build the weighted average Retrieval Coefficient Set from the flight
+        levels Top and Bot, as returned by getFlightLevelBracket().
+        """
+        # Every list in the set is replaced below except Spare
+        RcSetAvWt = dict(RCF_FL, Spare=[])
+        fl = self._FLArrays
+
+        # If PAltKm is outside the range of Flight Level PAltKms then the
+        # weighted average observable will be the average observable
+        # associated with the flight level whose PAltKm is closest.
+        # Assumption is that the Flight Level Retrieval Coefficient Set vector
+        # is stored in increasing Palt (decreasing aircraft altitude). Zr
+        # contains the most common aircraft flight levels
+        if Top == Bot:
+            RcSetAvWt['sBP'] = float(fl['sBP'][Top])
+            for name in ['sBPrl', 'sRTav', 'sRMSa', 'sRMSe', 'sOBav',
+                         'sOBrms']:
+                RcSetAvWt[name] = fl[name][Top].tolist()
+            # Historically this case has returned Src in column major order
+            # ([observable][retrieval level]) so keep doing that.
+            RcSetAvWt['Src'] = fl['Src'][Top].T.reshape(-1).tolist()
+            return RcSetAvWt
+
         TopWt = 1.0 - BotWt
 
-        # Save the indices of the flight level sets used in averages
-        RcSetAvWt['RCFALT1Index'] = it  # index of Topit
-        RcSetAvWt['RCFALT2Index'] = it + 1  # index of Botit
+        # Save the indices of the flight level sets used in averages. The
+        # VB6/C++ code saves the final value of the loop iterator, so this
+        # code does too.
+        RcSetAvWt['RCFALT1Index'] = self._RCFHdr['NFL'] - 1  # index of Topit
+        RcSetAvWt['RCFALT2Index'] = self._RCFHdr['NFL']  # index of Botit
 
         # Calculate the Weighted averages
-        RcSetAvWt['sBP'] = Botit['sBP'] * BotWt + Topit['sBP'] * TopWt
-        for j in range(self.NUM_RETR_LVLS):
-            RcSetAvWt['sBPrl'].append(
-                Botit['sBPrl'][j] * BotWt + Topit['sBPrl'][j] * TopWt)
-            RcSetAvWt['sRTav'].append(
-                Botit['sRTav'][j]*BotWt + Topit['sRTav'][j] * TopWt)
-            RcSetAvWt['sRMSa'].append(
-                Botit['sRMSa'][j]*BotWt + Topit['sRMSa'][j] * TopWt)
-            RcSetAvWt['sRMSe'].append(
-                Botit['sRMSe'][j]*BotWt + Topit['sRMSe'][j] * TopWt)
-
-        for i in range(self.NUM_BRT_TEMPS):
-            RcSetAvWt['sOBrms'].append(
-                Botit['sOBrms'][i] * BotWt + Topit['sOBrms'][i] * TopWt)
-            RcSetAvWt['sOBav'].append(
-                Botit['sOBav'][i] * BotWt + Topit['sOBav'][i] * TopWt)
-
-        for j in range(self.NUM_RETR_LVLS):
-            for i in range(self.NUM_BRT_TEMPS):
-                RcSetAvWt['Src'].append(
-                    Botit['Src'][j * self.NUM_BRT_TEMPS + i] * BotWt +
-                    Topit['Src'][j * self.NUM_BRT_TEMPS + i] * TopWt)
+        RcSetAvWt['sBP'] = float(fl['sBP'][Bot] * BotWt + fl['sBP'][Top] *
+                                 TopWt)
+        for name in ['sBPrl', 'sRTav', 'sRMSa', 'sRMSe', 'sOBrms', 'sOBav']:
+            RcSetAvWt[name] = \
+                (fl[name][Bot] * BotWt + fl[name][Top] * TopWt).tolist()
+
+        RcSetAvWt['Src'] = (fl['Src'][Bot] * BotWt +
+                            fl['Src'][Top] * TopWt).reshape(-1).tolist()
 
         return RcSetAvWt
 
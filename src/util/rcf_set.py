@@ -27,13 +27,21 @@
 ###############################################################################
 import os
 import re
+import json
 import math
+import mmap
+import struct
 import inspect
-from util.rcf_structs import RC_Set_4Retrieval
+from util.rcf_structs import RC_Set_4Retrieval, RC_Set_Ref
 from util.rcf import RetrievalCoefficientFile
-from EOLpython.Qlogger.messageHandler import QLogger
+from util.rcf_stack import RetrievalCoefficientStack
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
+
+# Version of the RCF set cache file layout. Bump this if the layout changes so
+# old cache files are rebuilt.
+RCF_CACHE_VERSION = 1
 
 
 class RetrievalCoefficientFileSet():
@@ -50,9 +58,122 @@ class RetrievalCoefficientFileSet():
         Directory.
         """
         self._RCFs = []  # Array of RCF files
+        self._stack = None  # Templates from all RCFs stacked into arrays
+        self._topK = None  # Number of templates to rank; None ranks them all
+
+    def getCacheFileName(self, Directory):
+        """
+        Return the name of the cache file for the RCF files in Directory. The
+        cache is stored next to the RC directory, e.g. the cache for
+        /path/to/RC is /path/to/RC.RCFcache
+        """
+        return os.path.normpath(Directory) + ".RCFcache"
+
+    def getCacheKey(self, Directory, filelist=None):
+        """
+        Build the key that identifies the RCF files in Directory. The key
+        changes if any RCF file is added, removed or modified, or if the
+        requested filelist changes.
+        """
+        files = []
+        for filename in os.listdir(Directory):
+            if (os.path.isfile(Directory + "/" + filename) and
+               filename.endswith(".RCF")):
+                stat = os.stat(Directory + "/" + filename)
+                files.append([filename, stat.st_size, stat.st_mtime_ns])
+        if filelist is not None:
+            filelist = list(filelist)
+        return json.dumps({'version': RCF_CACHE_VERSION, 'files': files,
+                           'filelist': filelist})
+
+    def readCache(self, Directory, key):
+        """
+        Read the contents of the RCF files in Directory from the cache file.
+
+        The cache file is a 8-byte header length, a JSON header containing
+        the cache key and the offset and size of each RCF file, followed by
+        the contents of the RCF files. The whole file is memory mapped.
+
+        Returns a dictionary of RCF file contents keyed by filename. If the
+        cache file does not exist or is out of date, returns an empty
+        dictionary.
+        """
+        cachefile = self.getCacheFileName(Directory)
+        if not os.path.isfile(cachefile):
+            return {}
+
+        rcfdata = {}
+        try:
+            with open(cachefile, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hdrlen = struct.unpack('<Q', mm[0:8])[0]
+                    header = json.loads(mm[8:8 + hdrlen].decode())
+                    if header['key'] != key:
+                        logger.debug("RCF cache " + cachefile + " is out " +
+                                     "of date. Rebuilding.")
+                        return {}
+                    start = 8 + hdrlen
+                    for [filename, offset, size] in header['files']:
+                        rcfdata[filename] = \
+                            mm[start + offset:start + offset + size]
+        except Exception as err:
+            logger.warning("Unable to read RCF cache " + cachefile + ". " +
+                           "Rebuilding. " + str(err))
+            return {}
+
+        logger.debug("Read RCF files from cache " + cachefile)
+        return rcfdata
+
+    def writeCache(self, Directory, key):
+        """
+        Write the contents of the RCF files in the set to the cache file.
+        The file is written to a temporary file and then moved into place so
+        a partially written cache is never read. Failure to write the cache
+        is not fatal.
+        """
+        cachefile = self.getCacheFileName(Directory)
+        files = []
+        offset = 0
+        for rcf in self._RCFs:
+            size = len(rcf.getData())
+            files.append([os.path.basename(rcf.getFileName()), offset, size])
+            offset += size
+        header = json.dumps({'key': key, 'files': files}).encode()
+
+        tmpfile = cachefile + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(tmpfile, "wb") as f:
+                f.write(struct.pack('<Q', len(header)))
+                f.write(header)
+                for rcf in self._RCFs:
+                    f.write(rcf.getData())
+            os.replace(tmpfile, cachefile)
+        except Exception as err:
+            logger.warning("Unable to write RCF cache " + cachefile + ". " +
+                           str(err))
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            return False
+
+        logger.debug("Wrote RCF cache " + cachefile)
+        return True
+
+    def getRCFs(self, Directory, filelist=None, cache=True):
+        """
+        Get a list of available RCF files in the Directory
+
+        If cache is True, the RCF files are loaded from the cache file next
+        to Directory if it is up to date, and the cache file is (re)written
+        if it is not.
+        """
+        self._stack = None  # Any existing stack is out of date
+
+        rcfdata = {}
+        if cache:
+            key = self.getCacheKey(Directory, filelist)
+            rcfdata = self.readCache(Directory, key)
+        cached = len(rcfdata) > 0
 
-    def getRCFs(self, Directory, filelist=None):
-        """ Get a list of available RCF files in the Directory """
         i = 0
         # Iterate over files in a directory
         for filename in os.listdir(Directory):
@@ -60,8 +181,13 @@ class RetrievalCoefficientFileSet():
             # Ignore directories and files that don't have .RCF extension
             if (os.path.isfile(Directory + "/" + filename) and
                filename.endswith(".RCF")):
+                if cached and filename not in rcfdata:
+                    # Cache only holds the files in filelist, so no need to
+                    # read the rest.
+                    continue
                 try:
-                    rcf = RetrievalCoefficientFile(Directory + "/" + filename)
+                    rcf = RetrievalCoefficientFile(Directory + "/" + filename,
+                                                   rcfdata.get(filename))
                 except Exception as err:
                     logger.error("Error opening RCF file. " +
                                  "Failure to make fileset", str(err))
@@ -91,6 +217,11 @@ class RetrievalCoefficientFileSet():
                     else:
                         self._RCFs.pop()
 
+        # Save the RCF files that made it into the set to the cache so next
+        # time they can be read in one go.
+        if cache and not cached and len(self._RCFs) > 0:
+            self.writeCache(Directory, key)
+
         # Test if RC dir is empty. If it is, raise exception which will cause
         # retrievals NOT to be performed, but will allow code to continue.
         if len(self._RCFs) == 0:
@@ -127,6 +258,55 @@ class RetrievalCoefficientFileSet():
                          str(len(self._RCFs)))
             raise Exception()
 
+    def getStack(self):
+        """
+        Return the templates from all the RCFs in the set stacked into
+        arrays. The stack is built the first time it is requested.
+        """
+        if self._stack is None:
+            self._stack = RetrievalCoefficientStack(self._RCFs)
+        return self._stack
+
+    def setStack(self, stack):
+        """
+        Use an existing stack of templates, e.g. one attached to shared
+        memory, instead of stacking the RCFs in this set.
+        """
+        self._stack = stack
+
+    def setRCAvgWtCache(self, maxsize=None, tolerance=None):
+        """
+        Configure the cache of weighted average RC sets for every RCF in the
+        set. See RetrievalCoefficientFile.setRCAvgWtCache()
+        """
+        for rcf in self._RCFs:
+            rcf.setRCAvgWtCache(maxsize, tolerance)
+
+    def getRCAvgWtCacheStats(self):
+        """
+        Return the RC set cache hits and misses summed over all the RCFs in
+        the set.
+        """
+        stats = {'hits': 0, 'misses': 0, 'size': 0}
+        for rcf in self._RCFs:
+            rcfstats = rcf.getRCAvgWtCacheStats()
+            for key in stats:
+                stats[key] += rcfstats[key]
+        return stats
+
+    def setTopK(self, k=None):
+        """
+        Set the number of templates getBestWeightedRCSet() ranks in RCFArray.
+        Only the best template is used for the retrieval and the next few for
+        diagnostics, so there is no need to rank a large set of templates.
+        None or 0 ranks every template.
+        """
+        self._topK = k if k else None
+
+    def getTopK(self):
+        """ Return the number of templates ranked, or None if all are """
+        return self._topK
+
     def getRCFVector(self):
         """ Return a list of available RCF files """
         return self._RCFs
@@ -171,7 +351,8 @@ class RetrievalCoefficientFileSet():
 
         return True
 
-    def getBestWeightedRCSet(self, ScanBrightnessTemps, PAltKm, BTBias):
+    def getBestWeightedRCSet(self, ScanBrightnessTemps, PAltKm, BTBias,
+                             k=None):
         """
         Get the Retrieval Coefficient Set from the "best" template
         weighted according to the flight level of the aircraft and given
@@ -189,83 +370,29 @@ class RetrievalCoefficientFileSet():
 
         BTBias is an Brightness Temperature Bias provided by the user
 
+        k is the number of templates to rank in RCFArray. If k is None, the
+        number set with setTopK() is used (by default, all the templates).
+
         Returns the weighted average set of Model Brightness Temperatures,
         RMS values, and Retrieval Coefficients from the template that best
         matches the input Scan Brightness Temperatures as observed from
         the input flight altitude.
         """
-
-        thisRCFIndex = 0  # Which RCF index are we looking at?
-
-        # Initialize an empty array that will hold
-        # RCF indexes and that index's corresponding lnP.
-        RCFIndex_lnP_Array = [[-1, 100000000000]
-                              for i in range(len(self._RCFs))]
-
-        # Step through the vector of Retrieval Coefficient files (aka
-        # templates) to obtain the best match for the scan at the input
-        # Altitude
-        for RCFit in self._RCFs:
-            SumWeightedAvg = 0  # Sum of weighted differences
-            SumSquares = 0      #
-            SumWeights = 0      # For RMS weighting
-            NumBTsIncl = 0      # Count of BTs included in Weighting
-
-            # Get the weighted RC set for this template
-            AvgWtSet = RCFit.getRCAvgWt(PAltKm)
-
-            # Compare the template Brightness Temperatures with the
-            # measured brightness temperatures to find the quality of match
-            # BTIndex is the index into Scan and Model BT arrays
-            for BTIndex in range(RCFit.getNUM_BRT_TEMPS()):
-                Weight = 1/AvgWtSet['sOBrms'][BTIndex]**2
-                SumWeights = SumWeights + Weight
-
-                # Measured BT - Model BT = BTBias
-                Diff = ScanBrightnessTemps[BTIndex]-AvgWtSet['sOBav'][BTIndex]
-
-                if (Weight > 0):
-                    NumBTsIncl += 1
-                    SumWeightedAvg = SumWeightedAvg + Weight * Diff
-                    SumSquares = SumSquares + Weight * (Diff**2)
-
-            # The weighted mean of this RCF's BTs
-            RCFBTWeightedMean = SumWeightedAvg / SumWeights
-
-            # Standard Deviation about weighted mean(?)
-            Numerator = SumSquares - (SumWeights * (RCFBTWeightedMean**2))
-            Denominator = (NumBTsIncl-1) * SumWeights / NumBTsIncl
-            if (Numerator/Denominator >= 0):
-                RCFBTStdDev = math.sqrt(Numerator / Denominator)
-            else:
-                RCFBTStdDev = RCFBTWeightedMean  # MJ "kludge"
-
-            # Calculate the Sum of the ln of probabilities (quality of match)
-            # for "this" RCF
-            thislnP = 8 * math.sqrt(RCFBTWeightedMean**2 + RCFBTStdDev**2) / \
-                RCFit.getNUM_BRT_TEMPS()
-
-            # If this is the first item:
-            if (RCFIndex_lnP_Array[0][0] == -1):
-                # Just make the first space the current values
-                RCFIndex_lnP_Array[0] = list([thisRCFIndex, thislnP])
-            # Otherwise, sort the current values into the correct spot
-            # (Method similar to bubble sort)
-            else:
-                temp = list([thisRCFIndex, thislnP])
-                # Every value is going to be inserted somewhere, so insert
-                # at the beginning and swap up until sorted
-                for j in range(len(RCFIndex_lnP_Array) - 1):
-                    if (temp[1] < RCFIndex_lnP_Array[j][1]):
-                        i = j
-                        while ((temp[1] < RCFIndex_lnP_Array[i][1])
-                                and (i < len(RCFIndex_lnP_Array) - 1)):
-                            temp2 = RCFIndex_lnP_Array[i]
-                            RCFIndex_lnP_Array[i] = temp
-                            temp = temp2
-                            i += 1
-                RCFIndex_lnP_Array[i] = temp
-            thisRCFIndex += 1
+        if k is None:
+            k = self._topK
+
+        # Score all the templates at once if they can be stacked, otherwise
+        # fall back to scoring one RCF at a time.
+        lnP = None
+        stack = self.getStack()
+        if stack.isStackable():
+            lnP = stack.getLnP(ScanBrightnessTemps, PAltKm)
+        if lnP is None:
+            RCFIndex_lnP_Array = self.getRCFIndex_lnP_Array(
+                ScanBrightnessTemps, PAltKm, k)
+        else:
+            RCFIndex_lnP_Array = [[int(index), lnP[index].item()]
+                                  for index in stack.rank(lnP, k)]
 
         # Access the values that are the best from the first
         # element in the array
@@ -284,5 +411,180 @@ class RetrievalCoefficientFileSet():
         RC4R['RCFId'] = self._RCFs[BestRCIndex].getId()
         RC4R['RCFIndex'] = BestRCIndex
         RC4R['FL_RCs'] = self._RCFs[BestRCIndex].getRCAvgWt(PAltKm)
+        RC4R['FL_Bracket'] = \
+            self._RCFs[BestRCIndex].getRCAvgWtBracket(PAltKm)
         RC4R['RCFArray'] = RCFIndex_lnP_Array
         return RC4R
+
+    def compactRCSet(self, BestWtdRCSet):
+        """
+        Return a compact reference to BestWtdRCSet that holds the RCF id and
+        index, the flight levels and weight used, and the SumLnProb ranking,
+        but not the weighted RC set (FL_RCs). Use expandRCSet() to rebuild
+        the full set.
+        """
+        RCSetRef = {}
+        for key in RC_Set_Ref:
+            RCSetRef[key] = BestWtdRCSet[key]
+        RCSetRef['FL_Bracket'] = list(BestWtdRCSet['FL_Bracket'])
+        RCSetRef['RCFArray'] = [list(entry) for entry in
+                                BestWtdRCSet['RCFArray']]
+        return RCSetRef
+
+    def expandRCSet(self, RCSetRef):
+        """
+        Rebuild the full RC set from a reference made by compactRCSet(), by
+        re-weighting the flight levels of the referenced RCF. Sets that
+        already hold FL_RCs (e.g. read from older JSON files) are returned
+        as is.
+
+        Raises ValueError if the referenced RCF is not in this set.
+        """
+        if 'FL_RCs' in RCSetRef:
+            return RCSetRef
+
+        # Find the RCF by index, or by id if the set has changed since the
+        # reference was made
+        index = RCSetRef['RCFIndex']
+        if not (0 <= index < len(self._RCFs) and
+                self._RCFs[index].getId() == RCSetRef['RCFId']):
+            index = self.getRCFIndex(RCSetRef['RCFId'])
+            if index is None:
+                raise ValueError("RCF " + RCSetRef['RCFId'] + " used for " +
+                                 "this scan is not in the RCF set")
+
+        [Top, Bot, BotWt] = RCSetRef['FL_Bracket']
+        BestWtdRCSet = dict(RCSetRef)
+        BestWtdRCSet['FL_RCs'] = self._RCFs[index].getRCAvgWtSet(Top, Bot,
+                                                                 BotWt)
+        return BestWtdRCSet
+
+    def getRCFIndex(self, RCFId):
+        """ Return the index of the RCF with id RCFId, or None if not found """
+        for index in range(len(self._RCFs)):
+            if self._RCFs[index].getId() == RCFId:
+                return index
+        return None
+
+    def getRCFRanking(self, ScanBrightnessTemps, PAltKm):
+        """
+        Rank every template against the Scan Brightness Temperatures, e.g.
+        for display when only the top few are kept in RCFArray.
+
+        Returns a list of [RCFId, lnP] sorted by increasing lnP.
+        """
+        BestWtdRCSet = self.getBestWeightedRCSet(ScanBrightnessTemps, PAltKm,
+                                                 0.0, len(self._RCFs))
+        return [list(entry) for entry in BestWtdRCSet['RCFArray']]
+
+    def getRCFIndex_lnP_Array(self, ScanBrightnessTemps, PAltKm, k=None):
+        """
+        Score the RCFs one at a time against the Scan Brightness
+        Temperatures. This is used when the RCF templates can't be stacked.
+
+        If k is given, only the k best RCFs are returned, and scoring of an
+        RCF stops as soon as it can't score better than the current k-th
+        best.
+
+        Returns a list of [RCFIndex, lnP] sorted by increasing lnP.
+        """
+        if k is None or k >= len(self._RCFs):
+            lnP = [self.getLnP(RCFit, ScanBrightnessTemps, PAltKm)
+                   for RCFit in self._RCFs]
+
+            # Sort by increasing lnP. Ties keep the order of the RCFs in the
+            # set.
+            return [[index, lnP[index]] for index in
+                    sorted(range(len(lnP)), key=lambda i: lnP[i])]
+
+        # Keep the k best RCFs seen so far, sorted by increasing lnP. An RCF
+        # that ties the k-th best comes later in the set, so ranks below it.
+        RCFIndex_lnP_Array = []
+        for index in range(len(self._RCFs)):
+            cutoff = None
+            if len(RCFIndex_lnP_Array) == k:
+                cutoff = RCFIndex_lnP_Array[-1][1]
+            thislnP = self.getLnP(self._RCFs[index], ScanBrightnessTemps,
+                                  PAltKm, cutoff)
+            if thislnP is None or (cutoff is not None and
+                                   not thislnP < cutoff):
+                continue
+
+            position = len(RCFIndex_lnP_Array)
+            while position > 0 and thislnP < RCFIndex_lnP_Array[position-1][1]:
+                position -= 1
+            RCFIndex_lnP_Array.insert(position, [index, thislnP])
+            del RCFIndex_lnP_Array[k:]
+
+        return RCFIndex_lnP_Array
+
+    def getLnP(self, RCFit, ScanBrightnessTemps, PAltKm, cutoff=None):
+        """
+        Calculate the Sum of the ln of probabilities (quality of match) of
+        the template RCFit against the Scan Brightness Temperatures.
+
+        If cutoff is given, stop and return None as soon as the lnP can be
+        shown to be no better (no less) than cutoff.
+        """
+        SumWeightedAvg = 0  # Sum of weighted differences
+        SumSquares = 0      #
+        SumWeights = 0      # For RMS weighting
+        NumBTsIncl = 0      # Count of BTs included in Weighting
+
+        # Get the weighted RC set for this template
+        AvgWtSet = RCFit.getRCAvgWt(PAltKm)
+        NUM_BRT_TEMPS = RCFit.getNUM_BRT_TEMPS()
+        Weights = [1/AvgWtSet['sOBrms'][BTIndex]**2
+                   for BTIndex in range(NUM_BRT_TEMPS)]
+
+        # lnP is at least 8 * sqrt(SumSquares / SumWeights) / NUM_BRT_TEMPS,
+        # because the weighted mean squared is no more than
+        # SumSquares / SumWeights. SumSquares only grows as BTs are added, so
+        # once this bound reaches the cutoff this template can't do better.
+        # The bound needs the total of the weights, and at least two BTs
+        # included (otherwise the lnP can't be calculated).
+        if cutoff is not None:
+            for Weight in Weights:
+                SumWeights = SumWeights + Weight
+            if sum(Weight > 0 for Weight in Weights) > 1 and SumWeights > 0:
+                # Scale the cutoff up a hair to allow for rounding error
+                cutoffSquares = (cutoff * NUM_BRT_TEMPS / 8)**2 * \
+                    SumWeights * (1 + 1e-9)
+            else:
+                cutoff = None
+            SumWeights = 0
+
+        # Compare the template Brightness Temperatures with the
+        # measured brightness temperatures to find the quality of match
+        # BTIndex is the index into Scan and Model BT arrays
+        for BTIndex in range(NUM_BRT_TEMPS):
+            Weight = Weights[BTIndex]
+            SumWeights = SumWeights + Weight
+
+            # Measured BT - Model BT = BTBias
+            Diff = ScanBrightnessTemps[BTIndex]-AvgWtSet['sOBav'][BTIndex]
+
+            if (Weight > 0):
+                NumBTsIncl += 1
+                SumWeightedAvg = SumWeightedAvg + Weight * Diff
+                SumSquares = SumSquares + Weight * (Diff**2)
+
+                if cutoff is not None and SumSquares >= cutoffSquares:
+                    return None
+
+        # The weighted mean of this RCF's BTs
+        RCFBTWeightedMean = SumWeightedAvg / SumWeights
+
+        # Standard Deviation about weighted mean(?)
+        Numerator = SumSquares - (SumWeights * (RCFBTWeightedMean**2))
+        Denominator = (NumBTsIncl-1) * SumWeights / NumBTsIncl
+        if (Numerator/Denominator >= 0):
+            RCFBTStdDev = math.sqrt(Numerator / Denominator)
+        else:
+            RCFBTStdDev = RCFBTWeightedMean  # MJ "kludge"
+
+        # Calculate the Sum of the ln of probabilities (quality of match)
+        # for "this" RCF
+        return 8 * math.sqrt(RCFBTWeightedMean**2 + RCFBTStdDev**2) / \
+            NUM_BRT_TEMPS
+
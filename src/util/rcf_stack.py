@@ -0,0 +1,408 @@
+###############################################################################
+# This class stacks the templates from a set of RCFs into numpy arrays so that
+# all the templates can be matched against a scan at once.
+#
+# The observables (sOBav) and their rms values (sOBrms) from every flight
+# level of every RCF are held in (nRCF, NFL, NUM_BRT_TEMPS) arrays. For a
+# given aircraft altitude every template is interpolated to that altitude in
+# one operation, every template is scored against the scan brightness
+# temperatures and the templates are ranked by score.
+#
+# The arithmetic is done in the same order as the scalar code in
+# RetrievalCoefficientFileSet so the scores are identical.
+#
+# The stacked arrays can be placed in shared memory with share(), and worker
+# processes can attach() to them by name instead of reading the RCF files.
+#
+# Written in Python 3
+#
+# Copyright University Corporation for Atmospheric Research 2024
+# VB6 and Algorithm Copyright MJ Mahoney, NASA Jet Propulsion Laboratory
+###############################################################################
+import numpy
+from multiprocessing import shared_memory
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# Arrays that are placed in shared memory by share()
+SHARED_ARRAYS = ['Zr', 'sOBav', 'sOBrms', 'sBPrl', 'sRTav', 'Src']
+
+
+def square(values):
+    """
+    Square each element of values the way python squares a float (x**2).
+
+    Python calls the C library pow(), which can be 1 ulp off from the
+    correctly rounded x*x that numpy gives. That can only happen when x*x is
+    close to halfway between two floats, so find those elements from the
+    rounding error of x*x and square just those with python. The rest are
+    the same either way.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    result = values * values
+
+    # Exact rounding error of x*x (Dekker's product)
+    with numpy.errstate(all='ignore'):
+        big = values * 134217729.0  # 2**27 + 1
+        hi = big - (big - values)
+        lo = values - hi
+        err = ((hi * hi - result) + 2 * hi * lo) + lo * lo
+        near_tie = numpy.abs(err) > 0.45 * numpy.spacing(numpy.abs(result))
+
+    if numpy.any(near_tie):
+        result[near_tie] = (values[near_tie].astype(object)**2) \
+            .astype(numpy.float64)
+    return result
+
+
+class RetrievalCoefficientStack():
+
+    def __init__(self, RCFs):
+        """
+        Stack the templates from a list of RetrievalCoefficientFile objects.
+
+        The templates can only be stacked if all the RCFs have the same
+        number of flight levels, brightness temperatures and retrieval
+        levels. If they don't, isStackable() returns False and the caller
+        should fall back to matching the RCFs one at a time.
+        """
+        self._RCFs = RCFs
+        self._RCFIds = [rcf.getId() for rcf in RCFs]
+        self._RCFFileNames = [rcf.getFileName() for rcf in RCFs]
+        self.nRCF = len(RCFs)
+        self._stackable = False
+        self._shm = None  # Shared memory holding the arrays, if any
+
+        if len(RCFs) == 0:
+            return
+
+        hdr = RCFs[0].getRCF_HDR()
+        self.NFL = hdr['NFL']
+        self.NUM_BRT_TEMPS = RCFs[0].getNUM_BRT_TEMPS()
+        self.NUM_RETR_LVLS = RCFs[0].getNUM_RETR_LVLS()
+        for rcf in RCFs:
+            if (rcf.getRCF_HDR()['NFL'] != self.NFL or
+                    rcf.getNUM_BRT_TEMPS() != self.NUM_BRT_TEMPS or
+                    rcf.getNUM_RETR_LVLS() != self.NUM_RETR_LVLS):
+                logger.debug("RCFs have different dimensions. Templates " +
+                             "will be matched one RCF at a time.")
+                return
+
+        # Flight levels in km, padded with one extra level so the level below
+        # the last flight level can always be indexed.
+        Zr = numpy.array([rcf.getRCF_HDR()['Zr'] for rcf in RCFs],
+                         dtype=numpy.float64)
+        self.Zr = numpy.hstack([Zr, numpy.full((len(RCFs), 1), -numpy.inf)])
+
+        # (nRCF, NFL, NUM_BRT_TEMPS) arrays of the template observables
+        self.sOBav = numpy.stack([rcf.getFL_RC_Arrays()['sOBav']
+                                  for rcf in RCFs])
+        self.sOBrms = numpy.stack([rcf.getFL_RC_Arrays()['sOBrms']
+                                   for rcf in RCFs])
+
+        # (nRCF, NFL, NUM_RETR_LVLS) arrays of the pressures and average
+        # temperatures at the retrieval levels and (nRCF, NFL, NUM_RETR_LVLS,
+        # NUM_BRT_TEMPS) array of retrieval coefficients
+        self.sBPrl = numpy.stack([rcf.getFL_RC_Arrays()['sBPrl']
+                                  for rcf in RCFs])
+        self.sRTav = numpy.stack([rcf.getFL_RC_Arrays()['sRTav']
+                                  for rcf in RCFs])
+        self.Src = numpy.stack([rcf.getFL_RC_Arrays()['Src']
+                                for rcf in RCFs])
+
+        self._stackable = True
+
+    def getRCFVector(self):
+        """ Return the list of RCFs in the stack """
+        return self._RCFs
+
+    def getRCFIds(self):
+        """ Return the ids of the RCFs in the stack, in stack order """
+        return self._RCFIds
+
+    def getRCFFileNames(self):
+        """ Return the file names of the RCFs in the stack, in stack order """
+        return self._RCFFileNames
+
+    def isStackable(self):
+        """ Return True if the RCF templates could be stacked """
+        return self._stackable
+
+    def share(self):
+        """
+        Copy the stacked arrays into a new block of shared memory.
+
+        Returns a small dictionary describing the block that can be passed
+        to worker processes (e.g. as an argument of a multiprocessing Pool
+        initializer), which then call attach() with it. Workers should be
+        started with multiprocessing by this process so they share its
+        resource tracker. Call unlink() when the workers are done to free
+        the block.
+        """
+        if not self._stackable:
+            raise ValueError("RCF templates could not be stacked, so can't " +
+                             "be shared")
+
+        # Lay the arrays out one after the other, each aligned to 64 bytes
+        arrays = {}
+        size = 0
+        for name in SHARED_ARRAYS:
+            array = getattr(self, name)
+            arrays[name] = [size, array.shape, array.dtype.str]
+            size += -(-array.nbytes // 64) * 64
+
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        for name in SHARED_ARRAYS:
+            [offset, shape, dtype] = arrays[name]
+            view = numpy.ndarray(shape, dtype=dtype, buffer=self._shm.buf,
+                                 offset=offset)
+            view[...] = getattr(self, name)
+
+        logger.debug("Shared RCF templates in " + self._shm.name + " (" +
+                     str(size) + " bytes)")
+        return {'name': self._shm.name, 'arrays': arrays, 'NFL': self.NFL,
+                'NUM_BRT_TEMPS': self.NUM_BRT_TEMPS,
+                'NUM_RETR_LVLS': self.NUM_RETR_LVLS,
+                'RCFIds': list(self._RCFIds),
+                'RCFFileNames': list(self._RCFFileNames)}
+
+    @classmethod
+    def attach(cls, shared):
+        """
+        Make a stack whose arrays are views onto the shared memory described
+        by shared, as returned by share() in another process. The arrays
+        are read only. The stack has no RCF objects, only their ids and
+        file names.
+        """
+        stack = cls([])
+        stack._shm = shared_memory.SharedMemory(name=shared['name'])
+        stack._RCFIds = list(shared['RCFIds'])
+        stack._RCFFileNames = list(shared['RCFFileNames'])
+        stack.nRCF = len(stack._RCFIds)
+        stack.NFL = shared['NFL']
+        stack.NUM_BRT_TEMPS = shared['NUM_BRT_TEMPS']
+        stack.NUM_RETR_LVLS = shared['NUM_RETR_LVLS']
+        for name in SHARED_ARRAYS:
+            [offset, shape, dtype] = shared['arrays'][name]
+            array = numpy.ndarray(tuple(shape), dtype=dtype,
+                                  buffer=stack._shm.buf, offset=offset)
+            array.flags.writeable = False
+            setattr(stack, name, array)
+        stack._stackable = True
+        return stack
+
+    def close(self):
+        """
+        Close this process's access to the shared memory. An attached stack
+        can't be used after it is closed.
+        """
+        if self._shm is None:
+            return
+        if not self._RCFs:
+            # Release the views onto the shared memory first
+            self._stackable = False
+            for name in SHARED_ARRAYS:
+                setattr(self, name, None)
+        self._shm.close()
+        self._shm = None
+
+    def unlink(self):
+        """ Free the shared memory made by share() """
+        if self._shm is None:
+            return
+        self._shm.unlink()
+        self.close()
+
+    def getFlightLevelBrackets(self, PAltKm):
+        """
+        Vectorized version of RetrievalCoefficientFile.getFlightLevelBracket()
+
+        PAltKm is a single altitude or a 1-D array of N altitudes.
+
+        Returns arrays Top, Bot and BotWt, one element per RCF, with shape
+        (nRCF) or (N, nRCF). Returns None if any RCF has no flight levels
+        bracketing PAltKm (e.g. PAltKm is NaN).
+        """
+        NFL = self.NFL
+        PAltKm = numpy.asarray(PAltKm, dtype=numpy.float64)[..., numpy.newaxis]
+
+        # Find two Flight Level Sets that are above and below the PAltKm
+        # provided. If more than one pair matches, the scalar code uses the
+        # last one, so do the same.
+        Upper = self.Zr[:, 0:NFL]
+        Lower = self.Zr[:, 1:NFL + 1]
+        match = ((PAltKm[..., numpy.newaxis] <= Upper) &
+                 (PAltKm[..., numpy.newaxis] >= Lower))
+        Top = NFL - 1 - numpy.argmax(match[..., ::-1], axis=-1)
+
+        # Aircraft level is above highest flight level, or below lowest
+        # flight level
+        above = PAltKm >= self.Zr[:, 0]
+        below = ~above & (PAltKm <= self.Zr[:, NFL - 1])
+        inrange = ~above & ~below
+        if not numpy.all(match.any(axis=-1) | ~inrange):
+            return None
+
+        rows = numpy.arange(self.nRCF)
+        with numpy.errstate(all='ignore'):
+            BotWt = 1.0 - ((PAltKm - Lower[rows, Top]) /
+                           (Upper[rows, Top] - Lower[rows, Top]))
+        Top = numpy.where(above, 0, numpy.where(below, NFL - 1, Top))
+        Bot = numpy.where(inrange, Top + 1, Top)
+        BotWt = numpy.where(above, 0.0, numpy.where(below, 1.0, BotWt))
+
+        return [Top, Bot, BotWt]
+
+    def interpolate(self, FL, RCFIndex, Top, Bot, BotWt):
+        """
+        Weight the flight levels Top and Bot of the (nRCF, NFL, ...) array FL
+        for each RCFIndex, as RetrievalCoefficientFile.getRCAvgWtSet() does.
+        If Top == Bot, the flight level is used as is.
+        """
+        # Add axes so the weights broadcast over the trailing dimensions of FL
+        shape = BotWt.shape + (1,) * (FL.ndim - 2)
+        BotWt = BotWt.reshape(shape)
+        TopWt = 1.0 - BotWt
+        clamped = (Top == Bot).reshape(shape)
+
+        return numpy.where(clamped, FL[RCFIndex, Top],
+                           FL[RCFIndex, Bot] * BotWt +
+                           FL[RCFIndex, Top] * TopWt)
+
+    def getWeightedObservables(self, PAltKm):
+        """
+        Interpolate the observables and rms values of every template to
+        PAltKm.
+
+        Returns arrays sOBav and sOBrms with shape (nRCF, NUM_BRT_TEMPS), or
+        (N, nRCF, NUM_BRT_TEMPS) if PAltKm is an array of N altitudes. Returns
+        None if PAltKm could not be bracketed.
+        """
+        bracket = self.getFlightLevelBrackets(PAltKm)
+        if bracket is None:
+            return None
+        [Top, Bot, BotWt] = bracket
+        rows = numpy.arange(self.nRCF)
+
+        return [self.interpolate(self.sOBav, rows, Top, Bot, BotWt),
+                self.interpolate(self.sOBrms, rows, Top, Bot, BotWt)]
+
+    def getLnP(self, ScanBrightnessTemps, PAltKm):
+        """
+        Score every template against the scan brightness temperatures.
+
+        ScanBrightnessTemps is a single scan, or an (N, NUM_BRT_TEMPS) array
+        of N scans in which case PAltKm is an array of N altitudes.
+
+        Returns an array of the sum of the ln of probabilities (quality of
+        match), one element per RCF, with shape (nRCF) or (N, nRCF). Returns
+        None if any template can't be scored; in that case the scalar code
+        should be used as it reports the error.
+        """
+        weighted = self.getWeightedObservables(PAltKm)
+        if weighted is None:
+            return None
+        [sOBav, sOBrms] = weighted
+        ScanBTs = numpy.asarray(ScanBrightnessTemps, dtype=numpy.float64)
+        ScanBTs = ScanBTs[..., numpy.newaxis, 0:self.NUM_BRT_TEMPS]
+
+        if numpy.any(sOBrms == 0):
+            return None
+
+        Weight = 1/square(sOBrms)
+        Diff = ScanBTs - sOBav
+        Incl = Weight > 0
+
+        # Accumulate one brightness temperature at a time, as the scalar
+        # code does, so the sums are identical.
+        SumWeights = numpy.add.accumulate(Weight, axis=-1)[..., -1]
+        SumWeightedAvg = numpy.add.accumulate(
+            numpy.where(Incl, Weight * Diff, 0.0), axis=-1)[..., -1]
+        SumSquares = numpy.add.accumulate(
+            numpy.where(Incl, Weight * square(Diff), 0.0), axis=-1)[..., -1]
+        NumBTsIncl = numpy.count_nonzero(Incl, axis=-1)
+
+        if numpy.any(NumBTsIncl <= 1):
+            return None
+
+        # The weighted mean of each RCF's BTs
+        RCFBTWeightedMean = SumWeightedAvg / SumWeights
+
+        # Standard Deviation about weighted mean(?)
+        Numerator = SumSquares - (SumWeights * square(RCFBTWeightedMean))
+        Denominator = (NumBTsIncl-1) * SumWeights / NumBTsIncl
+        Variance = Numerator / Denominator
+        with numpy.errstate(invalid='ignore'):
+            RCFBTStdDev = numpy.where(Variance >= 0, numpy.sqrt(Variance),
+                                      RCFBTWeightedMean)  # MJ "kludge"
+
+        # Calculate the Sum of the ln of probabilities (quality of match)
+        # for each RCF
+        lnP = 8 * numpy.sqrt(square(RCFBTWeightedMean) +
+                             square(RCFBTStdDev)) / self.NUM_BRT_TEMPS
+        return lnP
+
+    def getWeightedRCs(self, RCFIndex, PAltKm):
+        """
+        Interpolate the retrieval coefficient sets of N templates to N
+        altitudes, i.e. the batch equivalent of calling getRCAvgWt(PAltKm[n])
+        on RCF RCFIndex[n].
+
+        Returns a dictionary of (N, ...) arrays sBPrl, sRTav, sOBav and Src,
+        with Src shaped (N, NUM_RETR_LVLS, NUM_BRT_TEMPS), a boolean
+        array 'clamped' that is True where PAltKm was outside the flight
+        levels, and the flight levels and weight used, 'Top', 'Bot' and
+        'BotWt', as RetrievalCoefficientFile.getFlightLevelBracket() returns.
+        """
+        RCFIndex = numpy.asarray(RCFIndex)
+        bracket = self.getFlightLevelBrackets(PAltKm)
+        if bracket is None:
+            return None
+        scans = numpy.arange(len(RCFIndex))
+        [Top, Bot, BotWt] = [val[scans, RCFIndex] for val in bracket]
+
+        RCs = {'clamped': Top == Bot, 'Top': Top, 'Bot': Bot, 'BotWt': BotWt}
+        for name in ['sBPrl', 'sRTav', 'sOBav', 'Src']:
+            RCs[name] = self.interpolate(getattr(self, name), RCFIndex, Top,
+                                         Bot, BotWt)
+
+        # Outside the flight levels getRCAvgWt returns Src in column major
+        # order, which is then used as if it were row major. Do the same so
+        # the results match.
+        if numpy.any(RCs['clamped']):
+            Src = RCs['Src'][RCs['clamped']]
+            RCs['Src'][RCs['clamped']] = Src.transpose(0, 2, 1).reshape(
+                Src.shape)
+
+        return RCs
+
+    def rank(self, lnP, k=None):
+        """
+        Return the RCF indices sorted by increasing lnP. Ties keep the order
+        of the RCFs in the set. If lnP is (N, nRCF), each scan is sorted.
+
+        If k is given, only the indices of the k best RCFs are returned. They
+        are found with a partial selection, so the rest of the RCFs are never
+        sorted. The result is the same as the first k of the full ranking.
+        """
+        lnP = numpy.asarray(lnP)
+        if k is None or k >= lnP.shape[-1]:
+            return numpy.argsort(lnP, axis=-1, kind='stable')
+
+        # Find the k-th best score of each scan. Anything that scores as well
+        # is a candidate, so ties with it can be broken by RCF order. If
+        # fewer than k scores are numbers, every RCF is a candidate.
+        flat = lnP.reshape(-1, lnP.shape[-1])
+        kth = numpy.partition(flat, k - 1, axis=-1)[:, k - 1:k]
+        with numpy.errstate(invalid='ignore'):
+            candidate = (flat <= kth) | numpy.isnan(kth)
+
+        # Sort the candidates of each scan by score, keeping RCF order for
+        # ties, and keep the first k of each scan
+        [scans, index] = numpy.nonzero(candidate)
+        order = numpy.lexsort((flat[scans, index], scans))
+        first = numpy.cumsum(candidate.sum(axis=1)) - candidate.sum(axis=1)
+        best = index[order][(first[:, numpy.newaxis] +
+                             numpy.arange(k)).reshape(-1)]
+        return best.reshape(lnP.shape[:-1] + (k,))
@@ -73,6 +73,7 @@ RC_Set_4Retrieval = {
     # Holds the index of whichever RCF is currently being accessed
     'RCFIndex': numpy.nan,
     'FL_RCs': "",  # Will hold an RCF_FL dictionary
+    'FL_Bracket': [],  # [Top, Bot, BotWt] flight levels used to build FL_RCs
 
     # Will hold a sorted array of 2-entry arrays where the first entry is
     # the RCFId and the second entry is that RCF's SumLnProb.
@@ -80,3 +81,15 @@ RC_Set_4Retrieval = {
     # to the best fit, RCFArray[1][0] gives the second best fit, etc.
     'RCFArray': [],
 }
+
+RC_Set_Ref = {
+    # Compact reference to an RC_Set_4Retrieval, saved with each scan in
+    # place of the full set. Holds everything but FL_RCs, which can be rebuilt
+    # from the RCF set with RetrievalCoefficientFileSet.expandRCSet()
+    'RCFFileName': "",
+    'RCFId': "",
+    'SumLnProb': numpy.nan,
+    'RCFIndex': numpy.nan,
+    'FL_Bracket': [],  # [Top, Bot, BotWt] flight levels used to build FL_RCs
+    'RCFArray': [],
+}
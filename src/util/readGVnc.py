@@ -8,11 +8,14 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2020
 ###############################################################################
+import os
+import numpy
 import netCDF4
 import pandas as pd
-from EOLpython.Qlogger.messageHandler import QLogger
+from util.time_index import TimeIndex
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
 
 
 class readGVnc:
@@ -34,6 +37,12 @@ class readGVnc:
         varlist = ["GGLAT", "GGLON", "GGALT", "PITCH", "ROLL", "PALTF", "ATX"]
         self.varlist = varlist
 
+        # The TimeIndex of the last file read by getTimeIndex(), and the
+        # [filename, size, mtime] of the file when it was read
+        self.timefile = None
+        self.start_date = None
+        self.timeIndex = None
+
     def getNGvalues(self, ncfile, varlist=None):
         """
         Read in NetCDF file. Save record to pandas DataFrame where columns are
@@ -43,16 +52,7 @@ class readGVnc:
         """
         nc = netCDF4.Dataset(ncfile, mode='r')
 
-        # Extract the time variable from the netCDF file. TIME contains a
-        # netCDF "chunk" with the dimensions, attributed, and values of the
-        # variable "Time". dtime is an array of cftime date/time objects
-        # Store the cftime array as a pandas object and cast the data in it to
-        # type string
-        TIME = nc.variables["Time"]
-        dtime = netCDF4.num2date(TIME[:], TIME.units)
-        dtime = pd.Series(dtime).astype(str)
-
-        self.ncdata = dtime.to_frame()  # Assign time to DataFrame
+        self.ncdata = self.getTimes(nc).to_frame()  # Assign time to DataFrame
 
         # If user requested a list via the optional varlist in the call
         # to this fn, overwrite varlist with it.
@@ -77,13 +77,29 @@ class readGVnc:
 
         return self.ncdata
 
-    def NGseconds(self):
+    def getTimes(self, nc):
+        """
+        Return the times in the open netCDF file nc as a pandas Series of
+        "yyyy-mm-dd hh:mm:ss" strings
+        """
+        # Extract the time variable from the netCDF file. TIME contains a
+        # netCDF "chunk" with the dimensions, attributed, and values of the
+        # variable "Time". dtime is an array of cftime date/time objects
+        # Store the cftime array as a pandas object and cast the data in it to
+        # type string
+        TIME = nc.variables["Time"]
+        dtime = netCDF4.num2date(TIME[:], TIME.units)
+        return pd.Series(dtime).astype(str)
+
+    def NGseconds(self, datetime=None):
         """
         Get times from DataFrame in seconds. When date rollover occurs report
-        seconds greater than 86400
+        seconds greater than 86400. datetime is a Series of times from
+        getTimes(), and defaults to the times read by getNGvalues().
         """
         # Extract date and time from dataframe into datetime object
-        datetime = self.ncdata.iloc[:, 0]  # [all rows, column 0]
+        if datetime is None:
+            datetime = self.ncdata.iloc[:, 0]  # [all rows, column 0]
         dt_array = datetime.str.split()  # Array of [date, time] rows
 
         # Convert time from HHMMSS to sec.
@@ -149,10 +165,44 @@ class readGVnc:
 
         returns a single value, no longer in a dataframe
         """
-        # vals is a dataframe with time in first column and the requested
-        # variable values in second column.
-        vals = self.getNGvalues(filename, [var])
-        # Find row where time=timestr and get var from second column (index 1)
-        # Returns a one-item list
-        chunk = vals.loc[(vals[0] == timestr), 1]
-        return chunk.values[0]  # Return value of var as float
+        # Find the row where time=timestr by searching the file times, in
+        # seconds since midnight of the start date. The times are only read
+        # once per file, and then only the value in that row is read.
+        # seconds already includes the days since the start date, so a time
+        # on the wrong day must not be rolled over to the next day.
+        times = self.getTimeIndex(filename)
+        seconds = int((pd.to_datetime(timestr) -
+                       self.start_date).total_seconds())
+        row = times.findTime(seconds, rollover=False)
+        if row is None:
+            raise IndexError(timestr + " is not in " + filename)
+
+        with netCDF4.Dataset(filename, mode='r') as nc:
+            if var not in nc.variables:
+                logger.error("Error extracting variable " + var +
+                             " from " + filename + ". Variable not found. " +
+                             "Click OK to continue or Quit to exit.")
+                raise KeyError(var)
+            # Missing values are NaN, as they are in the DataFrame from
+            # getNGvalues(). If var has more than one value per time, use
+            # the first, which is the one getNGvalues() puts in column 1.
+            value = numpy.ma.filled(nc.variables[var][row], numpy.nan)
+            return value.flat[0]  # Return value of var as float
+
+    def getTimeIndex(self, filename):
+        """
+        Return a TimeIndex of the times in filename, in seconds since
+        midnight of the start date. Reading the times is most of the time
+        taken to read a file, so the index is kept for the last file read,
+        until the file changes. Only the Time variable is read, and the data
+        read by getNGvalues() is left alone.
+        """
+        stat = os.stat(filename)
+        timefile = [filename, stat.st_size, stat.st_mtime_ns]
+        if timefile != self.timefile:
+            with netCDF4.Dataset(filename, mode='r') as nc:
+                datetime = self.getTimes(nc)
+            self.start_date = pd.to_datetime(datetime.iloc[0].split()[0])
+            self.timeIndex = TimeIndex(self.NGseconds(datetime).tolist())
+            self.timefile = timefile
+        return self.timeIndex
@@ -12,9 +12,9 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import re
-from EOLpython.Qlogger.messageHandler import QLogger
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
 
 
 class AsciiParms:
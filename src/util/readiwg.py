@@ -8,9 +8,9 @@
 import re
 import numpy
 from util.readascii_parms import AsciiParms
-from EOLpython.Qlogger.messageHandler import QLogger
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
 
 
 class IWG:
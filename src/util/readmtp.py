@@ -51,10 +51,28 @@ import re
 import numpy
 import json
 import copy
-from util.MTP import MTPrecord
-from EOLpython.Qlogger.messageHandler import QLogger
+from util.MTP import MTPrecord, VALUE_KEYS
+from util.flight_table import FlightTable
+from util.flight_store import FlightStore
+from util.lazy_flight_data import LazyFlightData
+from util.time_index import TimeIndex
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
+
+# The line types in a scan, with their regular expressions compiled once.
+LINE_PATTERNS = {linetype: re.compile(MTPrecord[linetype]['re'])
+                 for linetype in MTPrecord if 're' in MTPrecord[linetype]}
+
+# The line type that each line prefix could be. M01 and M02 lines need the
+# first three characters to tell them apart, the rest only need the first.
+LINE_PREFIXES = {'A': 'Aline', 'I': 'IWG1line', 'B': 'Bline', 'M01': 'M01line',
+                 'M02': 'M02line', 'P': 'Ptline', 'E': 'Eline'}
+
+# The type the values of each line in an Ascii packet are converted to when
+# the packet is parsed. The A line holds measurements, the others counts.
+PACKET_TYPES = {'Aline': float, 'Bline': int, 'M01line': int, 'M02line': int,
+                'Ptline': int, 'Eline': int}
 
 
 class readMTP:
@@ -70,11 +88,20 @@ class readMTP:
         # the end of flightData, and the next scan can be collected in curscan.
         self.flightData = []
 
+        # The same values as flightData, stored by variable in numpy columns.
+        # Used to get the timeseries of a variable without looping through
+        # flightData.
+        self.flightTable = FlightTable()
+
+        # The times of the scans in flightData, for finding scans by time
+        self.timeIndex = TimeIndex()
+
         # Set the scan we are working with to be the current scan. rawscan is
         # always the active scan being worked with. It can point to curscan if
         # we are collecting/processing data, or one of the flightData scans if
         # we are displaying data.
         self.rawscan = self.curscan
+        self.rawscanIndex = None  # Index of rawscan in flightData, if there
 
     def getJson(self, projdir, proj, fltno):
         """ Build name of json file to save flight data to """
@@ -82,6 +109,12 @@ class readMTP:
         # to previous data.
         return os.path.join(projdir, proj+fltno.lower()+'.mtpRealTime.json')
 
+    def getStore(self, projdir, proj, fltno):
+        """ Build name of flight store file to save flight data to """
+        # Like the json file, but quicker to append to, update and reload.
+        return os.path.join(projdir,
+                            proj+fltno.lower()+'.mtpRealTime.mtpstore')
+
     def setRawscan(self, index):
         """ Set the MTP data dictionary we want to read a scan from """
         # The current scan is in self.rawscan and in the last scan in
@@ -91,10 +124,12 @@ class readMTP:
         # index or not.
         try:
             self.rawscan = self.flightData[index]
+            self.rawscanIndex = index
         except Exception as err:
             logger.error("No data available: " + str(err),
                          "Try loading some raw data")
             self.rawscan = None
+            self.rawscanIndex = None
             raise
 
         return True
@@ -102,6 +137,7 @@ class readMTP:
     def resetRawscan(self):
         """ Set the data dictionary back to the current scan """
         self.rawscan = self.curscan
+        self.rawscanIndex = None
 
     def getRawscan(self):
         """ Return a pointer to the MTP data dictionary of the current scan """
@@ -128,21 +164,77 @@ class readMTP:
             if len(line) == 0:  # EOF
                 return False  # At EOF
 
-            # Store line to dictionary
-            self.parseLine(line)
+            # Store line to dictionary. Check if we have a complete scan (all
+            # linetypes have found = True)
+            if self.parseLine(line) and self.foundAll():
+                self.resetFound()
+                return True  # Not at EOF
 
-            # Check if we have a complete scan (all linetypes have found = True
-            foundall = True  # Init so can boolean '&' each rawscan line
-            for linetype in self.rawscan:
-                if 'found' in self.rawscan[linetype]:
-                    foundall = foundall & self.rawscan[linetype]['found']
+    def iter_scans(self, raw_data_file, firstline=1):
+        """
+        Generator that reads an MTP .RAW file (an open file or a file name)
+        in a single pass and yields each complete scan. firstline is the
+        line number of the first line read, used when reporting incomplete
+        scans in part of a file.
+
+        Each complete scan is stored in rawscan, as readRawScan() does, and
+        rawscan is yielded. A scan starts with its A line. If a scan is
+        missing any lines when the next A line (or the end of the file) is
+        reached, it is reported and skipped. The number of scans skipped is
+        left in self.incompleteScans.
+        """
+        if isinstance(raw_data_file, str):
+            with open(raw_data_file, 'r') as f:
+                yield from self.iter_scans(f, firstline)
+            return
+
+        self.incompleteScans = 0
+        found = set()
+        self.resetFound()
+        for linenum, line in enumerate(raw_data_file, firstline):
+            linetype = self.getLineType(line)
+            if linetype is None:
+                continue
+            m = LINE_PATTERNS[linetype].match(line)
+            if not m:
+                continue
+
+            # An A line starts a new scan
+            if linetype == 'Aline' and found:
+                self.reportIncompleteScan(found, linenum - 1)
+                found.clear()
+                self.resetFound()
+
+            self.storeLine(linetype, m, line)
+            found.add(linetype)
+            if len(found) == len(LINE_PATTERNS):
+                found.clear()
+                self.resetFound()
+                yield self.rawscan
+
+        if found:
+            self.reportIncompleteScan(found, 'end of file')
+            self.resetFound()
+
+    def reportIncompleteScan(self, found, linenum):
+        """ Report a scan that was missing some lines """
+        self.incompleteScans += 1
+        missing = [linetype for linetype in LINE_PATTERNS
+                   if linetype not in found]
+        logger.info("Skipping incomplete scan ending at line " +
+                    str(linenum) + ". Missing " + ", ".join(missing))
+
+    def foundAll(self):
+        """ Return True if every line of the scan has been found """
+        for linetype in LINE_PATTERNS:
+            if not self.rawscan[linetype]['found']:
+                return False
+        return True
 
-            if (foundall):
-                # Reset found to False for all and return
-                for linetype in self.rawscan:
-                    if 'found' in self.rawscan[linetype]:
-                        self.rawscan[linetype]['found'] = False
-                return True  # Not at EOF
+    def resetFound(self):
+        """ Reset found to False for all line types """
+        for linetype in LINE_PATTERNS:
+            self.rawscan[linetype]['found'] = False
 
     def reportScanStatus(self, selectedRawFile):
         """
@@ -160,10 +252,75 @@ class readMTP:
     def clearFlightData(self):
         """ clear the flightData list of dictionaries """
         self.flightData.clear()
+        self.flightTable.clear()
+        self.timeIndex.clear()
 
     def archive(self):
         """ Append the current record to the flight library (flightData[]) """
-        self.flightData.append(copy.deepcopy(self.rawscan))
+        self.flightData.append(self.copyValues(self.rawscan))
+        self.flightTable.append(self.flightData[-1])
+
+    def copyValues(self, scan):
+        """
+        Return a copy of a scan that only holds its values. The regular
+        expressions and variable metadata are the same for every scan, so
+        they are left out and read from curscan when needed. The typed values
+        are left out too; once a scan is archived they are in the flight
+        table.
+        """
+        record = {}
+        for key, item in scan.items():
+            if isinstance(item, dict) and 'values' in item:
+                line = {k: v for k, v in item.items()
+                        if k != 're' and k != 'values' and k != 'typed'}
+                line['values'] = {
+                    var: {k: (list(v) if isinstance(v, list) else v)
+                          for k, v in values.items() if k in VALUE_KEYS}
+                    for var, values in item['values'].items()}
+                record[key] = line
+            else:
+                # tbi, ATP and BestWtdRCSet are replaced, not modified, for
+                # each new scan so they can be shared.
+                record[key] = item
+        return record
+
+    def getFlightTable(self):
+        """ Return the columnar copy of flightData """
+        # flightData can be replaced as a whole (e.g. by load()), so rebuild
+        # the table if it no longer has a row for every scan.
+        if len(self.flightTable) != len(self.flightData):
+            self.rebuildFlightTable()
+        return self.flightTable
+
+    def rebuildFlightTable(self):
+        """ Refill the flight table from flightData """
+        self.flightTable.clear()
+        self.timeIndex.clear()
+        if isinstance(self.flightData, LazyFlightData):
+            # Only use the parts of the scans that have been decoded
+            self.flightTable.extend(self.flightData.getTableScans())
+        else:
+            self.flightTable.extend(self.flightData)
+
+    def getTimeIndex(self):
+        """
+        Return the index of the times of the scans in flightData, after
+        adding the times of any scans archived since it was last used.
+        """
+        table = self.getFlightTable()
+        count = len(self.timeIndex)
+        if count < len(table):
+            times = table.getColumn('Aline', 'TIME')
+            self.timeIndex.extend(times[count:].tolist())
+        return self.timeIndex
+
+    def updateFlightTable(self):
+        """
+        If rawscan is one of the flightData scans, copy any values that have
+        been calculated for it to the flight table.
+        """
+        if self.rawscanIndex is not None:
+            self.getFlightTable().update(self.rawscanIndex, self.rawscan)
 
     def removeJSON(self, filename):
         """ Delete the JSON file on disk """
@@ -175,20 +332,72 @@ class readMTP:
 
     def save(self, filename):
         """ Append the current record to a JSON file on disk """
+        # Leave out the typed values, which are numpy arrays
+        record = {key: ({k: v for k, v in item.items() if k != 'typed'}
+                        if isinstance(item, dict) else item)
+                  for key, item in self.rawscan.items()}
         with open(filename, 'a') as f:
-            json.dump(self.rawscan, f)
+            json.dump(record, f)
             f.write('\n')
 
+    def exportJSON(self, filename):
+        """ Write all the records in flightData to a JSON file on disk """
+        # flightData may be read from the file being written, so read it all
+        # before the file is overwritten.
+        if isinstance(self.flightData, LazyFlightData):
+            self.flightData.decodeAll()
+        with open(filename, 'w') as f:
+            for scan in self.flightData:
+                json.dump(scan, f)
+                f.write('\n')
+
+    def archiveRecords(self, records):
+        """
+        Append records that have already been copied with copyValues(), e.g.
+        by a worker process, to the flight library (flightData[])
+        """
+        self.flightData.extend(records)
+        self.flightTable.extend(records)
+
+    def saveToStore(self, filename):
+        """ Append the current record to a flight store on disk """
+        FlightStore(filename).append(self.copyValues(self.rawscan))
+
+    def saveRecordsToStore(self, filename, records):
+        """ Append records to a flight store on disk """
+        FlightStore(filename).extend(records)
+
+    def updateStore(self, filename, index):
+        """
+        Replace record index in a flight store on disk with flightData[index],
+        e.g. after a retrieval has been done for it.
+        """
+        FlightStore(filename).update(index,
+                                     self.copyValues(self.flightData[index]))
+
+    def removeStore(self, filename):
+        """ Delete the flight store on disk """
+        FlightStore(filename).remove()
+
+    def convertJSON(self, jsonfile, storefile):
+        """ Copy the records in a JSON file to a new flight store """
+        with open(jsonfile, 'r') as f:
+            scans = [self.copyValues(json.loads(line)) for line in f]
+        store = FlightStore(storefile)
+        store.create()
+        store.extend(scans)
+
     def load(self, filename):
         """
-        Read records from JSON file on disk and prepend to flightData array
+        Read records from a flight store or JSON file on disk and prepend to
+        flightData array. Records are only decoded from the file when they
+        are used (see LazyFlightData).
         """
         # Check if file exists. If not, nothing to load, so return failed
         if not os.path.isfile(filename):
             return False
 
-        with open(filename, 'r') as f:
-            previous_data = [json.loads(line) for line in f]
+        previous_data = LazyFlightData(filename)
 
         # There does not appear to be a list.prepend() python function so
         # extend the previous_data array with any data written to flightData
@@ -198,36 +407,52 @@ class readMTP:
         # data is lost - everything collected is in the JSON file.
         previous_data.extend(self.flightData)
         self.flightData = previous_data
+        self.rebuildFlightTable()
 
         return True
 
+    def getLineType(self, line):
+        """
+        Return the line type that line could be, based on its prefix, or None
+        if it isn't any of them.
+        """
+        linetype = LINE_PREFIXES.get(line[:1])
+        if linetype is None:
+            linetype = LINE_PREFIXES.get(line[:3])
+        return linetype
+
     def parseLine(self, line):
         """
-        Loop through possible line types, match the line, and store it in
-        the dictionary
+        Find the line type from the line prefix, match the line, and store it
+        in the dictionary
         """
-        for linetype in self.rawscan:
-            if 're' in self.rawscan[linetype]:
-                m = re.match(re.compile(self.rawscan[linetype]['re']), line)
-                if (m):
-                    # Store data. Handle special case of date in A line
-                    if (linetype == 'Aline'):  # Reformat date/time
-                        self.rawscan[linetype]['date'] =  \
-                            m.group(1)+"T"+m.group(2)+m.group(3)+m.group(4)
-                        self.rawscan[linetype]['data'] = m.group(5)
-                    elif (linetype == 'IWG1line'):  # Reformat date/time
-                        self.rawscan[linetype]['asciiPacket'] = \
-                            line.rstrip('\n')
-                        self.rawscan[linetype]['date'] = m.group(1)
-                        self.rawscan[linetype]['data'] = \
-                            m.group(2).rstrip('\n')
-                    else:
-                        self.rawscan[linetype]['data'] = \
-                            m.group(2).rstrip('\n')
-                    # Mark found
-                    self.rawscan[linetype]['found'] = True
-                    # Exit matching loop
-                    return True
+        linetype = self.getLineType(line)
+        if linetype is None:
+            return None
+
+        m = LINE_PATTERNS[linetype].match(line)
+        if (m):
+            self.storeLine(linetype, m, line)
+            return True
+
+    def storeLine(self, linetype, m, line):
+        """ Store a line matched by its line type regex to the dictionary """
+        # Store data. Handle special case of date in A line
+        if (linetype == 'Aline'):  # Reformat date/time
+            self.rawscan[linetype]['date'] =  \
+                m.group(1)+"T"+m.group(2)+m.group(3)+m.group(4)
+            self.rawscan[linetype]['data'] = m.group(5)
+        elif (linetype == 'IWG1line'):  # Reformat date/time
+            self.rawscan[linetype]['asciiPacket'] = \
+                line.rstrip('\n')
+            self.rawscan[linetype]['date'] = m.group(1)
+            self.rawscan[linetype]['data'] = \
+                m.group(2).rstrip('\n')
+        else:
+            self.rawscan[linetype]['data'] = \
+                m.group(2).rstrip('\n')
+        # Mark found
+        self.rawscan[linetype]['found'] = True
 
     def getACAlt(self):
         """ Return the aircraft alititude (km) from the Aline """
@@ -449,11 +674,13 @@ class readMTP:
             if (key != 'DATE' and key != 'TIME' and key != 'timestr'):
                 self.rawscan['Aline']['values'][key]['val'] = \
                     values[int(self.rawscan['Aline']['values'][key]['idx'])]
+        self.setTypedValues('Aline', values)
 
     def assignBvalues(self, values):
         """ Parse the B line and assign to variables in the data dictionary """
         for key in self.rawscan['Bline']['values']:
             self.rawscan['Bline']['values'][key]['val'] = values
+        self.setTypedValues('Bline', values)
 
     def assignM01values(self, values):
         """
@@ -462,6 +689,7 @@ class readMTP:
         for key in self.rawscan['M01line']['values']:
             self.rawscan['M01line']['values'][key]['val'] = \
                     values[int(self.rawscan['M01line']['values'][key]['idx'])]
+        self.setTypedValues('M01line', values)
 
     def assignM02values(self, values):
         """
@@ -470,6 +698,7 @@ class readMTP:
         for key in self.rawscan['M02line']['values']:
             self.rawscan['M02line']['values'][key]['val'] = \
                     values[int(self.rawscan['M02line']['values'][key]['idx'])]
+        self.setTypedValues('M02line', values)
 
     def assignPtvalues(self, values):
         """
@@ -478,11 +707,53 @@ class readMTP:
         for key in self.rawscan['Ptline']['values']:
             self.rawscan['Ptline']['values'][key]['val'] = \
                     values[int(self.rawscan['Ptline']['values'][key]['idx'])]
+        self.setTypedValues('Ptline', values)
 
     def assignEvalues(self, values):
         """ Parse the E line and assign to variables in the data dictionary """
         for key in self.rawscan['Eline']['values']:
             self.rawscan['Eline']['values'][key]['val'] = values
+        self.setTypedValues('Eline', values)
+
+    def setTypedValues(self, linetype, values):
+        """
+        Save the values of a line, converted to numbers, as a numpy array in
+        packet order alongside the strings in the data dictionary. The values
+        are converted once, when the packet is parsed, so the calculations
+        for each scan don't each convert the strings again. If a value isn't
+        a number (e.g. it is missing from the packet) the line isn't saved,
+        and its values are converted from the strings when they are used.
+        """
+        try:
+            self.rawscan[linetype]['typed'] = \
+                numpy.array(values, dtype=PACKET_TYPES[linetype])
+        except ValueError:
+            self.rawscan[linetype]['typed'] = None
+
+    def getTypedValues(self, linetype):
+        """
+        Get the numpy array of the values of a line in packet order, or None
+        if they weren't converted when the packet was parsed.
+        """
+        return self.rawscan[linetype].get('typed')
+
+    def getTypedVar(self, linetype, var):
+        """
+        Get the value of a variable as a number (a list of numbers for the B
+        and E lines). Uses the values converted when the packet was parsed,
+        if there are any, else converts the string in the data dictionary.
+        """
+        values = self.rawscan[linetype]['values'][var]
+        typed = self.getTypedValues(linetype)
+        if typed is None:
+            convert = PACKET_TYPES[linetype]
+            if isinstance(values['val'], list):
+                return [convert(val) for val in values['val']]
+            return convert(values['val'])
+
+        if 'idx' in values:
+            return typed[int(values['idx'])].item()
+        return typed.tolist()
 
     def getVar(self, linetype, var):
         """ Get the value of a variable from the data dictionary """
@@ -520,17 +791,22 @@ class readMTP:
         # Ch1NDoff, Ch2NDoff, and Ch3NDoff
         self.varArray = []
         if self.rawscan is not None:
-            if type(self.flightData[0][linetype]['values'][var]
-                    ['val']) is not list:
+            column = self.getColumn(linetype, var)
+            if column is None or column.ndim != 2:
                 return None
-            for i in range(len(self.flightData)):
-                self.varArray.append(float(self.flightData[i][linetype]
-                                           ['values'][var]['val'][index]))
+            self.varArray = column[:, index].tolist()
         return self.varArray
 
+    def getColumn(self, linetype, var=None, key='val'):
+        """
+        Get a numpy array containing all values of a variable, one row per
+        scan. The array is a view into the flight table, so don't modify it.
+        """
+        return self.getFlightTable().getColumn(linetype, var, key)
+
     def get_metadata(self, linetype, var, key):
         """ Get the metadata with keyword key for the variable """
-        return self.flightData[0][linetype]['values'][var][key]
+        return self.curscan[linetype]['values'][var][key]
 
     def getATPmetadata(self, var, key, index=0):
         """ Get the metadata with keyword key for variable in ATP dict """
@@ -602,36 +878,47 @@ class readMTP:
             return numpy.nan
 
     def getName(self, linetype, var):
-        return self.rawscan[linetype]['values'][var]['name']
+        return self.curscan[linetype]['values'][var]['name']
 
     def getFactByIndex(self, linetype, i):
         """ Get variable scaling factor by index """
-        for var in self.rawscan[linetype]['values']:
-            if self.rawscan[linetype]['values'][var]['idx'] == i:
-                return self.rawscan[linetype]['values'][var]['fact']
+        for var in self.curscan[linetype]['values']:
+            if self.curscan[linetype]['values'][var]['idx'] == i:
+                return self.curscan[linetype]['values'][var]['fact']
 
     def getNameByIndex(self, linetype, i):
         """ Get variable name by index """
-        for var in self.rawscan[linetype]['values']:
-            if self.rawscan[linetype]['values'][var]['idx'] == i:
-                return self.rawscan[linetype]['values'][var]['name']
+        for var in self.curscan[linetype]['values']:
+            if self.curscan[linetype]['values'][var]['idx'] == i:
+                return self.curscan[linetype]['values'][var]['name']
 
     def saveTBI(self, tbi):
         """ Save the inverted brightness temperature to the scan """
         self.rawscan['tbi'] = tbi
+        self.updateFlightTable()
 
     def getTBI(self):
         """ Retrieve the brightness temperatures for the current scan """
         return self.rawscan['tbi']
 
     def saveATP(self, ATP):
-        self.rawscan['ATP'] = copy.deepcopy(ATP)
+        """
+        Save the profile to the scan. It is not copied, so don't change it
+        afterwards. Retriever.retrieve() makes a new one for each scan.
+        """
+        self.rawscan['ATP'] = ATP
+        self.updateFlightTable()
 
     def getATP(self):
         return self.rawscan['ATP']
 
     def saveBestWtdRCSet(self, BestWtdRCSet):
-        self.rawscan['BestWtdRCSet'] = copy.deepcopy(BestWtdRCSet)
+        """
+        Save the RC set reference to the scan. It is not copied, so don't
+        change it afterwards. compactRCSet() makes a new one for each scan.
+        """
+        self.rawscan['BestWtdRCSet'] = BestWtdRCSet
+        self.updateFlightTable()
 
     def getBestWtdRCSet(self):
         return self.rawscan['BestWtdRCSet']
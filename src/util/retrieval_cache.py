@@ -0,0 +1,251 @@
+###############################################################################
+# This class caches the results of the retrieval for each scan on disk, so
+# that reprocessing a flight only redoes the retrievals for scans whose
+# inputs have changed.
+#
+# The result of a retrieval (the compact reference to the best weighted RC
+# set and the temperature profile, with its tropopauses) only depends on the
+# scan brightness temperatures, the aircraft altitude, the RCF set and the
+# code that does the retrieval. The brightness temperatures are calculated
+# from the raw counts with the calibration constants, so a change to the
+# counts, to GEC/GOF or to a tbfit changes them. Each result is stored under a
+# hash of the brightness temperatures and altitude, an identity of the RCF set
+# and retrieval settings, and a hash of the source of the retrieval code, so
+# changing any of these misses the cache.
+#
+# The cache is a SQLite database, which can be shared by processes doing
+# retrievals at the same time. When it grows beyond its maximum size, the
+# results used longest ago are removed.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+# Version of the cached results. Bump this if the results change so old
+# results are not used.
+RETRIEVAL_CACHE_VERSION = 1
+
+# Source files of the retrieval code, relative to src/. Results made by
+# different code are not used.
+RETRIEVAL_CODE = ['util/retriever.py', 'util/tropopause.py', 'util/rcf.py',
+                  'util/rcf_set.py', 'util/rcf_stack.py',
+                  'util/profile_structs.py', 'proc/retrieve.py']
+
+# Commit new results to disk after this many
+COMMIT_INTERVAL = 100
+
+# When the cache is too big, remove results until it is this fraction of its
+# maximum size, so it isn't trimmed again after every commit
+EVICT_FRACTION = 0.9
+
+
+def getCodeFingerprint(files=RETRIEVAL_CODE):
+    """
+    Return a hash of the source of files, relative to src/, or None if any
+    of them can't be read
+    """
+    srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256()
+    for name in files:
+        try:
+            with open(os.path.join(srcdir, name), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            return None
+    return digest.hexdigest()
+
+
+class RetrievalCache():
+
+    def __init__(self, filename, maxsize, identity):
+        """
+        filename is the cache database. maxsize is the maximum size of the
+        cached results in bytes. identity is a string that identifies the
+        RCF set and retrieval settings the results were made with. The
+        source of the retrieval code is added to it.
+        """
+        self._filename = filename
+        self._maxsize = maxsize
+        fingerprint = getCodeFingerprint()
+        if fingerprint is None:
+            logger.warning("Could not read the retrieval code, so " +
+                           "retrievals will not be cached.")
+            self._maxsize = 0
+        self._identity = str(RETRIEVAL_CACHE_VERSION) + str(fingerprint) + \
+            identity
+
+        self._db = None   # Connection, opened when first used
+        self._pending = 0  # Number of results not committed yet
+        self._used = []   # Keys of the results used since the last commit
+        self._clock = 0.0  # Time the last result was saved or used
+        self.resetStats()
+
+    def getFileName(self):
+        """ Return the name of the cache database """
+        return self._filename
+
+    def connect(self):
+        """
+        Open the cache database, creating it if needed. Returns False if it
+        can't be opened, in which case nothing is cached.
+        """
+        if self._db is not None:
+            return True
+        try:
+            self._db = sqlite3.connect(self._filename, timeout=60)
+            # Results can be redone, so don't wait for them to be written
+            # to disk
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("CREATE TABLE IF NOT EXISTS retrievals (" +
+                             "key TEXT PRIMARY KEY, value TEXT NOT NULL, " +
+                             "size INTEGER NOT NULL, used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS retrievals_used " +
+                             "ON retrievals (used)")
+            self._db.commit()
+        except sqlite3.Error as err:
+            logger.warning("Could not open retrieval cache " +
+                           self._filename + ": " + str(err) +
+                           ". Retrievals will not be cached.")
+            self._db = None
+            self._maxsize = 0
+            return False
+        return True
+
+    def tick(self):
+        """
+        Return the current time, for ordering results by when they were
+        last used. Never returns the same time twice, so the order is kept
+        even if the system clock is coarse.
+        """
+        self._clock = max(time.time(), self._clock + 1e-6)
+        return self._clock
+
+    def getKey(self, tbi, sapalt):
+        """
+        Return the key for the result of the retrieval for the scan with
+        brightness temperatures tbi at aircraft altitude sapalt, as read
+        from the A line.
+        """
+        scan = json.dumps([list(tbi), sapalt])
+        return hashlib.sha256((self._identity + scan).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached [BestWtdRCSet, ATP] for key, or None if the result
+        isn't cached
+        """
+        if self._maxsize <= 0 or not self.connect():
+            return None
+        try:
+            row = self._db.execute("SELECT value FROM retrievals " +
+                                   "WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as err:
+            logger.debug("Could not read from retrieval cache " +
+                         self._filename + ": " + str(err))
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.append(key)
+        return json.loads(row[0])
+
+    def put(self, key, BestWtdRCSet, ATP):
+        """ Cache the result of the retrieval for key """
+        if self._maxsize <= 0 or not self.connect():
+            return
+        value = json.dumps([BestWtdRCSet, ATP])
+        try:
+            self._db.execute("INSERT OR REPLACE INTO retrievals " +
+                             "VALUES (?, ?, ?, ?)",
+                             (key, value, len(key) + len(value), self.tick()))
+        except sqlite3.Error as err:
+            logger.debug("Could not save to retrieval cache " +
+                         self._filename + ": " + str(err))
+            return
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Commit the new results, and remove the results used longest ago if
+        the cache is bigger than its maximum size
+        """
+        if self._db is None:
+            return
+        try:
+            # Mark the results that were used, so they are kept longest
+            now = self.tick()
+            self._db.executemany("UPDATE retrievals SET used = ? " +
+                                 "WHERE key = ?",
+                                 [(now, key) for key in self._used])
+            self._db.commit()
+            self._used = []
+            self._pending = 0
+            self.evict()
+        except sqlite3.Error as err:
+            logger.warning("Could not save to retrieval cache " +
+                           self._filename + ": " + str(err))
+
+    def evict(self):
+        """ Remove the results used longest ago until the cache fits """
+        size = self.getSize()
+        if size <= self._maxsize:
+            return
+
+        target = size - self._maxsize * EVICT_FRACTION
+        removed = 0
+        keys = []
+        for [key, keysize] in self._db.execute(
+                "SELECT key, size FROM retrievals ORDER BY used, rowid"):
+            if removed >= target:
+                break
+            keys.append((key,))
+            removed += keysize
+        self._db.executemany("DELETE FROM retrievals WHERE key = ?", keys)
+        self._db.commit()
+        logger.debug("Removed " + str(len(keys)) + " results from " +
+                     "retrieval cache " + self._filename)
+
+    def getSize(self):
+        """ Return the size of the cached results in bytes """
+        if not self.connect():
+            return 0
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM retrievals").fetchone()[0]
+
+    def __len__(self):
+        """ Return the number of cached results """
+        if not self.connect():
+            return 0
+        return self._db.execute(
+            "SELECT COUNT(*) FROM retrievals").fetchone()[0]
+
+    def resetStats(self):
+        """ Start counting hits and misses again, e.g. for a new run """
+        self.hits = 0
+        self.misses = 0
+
+    def getStats(self):
+        """ Return a description of the hits and misses counted """
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups > 0 else 0.0
+        return ("%d hits, %d misses (%.1f%% hit rate)" %
+                (self.hits, self.misses, rate))
+
+    def close(self):
+        """ Commit the new results and close the cache database """
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -26,21 +26,29 @@
 #  - VB6 and Algorithm Copyright MJ Mahoney, NASA Jet Propulsion Laboratory
 ###############################################################################
 import numpy
-import math
+from collections import OrderedDict
 from util.rcf_set import RetrievalCoefficientFileSet
-from util.profile_structs import AtmosphericTemperatureProfile
+from util.rcf_structs import RC_Set_Ref
+from util.profile_structs import newATP
 
 
 class Retriever():
 
     def __init__(self, Directory, filelist=None):
         """
-        Directory is directory name containing the RCF files to be used.
+        Directory is directory name containing the RCF files to be used. If
+        Directory is None, no RCF files are read (see fromStack()).
         """
         self.Directory = Directory
 
         self.rcf_set = RetrievalCoefficientFileSet()
-        self.ATP = AtmosphericTemperatureProfile
+        self.ATP = newATP()
+
+        # Altitudes of recently used retrieval level pressures
+        self._altitudeCache = OrderedDict()
+
+        if Directory is None:
+            return
 
         # Create a file set - this should only be called once at init
         try:
@@ -48,6 +56,19 @@ class Retriever():
         except Exception:
             raise
 
+    @classmethod
+    def fromStack(cls, stack):
+        """
+        Make a Retriever that uses an existing stack of templates, e.g. one
+        a worker process has attached to shared memory with
+        RetrievalCoefficientStack.attach(), instead of reading the RCF
+        files. Only retrieve_batch() can be used, and RCFIndex refers to
+        stack.getRCFIds().
+        """
+        retriever = cls(None)
+        retriever.rcf_set.setStack(stack)
+        return retriever
+
     def getRCSet(self, ScanBTs, ACAltKm):
         """
         Get the best weighted RC Set that matches this scan
@@ -83,11 +104,11 @@ class Retriever():
         lowest angle), the second 10 are for channel 2 and the third 10 are for
         channel 3.
 
+        Returns a new profile each time it is called.
         """
-        # Clear the Temperature/Altitude profile
-        self.ATP['Temperatures'] = []
+        # Start a new Temperature/Altitude profile
+        self.ATP = newATP()
         self.PressureAlts = []
-        self.ATP['Altitudes'] = []
 
         # Calculate the physical temperature profile
         self.NUM_RETR_LVLS = self.rcf_set._RCFs[0].getNUM_RETR_LVLS()
@@ -125,6 +146,163 @@ class Retriever():
 
         return self.ATP
 
+    def retrieve_batch(self, ScanBTs, ACAltKm, chunksize=256):
+        """
+        Retrieve the physical temperature profiles from N scans at once.
+        Gives the same results as calling getRCSet() and retrieve() on each
+        scan.
+
+        ScanBTs is an (N, NUM_BRT_TEMPS) array of scan brightness
+        temperatures, ordered as for retrieve().
+
+        ACAltKm is an array of the N aircraft altitudes in km. Scans where
+        the altitude is missing or negative get no profile.
+
+        chunksize is the number of scans to process at a time. It limits the
+        memory used when matching all the scans against all the templates.
+
+        Returns a dictionary of arrays:
+            'Temperatures', 'Altitudes': (N, NUM_RETR_LVLS) profiles
+            'RCFIndex': index of the best RCF for each scan (-1 if none)
+            'RCFALT1Index', 'RCFALT2Index': flight level indices
+            'RCFMRIndex': quality of match (SumLnProb) of each scan
+        and a list:
+            'RCSetRefs': the compact reference to the best weighted RC set
+                of each scan, as RetrievalCoefficientFileSet.compactRCSet()
+                makes (None if no profile)
+        """
+        ScanBTs = numpy.asarray(ScanBTs, dtype=numpy.float64)
+        ACAltKm = numpy.asarray(ACAltKm, dtype=numpy.float64)
+        stack = self.rcf_set.getStack()
+        if stack.isStackable():
+            self.NUM_RETR_LVLS = stack.NUM_RETR_LVLS
+            NUM_BRT_TEMPS = stack.NUM_BRT_TEMPS
+        else:
+            self.NUM_RETR_LVLS = self.rcf_set._RCFs[0].getNUM_RETR_LVLS()
+            NUM_BRT_TEMPS = self.rcf_set._RCFs[0].getNUM_BRT_TEMPS()
+        N = len(ACAltKm)
+
+        Profiles = {
+            'Temperatures': numpy.full((N, self.NUM_RETR_LVLS), numpy.nan),
+            'Altitudes': numpy.full((N, self.NUM_RETR_LVLS), numpy.nan),
+            'RCFIndex': numpy.full(N, -1),
+            'RCFALT1Index': numpy.full(N, numpy.nan),
+            'RCFALT2Index': numpy.full(N, numpy.nan),
+            'RCFMRIndex': numpy.full(N, numpy.nan),
+            'RCSetRefs': [None] * N,
+        }
+
+        # If PALT is missing or negative, can't match a template to the scan
+        with numpy.errstate(invalid='ignore'):
+            scans = numpy.flatnonzero(~numpy.isnan(ACAltKm) & (ACAltKm >= 0))
+
+        for start in range(0, len(scans), chunksize):
+            chunk = scans[start:start + chunksize]
+
+            # Score all the scans in this chunk against all the templates
+            lnP = None
+            if stack.isStackable():
+                lnP = stack.getLnP(ScanBTs[chunk, 0:NUM_BRT_TEMPS],
+                                   ACAltKm[chunk])
+            if lnP is None:
+                # Templates can't be matched all at once, so do one scan at
+                # a time. That needs the RCFs, which a shared stack doesn't
+                # have.
+                if len(self.rcf_set.getRCFVector()) == 0:
+                    raise Exception("Unable to match scans to the stacked " +
+                                    "templates and no RCFs are loaded")
+                for scan in chunk:
+                    self.retrieve_scan(ScanBTs[scan], ACAltKm[scan], scan,
+                                       Profiles)
+                continue
+
+            BestRCIndex = stack.rank(lnP, 1)[:, 0]
+            Profiles['RCFIndex'][chunk] = BestRCIndex
+            Profiles['RCFMRIndex'][chunk] = \
+                lnP[numpy.arange(len(chunk)), BestRCIndex]
+
+            # Get the weighted RC set from the best template for each scan
+            RCs = stack.getWeightedRCs(BestRCIndex, ACAltKm[chunk])
+            for [scan, RCSetRef] in zip(chunk, self.getRCSetRefs(
+                    stack, lnP, BestRCIndex, RCs)):
+                Profiles['RCSetRefs'][scan] = RCSetRef
+
+            # Temperature = sRTav + sum over BTs of Src * (BT - sOBav). Sum
+            # one BT at a time, starting from sRTav, as retrieve() does so
+            # results are identical.
+            BtDiff = ScanBTs[chunk, 0:NUM_BRT_TEMPS] - RCs['sOBav']
+            Terms = numpy.concatenate(
+                [RCs['sRTav'][:, :, numpy.newaxis],
+                 RCs['Src'] * BtDiff[:, numpy.newaxis, :]], axis=2)
+            Temperatures = numpy.add.accumulate(Terms, axis=2)[:, :, -1]
+
+            Altitudes = self.Pressure2KmArray(RCs['sBPrl'])
+
+            # Save the indices of the flight level sets used in averages.
+            # These are only set when the altitude was between flight levels.
+            Profiles['RCFALT1Index'][chunk] = numpy.where(
+                RCs['clamped'], numpy.nan, stack.NFL - 1)
+            Profiles['RCFALT2Index'][chunk] = numpy.where(
+                RCs['clamped'], numpy.nan, stack.NFL)
+
+            # Any Temperature with Altitude <= 0 is not valid (nor is
+            # altitude) If Temperature is NAN (regardless of Alt, set Alt to
+            # NAN.
+            with numpy.errstate(invalid='ignore'):
+                invalid = (Altitudes <= 0) | numpy.isnan(Temperatures)
+            Temperatures[invalid] = numpy.nan
+            Altitudes[invalid] = numpy.nan
+            Profiles['Temperatures'][chunk] = Temperatures
+            Profiles['Altitudes'][chunk] = Altitudes
+
+        return Profiles
+
+    def getRCSetRefs(self, stack, lnP, BestRCIndex, RCs):
+        """
+        Make the compact reference to the best weighted RC set of each scan
+        scored by retrieve_batch(), holding the same values as
+        getBestWeightedRCSet() and compactRCSet() give for the scan.
+
+        lnP is the (N, nRCF) array of template scores, BestRCIndex the best
+        template of each scan and RCs the weighted RC sets from
+        RetrievalCoefficientStack.getWeightedRCs().
+        """
+        RCFIds = stack.getRCFIds()
+        RCFFileNames = stack.getRCFFileNames()
+        Ranking = stack.rank(lnP, self.rcf_set.getTopK())
+
+        RCSetRefs = []
+        for n in range(len(BestRCIndex)):
+            index = int(BestRCIndex[n])
+            RCSetRef = dict(RC_Set_Ref)
+            RCSetRef['RCFFileName'] = RCFFileNames[index]
+            RCSetRef['RCFId'] = RCFIds[index]
+            RCSetRef['SumLnProb'] = lnP[n, index].item()
+            RCSetRef['RCFIndex'] = index
+            RCSetRef['FL_Bracket'] = [RCs['Top'][n].item(),
+                                      RCs['Bot'][n].item(),
+                                      RCs['BotWt'][n].item()]
+            RCSetRef['RCFArray'] = [[RCFIds[i], lnP[n, i].item()]
+                                    for i in Ranking[n]]
+            RCSetRefs.append(RCSetRef)
+
+        return RCSetRefs
+
+    def retrieve_scan(self, ScanBTs, ACAltKm, scan, Profiles):
+        """
+        Retrieve a single scan with getRCSet() and retrieve() and store the
+        results in element scan of the Profiles arrays from retrieve_batch()
+        """
+        BestWtdRCSet = self.getRCSet(ScanBTs, ACAltKm)
+        Profiles['RCSetRefs'][scan] = self.rcf_set.compactRCSet(BestWtdRCSet)
+        ATP = self.retrieve(ScanBTs, BestWtdRCSet)
+        Profiles['Temperatures'][scan] = ATP['Temperatures']
+        Profiles['Altitudes'][scan] = ATP['Altitudes']
+        Profiles['RCFIndex'][scan] = ATP['RCFIndex']
+        Profiles['RCFALT1Index'][scan] = ATP['RCFALT1Index']
+        Profiles['RCFALT2Index'][scan] = ATP['RCFALT2Index']
+        Profiles['RCFMRIndex'][scan] = ATP['RCFMRIndex']['val']
+
     def checkMissing(self, ATP):
         """
         Check if all the temperatures are missing. If they are, then we will
@@ -144,56 +322,98 @@ class Retriever():
     def Pressure2Km(self, Pressures):
         """
         MJ's rather elaborate way of converting from pressure altitude to km
+
+        Pressures is a list of pressures (hPa). Returns a list of altitudes.
+        """
+        return self.Pressure2KmArray(Pressures).tolist()
+
+    def Pressure2KmArray(self, Pressures):
+        """
+        Convert an array of pressures (hPa) to an array of altitudes (km)
+        using the standard atmosphere layers in PRESSURE_LAYERS.
+
+        The retrieval level pressures depend only on the weighted RC set, so
+        the altitudes of recent sets are remembered and not recalculated.
+        Pressures may also be a 2-D array, e.g. one row per scan.
         """
-        Altitudes = []
-        for pit in Pressures:
-            if (pit > 226.3206):  # < 11km
-                Altitude = 44.3307692307692 * \
-                           (1.0 - pow((pit / 1013.25), 0.190263235151657))
-            elif (pit > 54.7488):  # < 20km
-                Altitude = 11.0 - (6.34161998393947 * math.log(pit / 226.3206))
-            elif (pit > 8.680185):  # < 32km
-                Altitude = 20.0 - (216.65 * (1.0 - pow((pit / 54.7488),
-                                                       -0.0292712699464088)))
-            elif (pit > 1.109063):  # < 47km
-                Altitude = 32.0 - (81.6607142857143 *
-                                   (1.0 - pow((pit / 8.680185),
-                                              -0.0819595474499447)))
-            elif (pit > 0.6693885):  # < 51km
-                Altitude = 47.0 - (7.92226839904554 * math.log(pit / 1.109063))
-            elif (pit > 0.03956419):  # <71 km
-                Altitude = 51.0 + (96.6607142857143 *
-                                   (1.0 - pow((pit / 0.6693885),
-                                              (0.0819595474499447))))
-            elif (pit > 1.45742511874549E-03):  # 90 km
-                Altitude = 71.0 + (107.325 *
-                                   (1.0 - pow((pit / 0.03956419),
-                                              (5.85425338928176E-02))))
-            elif (pit > 5.8654139565495E-04):  # <95 km
-                Altitude = 84.852 - (5.47214624555127 *
-                                     math.log(pit / 0.003733834))
-            elif (pit > 2.40645796828482E-04):  # <100 km
-                Altitude = 95.0 - (140.597 *
-                                   (1.0 - pow((pit / 5.8654139565495E-04),
-                                              (-3.92234986852218E-02))))
-            elif (pit > 1.03251578598705E-04):  # <105 km
-                Altitude = 100.0 - (71.20438 *
-                                    (1.0 - pow((pit / 2.40645796828482E-04),
-                                               (-8.02032717123127E-02))))
-            elif (pit > 4.81695302325482E-05):  # <110 km
-                Altitude = 105.0 - (33.46154 *
-                                    (1.0 - pow((pit / 1.03251578598705E-04),
-                                               (-0.18265269904593))))
-            else:
-                if (pit <= 0):
-                    pit = 0.000001
-                Altitude = 110.0 - (20.0 *
-                                    (1.0 - pow((pit / 4.81695302325482E-05),
-                                               (-0.351255203356906))))
-
-            Altitudes.append(Altitude)
-
-        return Altitudes
+        Pressures = numpy.asarray(Pressures, dtype=numpy.float64)
+        if Pressures.ndim == 2:
+            # Only convert each distinct set of pressures once
+            [Unique, inverse] = numpy.unique(Pressures, axis=0,
+                                             return_inverse=True)
+            return numpy.array([self.Pressure2KmArray(row)
+                                for row in Unique])[inverse.reshape(-1)]
+
+        key = Pressures.tobytes()
+        if key in self._altitudeCache:
+            self._altitudeCache.move_to_end(key)
+            return self._altitudeCache[key].copy()
+
+        Altitudes = pressure2km(Pressures)
+        self._altitudeCache[key] = Altitudes
+        if len(self._altitudeCache) > 64:
+            self._altitudeCache.popitem(last=False)
+
+        return Altitudes.copy()
+
+
+# Standard atmosphere layers used to convert pressure to altitude. Each row is
+# the pressure at the bottom of the layer (hPa) and the altitude conversion
+# for pressures in that layer, in the order they are checked:
+#     [bottom, base, scale, P0, exponent]
+# If exponent is None, Altitude = base + scale * log(p / P0)
+# otherwise Altitude = base + scale * (1 - (p / P0)**exponent)
+PRESSURE_LAYERS = [
+    [226.3206, 0.0, 44.3307692307692, 1013.25, 0.190263235151657],  # < 11km
+    [54.7488, 11.0, -6.34161998393947, 226.3206, None],  # < 20km
+    [8.680185, 20.0, -216.65, 54.7488, -0.0292712699464088],  # < 32km
+    [1.109063, 32.0, -81.6607142857143, 8.680185,
+     -0.0819595474499447],  # < 47km
+    [0.6693885, 47.0, -7.92226839904554, 1.109063, None],  # < 51km
+    [0.03956419, 51.0, 96.6607142857143, 0.6693885,
+     0.0819595474499447],  # <71 km
+    [1.45742511874549E-03, 71.0, 107.325, 0.03956419,
+     5.85425338928176E-02],  # 90 km
+    [5.8654139565495E-04, 84.852, -5.47214624555127, 0.003733834,
+     None],  # <95 km
+    [2.40645796828482E-04, 95.0, -140.597, 5.8654139565495E-04,
+     -3.92234986852218E-02],  # <100 km
+    [1.03251578598705E-04, 100.0, -71.20438, 2.40645796828482E-04,
+     -8.02032717123127E-02],  # <105 km
+    [4.81695302325482E-05, 105.0, -33.46154, 1.03251578598705E-04,
+     -0.18265269904593],  # <110 km
+    [-numpy.inf, 110.0, -20.0, 4.81695302325482E-05,
+     -0.351255203356906],  # >= 110 km
+]
+
+# Layer bottoms in increasing order, for numpy.searchsorted
+LAYER_BOTTOMS = numpy.array([layer[0] for layer in PRESSURE_LAYERS[-2::-1]])
+
+
+def pressure2km(Pressures):
+    """
+    Convert an array of pressures (hPa) to altitudes (km). A pressure is in
+    the first layer in PRESSURE_LAYERS whose bottom it is greater than.
+    """
+    Pressures = numpy.asarray(Pressures, dtype=numpy.float64)
+    Altitudes = numpy.empty_like(Pressures)
+
+    # Number of layer bottoms the pressure is greater than determines the
+    # layer. NaN pressures end up in the first layer and give NaN altitudes.
+    layer = len(LAYER_BOTTOMS) - numpy.searchsorted(LAYER_BOTTOMS, Pressures)
+
+    for i in numpy.unique(layer):
+        [bottom, base, scale, P0, exponent] = PRESSURE_LAYERS[i]
+        pit = Pressures[layer == i]
+        if i == len(PRESSURE_LAYERS) - 1:
+            pit = numpy.where(pit <= 0, 0.000001, pit)
+        if exponent is None:
+            Altitudes[layer == i] = base + scale * numpy.log(pit / P0)
+        else:
+            Altitudes[layer == i] = base + scale * \
+                (1.0 - numpy.power(pit / P0, exponent))
+
+    return Altitudes
 
 
 if __name__ == "__main__":
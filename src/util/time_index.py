@@ -0,0 +1,117 @@
+###############################################################################
+# This class keeps the times of the scans in a flight, in scan order, so that
+# the scan nearest a time, or the scans in a time range, can be found with a
+# binary search instead of by looping through flightData.
+#
+# Times are seconds since midnight. As in Curtain.addTime(), a time less
+# than the time of the first scan is assumed to be after midnight and has
+# 86400 added, so the times keep increasing through a flight that crosses
+# midnight. Times passed to the lookup functions are handled the same way.
+#
+# Scans are added one at a time as they are archived, so the index is kept
+# up to date in real-time mode without being rebuilt.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import math
+from bisect import bisect_left, bisect_right
+from lib.logger import MTPlogger
+
+logger = MTPlogger("EOLlogger")
+
+
+class TimeIndex():
+
+    def __init__(self, times=None):
+        """ times is an optional list of scan times to start the index with """
+        self._times = []  # Scan times, with midnight rollover added
+        self._warned = False  # Warned that times are out of order
+        if times is not None:
+            self.extend(times)
+
+    def __len__(self):
+        return len(self._times)
+
+    def clear(self):
+        """ Remove all times from the index """
+        self._times = []
+        self._warned = False
+
+    def rollover(self, time):
+        """ Add a day to time if it is before the time of the first scan """
+        if len(self._times) > 0 and time < self._times[0]:
+            time = time + 86400
+        return time
+
+    def addTime(self, time):
+        """
+        Add the time of the next scan, in seconds since midnight. Returns the
+        time with any midnight rollover added.
+        """
+        if time is None or math.isnan(time):
+            # Keep the index sorted by giving a scan without a valid time the
+            # time of the scan before it.
+            time = self._times[-1] if len(self._times) > 0 else 0
+        time = self.rollover(time)
+
+        if len(self._times) > 0 and time < self._times[-1] and \
+           not self._warned:
+            logger.warning("Scan " + str(len(self._times)) + " is earlier " +
+                           "than the scan before it. Finding scans by time " +
+                           "may give the wrong scan.")
+            self._warned = True
+
+        self._times.append(time)
+        return time
+
+    def extend(self, times):
+        """ Add the times of a list of scans """
+        for time in times:
+            self.addTime(time)
+
+    def getTime(self, index):
+        """ Return the time of the scan at index, with rollover added """
+        return self._times[index]
+
+    def getIndex(self, time):
+        """
+        Return the index of the scan nearest to time. If time is halfway
+        between two scans, return the earlier one. Returns None if there are
+        no scans.
+        """
+        if len(self._times) == 0:
+            return None
+
+        time = self.rollover(time)
+        index = bisect_left(self._times, time)
+        if index == len(self._times):
+            return index - 1
+        if index > 0 and \
+           time - self._times[index - 1] <= self._times[index] - time:
+            return index - 1
+        return index
+
+    def findTime(self, time, rollover=True):
+        """
+        Return the index of the first scan at time, or None if none is. If
+        rollover is False, time is looked up as it is, e.g. when it already
+        counts the days since the first scan.
+        """
+        if rollover:
+            time = self.rollover(time)
+        index = bisect_left(self._times, time)
+        if index < len(self._times) and self._times[index] == time:
+            return index
+        return None
+
+    def getRange(self, start, end):
+        """
+        Return a slice of the indices of the scans from time start to time
+        end, inclusive.
+        """
+        start = self.rollover(start)
+        end = self.rollover(end)
+        return slice(bisect_left(self._times, start),
+                     bisect_right(self._times, end))
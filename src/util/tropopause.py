@@ -277,10 +277,15 @@ class Tropopause():
                 # loop until find measurement that is 2km above possible
                 # tropopause or more, and save the level just below that (so
                 # level is measurement just below top of our 2km layer.
-                for startidx in range(LT+1, self.NUM_RETR_LVLS):
+                for startidx in range(LT+1, self.NUM_RETR_LVLS-1):
                     if ((self.altc[startidx+1] - self.altc[LT]) >
                             self.referenceLayerThickness):
                         break
+                else:
+                    # Ran out of RAOB before the top of the 2km layer; no
+                    # tropopause found
+                    startidx = LT
+                    return startidx, numpy.nan, numpy.nan, numpy.nan
 
                 # Interpolate to get value at exactly 2km and calc lapse rate
                 # to that level
@@ -318,3 +323,293 @@ class Tropopause():
 
         # Return index to level of tropopause; zero indicated none found
         return [startidx, LT, altctrop, tempctrop]
+
+
+class TropopauseBatch():
+
+    def __init__(self, Temperatures, Altitudes):
+        """
+        Find the tropopauses of many profiles at once. Follows the same steps
+        as Tropopause, with each step done for all the profiles that are at
+        that step, so the results are the same as running Tropopause on each
+        profile.
+
+        Temperatures and Altitudes are (N, NUM_RETR_LVLS) arrays, e.g. from
+        Retriever.retrieve_batch()
+        """
+        self.tempc = numpy.asarray(Temperatures, dtype=numpy.float64)
+        self.altc = numpy.asarray(Altitudes, dtype=numpy.float64)
+        self.NUM_RETR_LVLS = self.altc.shape[1]
+        self.levels = numpy.arange(self.NUM_RETR_LVLS)
+
+        # Same constants as Tropopause
+        self.referenceLapseRate = -2  # -2K/km; beginning of a tropopause
+        self.referenceLayerThickness = 2  # 2km
+        self.minHt = 5.6  # Lowest alt to look for tropopause (500mb = 5.6km)
+        self.step = 0.02
+
+        # Linear lapse rate between each pair of consecutive levels, and
+        # whether it meets the reference lapse rate cutoff
+        with numpy.errstate(all='ignore'):
+            lapseRate = (self.tempc[:, 1:] - self.tempc[:, :-1]) / \
+                        (self.altc[:, 1:] - self.altc[:, :-1])
+            self.lapseRate = lapseRate
+            self.meetsLapseRate = \
+                (self.altc[:, 1:] != self.altc[:, :-1]) & \
+                (lapseRate >= self.referenceLapseRate)
+
+    def first(self, mask):
+        """
+        Return the index of the first True along the last axis of mask and
+        whether there was one.
+        """
+        return [numpy.argmax(mask, axis=-1), mask.any(axis=-1)]
+
+    def Tinterp(self, rows, altInterp, startidx):
+        """
+        Find the temperature at the given altitudes by linear interpolation.
+        Vectorized version of Tropopause.Tinterp()
+            Inputs:
+                rows      - index of the profile for each altitude
+                altInterp - altitudes to interpolate temperature to
+                startidx  - index of the starting point to find the first
+                            measurement above each interpolation point.
+            rows, altInterp and startidx must all have the same shape.
+        """
+        altc = self.altc[rows]
+        tempc = self.tempc[rows]
+
+        # starting at startidx, find first measurement above altInterp
+        [i, found] = self.first((altc >= altInterp[..., numpy.newaxis]) &
+                                (self.levels >= startidx[..., numpy.newaxis]))
+        i = i[..., numpy.newaxis]
+
+        # Interpolate temperature
+        altTop = numpy.take_along_axis(altc, i, axis=-1)[..., 0]
+        altBot = numpy.take_along_axis(altc, i - 1, axis=-1)[..., 0]
+        tempTop = numpy.take_along_axis(tempc, i, axis=-1)[..., 0]
+        tempBot = numpy.take_along_axis(tempc, i - 1, axis=-1)[..., 0]
+        with numpy.errstate(all='ignore'):
+            temp = tempBot + ((tempTop - tempBot) * (altInterp - altBot) /
+                              (altTop - altBot))
+
+        # Don’t interpolate between bottom two layers, or if ran out of RAOB
+        with numpy.errstate(invalid='ignore'):
+            return numpy.where((altInterp <= altc[..., 1] + 0.01) | ~found,
+                               numpy.nan, temp)
+
+    def linearLapseRate(self, rows, startidx):
+        """
+        Find the first linear lapse rate at or above startidx that meets or
+        crosses the reference lapse rate cutoff. Vectorized version of
+        Tropopause.linearLapseRate()
+
+        Returns [lapseRate, i] where i is the bottom of the layer. If none is
+        found, lapseRate is NaN and i is NUM_RETR_LVLS.
+        """
+        [i, found] = self.first(
+            self.meetsLapseRate[rows] &
+            (self.levels[:-1] >= startidx[:, numpy.newaxis]))
+        lapseRate = numpy.where(found, self.lapseRate[rows, i], numpy.nan)
+        i = numpy.where(found, i, self.NUM_RETR_LVLS)
+        return [lapseRate, i]
+
+    def averageLapseRate(self, rows, LT, step, startidx):
+        """
+        Find the average lapse rate from LT to the top of a 2km layer that is
+        divided into sub-layers of width step. Vectorized version of
+        Tropopause.averageLapseRate()
+        """
+        nlayers = int(self.referenceLayerThickness // step)
+
+        # Temperature at the top of each sub-layer. The bottom of each
+        # sub-layer is the top of the one before.
+        altTop = self.altc[rows, LT][:, numpy.newaxis] + \
+            step * numpy.arange(nlayers)
+        tempTop = self.Tinterp(
+            numpy.broadcast_to(rows[:, numpy.newaxis], altTop.shape), altTop,
+            numpy.broadcast_to(startidx[:, numpy.newaxis], altTop.shape))
+        tempBot = numpy.concatenate([tempTop[:, 0:1], tempTop[:, :-1]],
+                                    axis=1)
+
+        # Running total of temperature difference, summed in the same order
+        # as Tropopause
+        deltaTsum = numpy.add.accumulate(tempTop - tempBot, axis=1)[:, -1]
+        LRavg = deltaTsum / (step * nlayers)
+
+        # Ran out of RAOB; didn't find tropopause
+        return numpy.where(numpy.isnan(tempTop).any(axis=1), numpy.nan, LRavg)
+
+    def findGap(self, rows, LT, step, startidx, nsteps=64):
+        """
+        Find the altitude above the tropopause at LT where the lapse rate
+        over the next 2km is -3K/km or less, stepping up step km at a time.
+        Vectorized version of Tropopause.findGap(). Steps are tested nsteps
+        at a time.
+
+        Returns altBot, or NaN if no gap was found.
+        """
+        endLapseRate = -3  # -3K/km; end of a tropopause
+        result = numpy.full(len(rows), numpy.nan)
+        altStart = self.altc[rows, LT]
+        todo = numpy.arange(len(rows))
+
+        while len(todo) > 0:
+            # Step up by repeatedly adding step, as Tropopause does, so the
+            # altitudes are identical
+            increments = numpy.full((len(todo), nsteps), float(step))
+            increments[:, 0] = altStart[todo]
+            altBot = numpy.add.accumulate(increments, axis=1)
+            altTop = altBot + self.referenceLayerThickness
+
+            shape = altBot.shape
+            r = numpy.broadcast_to(rows[todo][:, numpy.newaxis], shape)
+            s = numpy.broadcast_to(startidx[todo][:, numpy.newaxis], shape)
+            tempBot = self.Tinterp(r, altBot, s)
+            tempTop = self.Tinterp(r, altTop, s)
+            LRavg = (tempTop - tempBot) / self.referenceLayerThickness
+            LRavg[numpy.isnan(tempTop)] = numpy.nan
+
+            # First step where lapse rate is missing or -3K/km or less
+            with numpy.errstate(invalid='ignore'):
+                [k, done] = self.first(~(LRavg > endLapseRate))
+            kLR = LRavg[numpy.arange(len(todo)), k]
+            gap = done & ~numpy.isnan(kLR)
+            result[todo[gap]] = altBot[gap, k[gap]] + step
+
+            altStart[todo] = altBot[:, -1] + step
+            todo = todo[~done]
+
+        return result
+
+    def findStart(self, rows, startidx, minAlt):
+        """
+        Locate the first retrieval above startidx that is above minAlt.
+        Returns -1 if there isn't one. Vectorized version of
+        Tropopause.findStart()
+        """
+        with numpy.errstate(invalid='ignore'):
+            [i, found] = self.first(
+                (self.levels > startidx[:, numpy.newaxis]) &
+                (self.altc[rows] > minAlt[:, numpy.newaxis]))
+        return numpy.where(found, i, -1)
+
+    def findTropopause(self, rows, startidx):
+        """
+        Find the next tropopause of each profile in rows, starting from
+        startidx. Vectorized version of Tropopause.findTropopause()
+
+        Returns [startidx, LT, altctrop, tempctrop] arrays. LT, altctrop and
+        tempctrop are NaN if no tropopause was found.
+        """
+        n = len(rows)
+        startidx = numpy.array(startidx, dtype=int)
+        LT = startidx.copy()
+        outStart = startidx.copy()
+        LTtrop = numpy.full(n, numpy.nan)
+        altctrop = numpy.full(n, numpy.nan)
+        tempctrop = numpy.full(n, numpy.nan)
+        active = numpy.ones(n, dtype=bool)
+
+        # Looking for a second or greater tropopause. Locate lowest layer
+        # above gap between tropopauses, then the first retrieval above it.
+        second = numpy.flatnonzero(startidx != 0)
+        if len(second) > 0:
+            altBot = self.findGap(rows[second], LT[second], self.step,
+                                  startidx[second])
+            nogap = numpy.isnan(altBot)
+            active[second[nogap]] = False
+            startidx[second] = self.findStart(rows[second], startidx[second],
+                                              altBot)
+            nostart = ~nogap & (startidx[second] == -1)
+            outStart[second[nostart]] = -1
+            active[second[nostart]] = False
+
+        # Looking for the first tropopause. Locate first retrieval above
+        # lowest altitude to look for tropopause.
+        first = numpy.flatnonzero(startidx == 0)
+        if len(first) > 0:
+            startidx[first] = self.findStart(rows[first], startidx[first],
+                                             numpy.full(len(first),
+                                                        self.minHt))
+            nostart = startidx[first] == -1
+            outStart[first[nostart]] = -1
+            active[first[nostart]] = False
+
+        while active.any():
+            a = numpy.flatnonzero(active)
+            r = rows[a]
+
+            # Find the index (LT) of the lowest level at which the linear
+            # lapse rate decreases to 2K/km or less.
+            [LRavg, LT[a]] = self.linearLapseRate(r, startidx[a])
+            fail = numpy.isnan(LRavg)
+            outStart[a[fail]] = LT[a[fail]]
+            active[a[fail]] = False
+            [a, r] = [a[~fail], r[~fail]]
+
+            # If next higher measurement is more than 2km, then all we can
+            # calc is the linear lapse rate, which meets the cutoff.
+            near = self.altc[r, LT[a] + 1] - self.altc[r, LT[a]] < \
+                self.referenceLayerThickness
+            found = a[~near]
+            [a, r] = [a[near], r[near]]
+
+            # Find the measurement just below the top of the 2km layer. If
+            # the profile ends first, ran out of RAOB; no tropopause found.
+            altDiff = self.altc[r, 1:] - self.altc[r, LT[a]][:, numpy.newaxis]
+            with numpy.errstate(invalid='ignore'):
+                [s, ok] = self.first(
+                    (altDiff > self.referenceLayerThickness) &
+                    (self.levels[:-1] >= LT[a][:, numpy.newaxis] + 1))
+            outStart[a[~ok]] = LT[a[~ok]]
+            active[a[~ok]] = False
+            startidx[a[ok]] = s[ok]
+            [a, r] = [a[ok], r[ok]]
+
+            # Interpolate to get value at exactly 2km and calc lapse rate
+            # to that level, then check lapse rate from LT to each of 100
+            # sub-layers.
+            for step in [self.referenceLayerThickness, self.step]:
+                LRavg = self.averageLapseRate(r, LT[a], step, startidx[a])
+                fail = numpy.isnan(LRavg)
+                outStart[a[fail]] = LT[a[fail]]
+                active[a[fail]] = False
+                # Profiles that fail the WMO criteria try again from startidx
+                keep = ~fail & ~(LRavg < self.referenceLapseRate)
+                [a, r] = [a[keep], r[keep]]
+
+            found = numpy.concatenate([found, a])
+            active[found] = False
+            outStart[found] = LT[found]
+            LTtrop[found] = LT[found]
+            altctrop[found] = self.altc[rows[found], LT[found]]
+            tempctrop[found] = self.tempc[rows[found], LT[found]]
+
+        return [outStart, LTtrop, altctrop, tempctrop]
+
+    def findTropopauses(self):
+        """
+        Find the first and second tropopause of every profile, as
+        MTPclient.getProfile() does for a single profile.
+
+        Returns a dictionary of (N, 2) arrays 'idx', 'altc' and 'tempc'. A
+        tropopause that was not found is NaN.
+        """
+        N = len(self.altc)
+        trop = {'idx': numpy.full((N, 2), numpy.nan),
+                'altc': numpy.full((N, 2), numpy.nan),
+                'tempc': numpy.full((N, 2), numpy.nan)}
+        rows = numpy.arange(N)
+
+        [startidx, trop['idx'][:, 0], trop['altc'][:, 0],
+         trop['tempc'][:, 0]] = self.findTropopause(rows, numpy.zeros(N, int))
+
+        # If found a tropopause, look for a second one, starting at the
+        # previous index
+        second = ~numpy.isnan(trop['idx'][:, 0])
+        [startidx, trop['idx'][second, 1], trop['altc'][second, 1],
+         trop['tempc'][second, 1]] = self.findTropopause(rows[second],
+                                                         startidx[second])
+
+        return trop
@@ -7,24 +7,26 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
+import json
 import socket
 import numpy
 import logging
 import argparse
 from util.readmtp import readMTP
 from util.readiwg import IWG
+from util.raw_tail import RawTail
 from util.decodePt import decodePt
 from util.decodeM01 import decodeM01
 from util.decodeM02 import decodeM02
 from util.calcTBs import BrightnessTemperature
 from util.retriever import Retriever
+from util.retrieval_cache import RetrievalCache
 from util.tropopause import Tropopause
 from lib.rootdir import getrootdir
 from lib.config import config
-from EOLpython.util.fileselector import FileSelector
-from EOLpython.Qlogger.messageHandler import QLogger
+from lib.logger import MTPlogger
 
-logger = QLogger("EOLlogger")
+logger = MTPlogger("EOLlogger")
 
 
 class MTPclient():
@@ -38,6 +40,13 @@ class MTPclient():
         # retrievals can be performed.
         self._retrievalFlag = True
 
+        # Cache of retrieval results on disk, set up with the retriever
+        self.retrievalCache = None
+
+        # Brightness temperature calibration, built from the config file
+        # when it is first needed
+        self.calibration = None
+
     def config(self, configfile_name):
         """ Read in config file and set up a bunch of stuff """
         self.configfile_name = configfile_name
@@ -84,10 +93,19 @@ class MTPclient():
         parser.add_argument(
             '--rt', dest='realtime', action='store_const', const=True,
             default=False, help='Run in real-time monitoring mode.')
+        parser.add_argument(
+            '--follow', type=str, nargs='?', const='', default=None,
+            help='Run in real-time monitoring mode, reading scans from a ' +
+            '.RAW file as it is written instead of from the UDP feed. ' +
+            'Defaults to the newest file in rawdir.')
 
         # Parse the command line arguments
         args = parser.parse_args()
 
+        # Following a .RAW file is a real-time mode
+        if args.follow is not None:
+            args.realtime = True
+
         return args
 
     def initIWG(self):
@@ -109,6 +127,7 @@ class MTPclient():
     def readConfig(self, filename):
         # Initialize a config file (includes reading it)
         self.configfile = config(filename)
+        self.calibration = None  # Rebuilt from the new config when needed
 
         # view_send_port is port from viewer to MTP
         self.udp_send_port = self.configfile.getInt('view_send_port')
@@ -129,6 +148,26 @@ class MTPclient():
         # List of RCF files, if defined
         self.filelist = self.configfile.getVal('filelist')
 
+        # Size and weight tolerance of the cache of weighted average RC sets,
+        # if defined
+        self.RCAvgWtCacheSize = self.configfile.getVal('RCAvgWt_cache_size')
+        self.RCAvgWtCacheTolerance = \
+            self.configfile.getVal('RCAvgWt_cache_tolerance')
+
+        # Number of best matching templates to rank for each scan
+        self.RCFTopK = self.configfile.getVal('RCF_top_k')
+
+        # Number of processes used to read a .RAW file
+        self.ingestWorkers = int(self.configfile.getVal('ingest_workers'))
+
+        # Number of processes used to do the retrievals for a flight
+        self.retrievalWorkers = \
+            int(self.configfile.getVal('retrieval_workers'))
+
+        # Size of the cache of retrieval results on disk, in MB
+        self.retrievalCacheSize = \
+            float(self.configfile.getVal('retrieval_cache_size'))
+
     def checkRCF(self):
         """
         Check if RCFdir exists. If not, prompt user to select correct RCFdir
@@ -140,7 +179,9 @@ class MTPclient():
                          "path")
             # Launch a file selector for user to select correct RCFdir
             # This should really be done in MTPviewer, with a non-GUI option
-            # for command-line mode.
+            # for command-line mode. Imported here so the client can be used
+            # without a GUI.
+            from EOLpython.util.fileselector import FileSelector
             self.loader = FileSelector()
             self.loader.set_filename("loadRCFdir", getrootdir())
             self.RCFdir = os.path.join(getrootdir(), self.loader.get_file())
@@ -183,6 +224,45 @@ class MTPclient():
         except Exception:
             raise
 
+        # Configure the RC set cache. Unset values keep their defaults.
+        self.retriever.rcf_set.setRCAvgWtCache(self.RCAvgWtCacheSize,
+                                               self.RCAvgWtCacheTolerance)
+
+        # Rank every template unless the project only wants the few best.
+        # Only the best template is used for the retrieval.
+        self.retriever.rcf_set.setTopK(self.RCFTopK)
+
+        self.initRetrievalCache()
+
+    def initRetrievalCache(self):
+        """
+        Set up the cache of retrieval results, next to the RC directory,
+        e.g. /path/to/RC.retrievals. Results are only reused for the same RCF
+        files and retrieval settings. The cache is used when a whole flight
+        is processed with proc/retrieve.py, not by createProfile().
+        """
+        if self.retrievalCacheSize <= 0:
+            self.retrievalCache = None
+            return
+
+        identity = json.dumps([
+            self.retriever.rcf_set.getCacheKey(self.RCFdir, self.filelist),
+            self.RCFTopK, self.RCAvgWtCacheSize, self.RCAvgWtCacheTolerance])
+        self.retrievalCache = RetrievalCache(
+            os.path.normpath(self.RCFdir) + ".retrievals",
+            int(self.retrievalCacheSize * 1000000), identity)
+
+    def reportRetrievalCache(self):
+        """
+        Save the new results in the retrieval cache, and log how many scans
+        were found in it since the last report
+        """
+        if self.retrievalCache is None:
+            return
+        self.retrievalCache.flush()
+        logger.info("Retrieval cache: " + self.retrievalCache.getStats())
+        self.retrievalCache.resetStats()
+
     def setRCFdir(self, Dir):
         """ Only used during testing """
         self.RCFdir = os.path.join(getrootdir(), Dir)
@@ -202,35 +282,72 @@ class MTPclient():
         # Remove everything from flightData
         self.reader.clearFlightData()
 
-        # Delete the JSON file on disk
+        # Delete the JSON file and flight store on disk
         self.reader.removeJSON(self.getMtpRealTimeFilename())
+        self.reader.removeStore(self.getFlightStoreFilename())
 
     def saveData(self):
         """
-        Save current record to flight dictionaries and to JSON file on disk
+        Save current record to flight dictionaries and to flight store on disk
         """
         # Append to array of dictionaries that holds entire flight
         self.reader.archive()
 
-        # Append to JSON file on disk
-        self.reader.save(self.getMtpRealTimeFilename())
+        # Append to flight store on disk
+        self.reader.saveToStore(self.getFlightStoreFilename())
 
-    def getMtpRealTimeFilename(self):
+    def saveRecords(self, records):
         """
-        Automatically generate JSON filename that includes the project and
-        flight number.
+        Save records that have already been processed, e.g. by a worker
+        process, to flight dictionaries and to flight store on disk
         """
+        self.reader.archiveRecords(records)
+        self.reader.saveRecordsToStore(self.getFlightStoreFilename(), records)
+
+    def exportData(self):
+        """ Write the flight dictionaries to the JSON file on disk """
+        self.reader.exportJSON(self.getMtpRealTimeFilename())
 
+    def getRealTimeDir(self):
+        """ Return the dir the JSON file and flight store are written to """
         # Prepend the projdir to jsondir so jsondir is relative to projdir
         projdir = self.configfile.getProjDir()
         jsondir = self.configfile.prependDir('json_file', projdir)
 
         # Default to projdir if jsondir is not set
         if jsondir is None:
-            return self.reader.getJson(projdir, self.getProj(),
-                                       self.getFltno())
+            return projdir
+
+        return jsondir
+
+    def getMtpRealTimeFilename(self):
+        """
+        Automatically generate JSON filename that includes the project and
+        flight number.
+        """
+        return self.reader.getJson(self.getRealTimeDir(), self.getProj(),
+                                   self.getFltno())
+
+    def getFlightStoreFilename(self):
+        """
+        Automatically generate flight store filename that includes the
+        project and flight number.
+        """
+        return self.reader.getStore(self.getRealTimeDir(), self.getProj(),
+                                    self.getFltno())
 
-        return self.reader.getJson(jsondir, self.getProj(), self.getFltno())
+    def getRestartFilename(self):
+        """
+        Return the name of the file to reload previous data for this flight
+        from. Older versions only wrote a JSON file, so if there is no flight
+        store yet, convert the JSON file so that new scans are added to it.
+        """
+        storefile = self.getFlightStoreFilename()
+        jsonfile = self.getMtpRealTimeFilename()
+        if (not os.path.exists(storefile + '.idx') and
+           os.path.isfile(jsonfile)):
+            self.reader.convertJSON(jsonfile, storefile)
+        return storefile
 
     def processScan(self):
         """
@@ -265,8 +382,14 @@ class MTPclient():
             raise  # Pass error back up to calling function
 
         # If retrieval succeeded, get the physical temperature profile (and
-        # find the tropopause). Save everything to current rawscan dictionary
-        self.reader.saveBestWtdRCSet(self.BestWtdRCSet)
+        # find the tropopause). Save everything to current rawscan dictionary.
+        # Only a reference to the RC set is saved with the scan. The RCs are
+        # rebuilt from the RCF set when needed.
+        if self.BestWtdRCSet:
+            self.reader.saveBestWtdRCSet(
+                self.retriever.rcf_set.compactRCSet(self.BestWtdRCSet))
+        else:
+            self.reader.saveBestWtdRCSet(self.BestWtdRCSet)
 
         self.ATP = self.getProfile(self.getTBI(), self.BestWtdRCSet)
         self.reader.saveATP(self.ATP)
@@ -274,8 +397,14 @@ class MTPclient():
         return True
 
     def getBestWtdRCSet(self):
-        """ Return the best weighted RC set """
-        return self.reader.getBestWtdRCSet()
+        """
+        Return the best weighted RC set. Scans only hold a reference to the
+        set, so rebuild the RCs from the RCF set.
+        """
+        BestWtdRCSet = self.reader.getBestWtdRCSet()
+        if not BestWtdRCSet or self._retrievalFlag is False:
+            return BestWtdRCSet
+        return self.retriever.rcf_set.expandRCSet(BestWtdRCSet)
 
     def getATP(self):
         """ Return the ATP profile and metadata """
@@ -331,8 +460,9 @@ class MTPclient():
         """
         Return the contents of the Bline, which contains:
             MTP Scan Counts[Angle, Channel]
+        as integers
         """
-        vals = self.reader.getVar('Bline', 'SCNT')
+        vals = self.reader.getTypedVar('Bline', 'SCNT')
         return (vals)
 
     def getTB(self):
@@ -351,7 +481,7 @@ class MTPclient():
         """
         rawscan = self.reader.getRawscan()
         Tifa = rawscan['Ptline']['values']['TMIXCNTP']['temperature']
-        OAT = rawscan['Aline']['values']['SAAT']['val']  # Kelvin
+        OAT = self.reader.getTypedVar('Aline', 'SAAT')  # Kelvin
 
         # Check if self.configfile exists. If not, call readConfig.
         try:
@@ -359,12 +489,98 @@ class MTPclient():
         except NameError:
             self.readConfig(self.configfile_name)
 
-        tb = BrightnessTemperature(self.configfile)
-
         # Calculate the brightness temperatures for the latest scan counts
         # and save them back to the MTP data dictionary.
         rawscan['Bline']['values']['SCNT']['tb'] = \
-            tb.TBcalculationRT(Tifa, OAT, self.getSCNT())
+            self.getCalibration().TBcalculationRT(Tifa, OAT, self.getSCNT())
+
+    def getCalibration(self):
+        """
+        Return the brightness temperature calibration for the config file.
+        It is only built once, rather than for every scan.
+        """
+        if self.calibration is None:
+            self.calibration = BrightnessTemperature(self.configfile)
+        return self.calibration
+
+    def calcFlightTB(self, calibration=None):
+        """
+        Calculate the brightness temperatures for every scan in flightData at
+        once, and return them as an (N, NUM_CHANNELS * NUM_SCAN_ANGLES) array
+        ordered as the scan counts. flightData is not changed.
+
+        The mixer temperatures, OATs and scan counts are read from the
+        columns of the flight table, so the scans of a flight that was
+        loaded from disk don't have to be decoded.
+
+        calibration defaults to the one from the config file. Pass a
+        BrightnessTemperature with different gain constants (see
+        setGainConstants()) to see how they would change the flight.
+        """
+        if calibration is None:
+            calibration = self.getCalibration()
+
+        Tifa = self.reader.getColumn('Ptline', 'TMIXCNTP', 'temperature')
+        OAT = self.reader.getColumn('Aline', 'SAAT')
+        scnt = self.reader.getColumn('Bline', 'SCNT')
+        if Tifa is None or OAT is None or scnt is None:
+            # No scans have been read
+            return numpy.empty((0, self.NUM_CHANNELS * self.NUM_SCAN_ANGLES))
+
+        return calibration.TB_batch(Tifa, OAT, scnt)
+
+    def recalibrateFlight(self, calibration=None):
+        """
+        Recalculate the brightness temperatures of every scan in flightData
+        with calcFlightTB(), e.g. after a tbfit has given new gain constants,
+        and save them, and the inverted brightness temperatures used by the
+        retrievals, to the scans and the flight store. Any profiles already
+        retrieved for the scans are left as they are, so process the flight
+        again afterwards.
+
+        If calibration is given, it is also used for the scans read after
+        this.
+        """
+        if calibration is not None:
+            self.calibration = calibration
+        tbs = self.calcFlightTB()
+
+        # Invert each scan from [angle, channel] to [channel, angle], as
+        # invertArray() does
+        tbis = tbs.reshape(-1, self.NUM_SCAN_ANGLES, self.NUM_CHANNELS)
+        tbis = tbis.transpose(0, 2, 1).reshape(len(tbs), -1)
+
+        storefile = self.getFlightStoreFilename()
+        for index in range(len(tbs)):
+            self.reader.setRawscan(index)
+            rawscan = self.reader.getRawscan()
+            rawscan['Bline']['values']['SCNT']['tb'] = tbs[index].tolist()
+            self.reader.saveTBI(tbis[index].tolist())
+            self.reader.updateStore(storefile, index)
+        self.reader.resetRawscan()
+
+    def updateCalibration(self):
+        """
+        Read the gain constants GOF and GEC from the config file again. If
+        they have changed, e.g. because the results of a tbfit were copied
+        to the config file, use them and recalibrate the flight with
+        recalibrateFlight(). Returns True if the flight was recalibrated.
+        """
+        projConfig = config(self.configfile.yamlfile)
+        GOF = projConfig.getVal('GOF')
+        GEC = projConfig.getVal('GEC')
+
+        calibration = self.getCalibration()
+        if calibration.hasGainConstants(GOF, GEC):
+            return False
+
+        logger.info("Gain constants in " + self.configfile.yamlfile +
+                    " have changed. Recalculating brightness temperatures")
+        self.configfile.setVal('GOF', GOF)
+        self.configfile.setVal('GEC', GEC)
+        calibration.setGainConstants(GOF, GEC)
+        self.recalibrateFlight()
+        return True
 
     def invertArray(self, array):
         """
@@ -375,18 +591,17 @@ class MTPclient():
         and the final data are output as {c1a1,c1a2,c1a3,c1a4,...}.
         This function inverts the array[angle, channel] passed to it.
         """
+        # Scan counts from getSCNT() and scan brightness temperatures are
+        # already numbers. If the scan counts are passed in as strings,
+        # convert them to integers.
+        if len(array) > 0 and isinstance(array[0], str):
+            array = [int(val) for val in array]
+
         array_inv = [numpy.nan]*(self.NUM_SCAN_ANGLES * self.NUM_CHANNELS)
         for j in range(self.NUM_SCAN_ANGLES):
             for i in range(self.NUM_CHANNELS):
-                # The scan counts are passed in as a string, so convert them
-                # to integers. The scan brightness temperatures come in as
-                # float so leave them.
-                if (isinstance(array[j*self.NUM_CHANNELS+i], str)):
-                    array_inv[i*self.NUM_SCAN_ANGLES+j] = \
-                        int(array[j*self.NUM_CHANNELS+i])
-                else:
-                    array_inv[i*self.NUM_SCAN_ANGLES+j] = \
-                        array[j*self.NUM_CHANNELS+i]
+                array_inv[i*self.NUM_SCAN_ANGLES+j] = \
+                    array[j*self.NUM_CHANNELS+i]
         return array_inv
 
     def getProfile(self, tbi, BestWtdRCSet):
@@ -499,6 +714,53 @@ class MTPclient():
         except Exception:
             raise
 
+    def getNewestRawFile(self):
+        """
+        Return the file in rawdir that was written to most recently, or None
+        if there are no files in rawdir.
+        """
+        rawdir = self.configfile.getPath('rawdir')
+        rawfiles = [os.path.join(rawdir, filename)
+                    for filename in os.listdir(rawdir)
+                    if not filename.endswith('.idx')]
+        rawfiles = [filename for filename in rawfiles
+                    if os.path.isfile(filename)]
+        if len(rawfiles) == 0:
+            return None
+        return max(rawfiles, key=os.path.getmtime)
+
+    def followRaw(self, filename):
+        """ Read scans from a .RAW file as it is written (see readRawTail) """
+        self.rawTail = RawTail(filename)
+
+    def readRawTail(self):
+        """
+        Generator that reads the scans added to the .RAW file being followed
+        since the last call. Each scan is parsed and saved to the data
+        dictionary, as readSocket() and readSocketI() do, then yielded.
+        """
+        # When the viewer is restarted, the scans saved before the restart
+        # are reloaded, so skip them.
+        lastDate = None
+        if len(self.reader.flightData) > 0:
+            lastDate = self.reader.flightData[-1]['Aline']['date']
+
+        for rawscan in self.rawTail.readNewScans(self.reader):
+            if lastDate is not None and rawscan['Aline']['date'] <= lastDate:
+                continue
+
+            # Store IWG record to values field in data dictionary
+            self.iwg.parseIwgPacket(rawscan['IWG1line']['asciiPacket'],
+                                    self.getAsciiParms())
+
+            # Store MTP data to data dictionary
+            try:
+                self.reader.parseAsciiPacket(self.reader.getAsciiPacket())
+            except Exception:
+                continue
+
+            yield rawscan
+
     def close(self):
         """ Close UDP socket connections """
         # Close the connection to the MTP data stream
@@ -12,7 +12,7 @@ import datetime
 from PyQt6.QtWidgets import QMainWindow, QGridLayout, QWidget, \
         QPlainTextEdit, QFrame, QAction, QLabel, QPushButton, QGroupBox, \
         QLineEdit, QInputDialog
-from PyQt6.QtCore import QSocketNotifier, Qt
+from PyQt6.QtCore import QSocketNotifier, QTimer, Qt
 from PyQt6.QtGui import QFontMetrics, QFont
 from util.profile_structs import TropopauseRecord
 from util.ck_limits import MTPCkLimit
@@ -24,6 +24,10 @@ from EOLpython.Qlogger.messageHandler import QLogger
 
 logger = QLogger("EOLlogger")
 
+# How often to check for new scans when following a .RAW file (msec). The
+# MTP takes about 17 seconds per scan.
+RAW_TAIL_INTERVAL = 1000
+
 
 class MTPviewer(QMainWindow):
 
@@ -56,9 +60,13 @@ class MTPviewer(QMainWindow):
         # Create the GUI
         self.initUI()
 
-        # If GUI started in real-time mode, Connect to socket
+        # If GUI started in real-time mode, Connect to socket, or follow the
+        # .RAW file if asked to
         if self.args.realtime:
-            self.connectSocket()
+            if getattr(self.args, 'follow', None) is not None:
+                self.followRawFile(self.args.follow)
+            else:
+                self.connectSocket()
 
         # Process any events generated by the GUI so it stays responsive to the
         # user.
@@ -81,6 +89,26 @@ class MTPviewer(QMainWindow):
             self.client.getSocketFileDescriptorI(), QSocketNotifier.Read)
         self.readNotifierI.activated.connect(lambda: self.processIWG())
 
+    def followRawFile(self, filename):
+        """
+        Read scans from a .RAW file as it is written, e.g. by mtp_client,
+        instead of from the UDP feed, so scans lost on the network aren't
+        missed. If filename is empty, follow the newest file in rawdir.
+        """
+        if filename == '':
+            filename = self.client.getNewestRawFile()
+            if filename is None:
+                logger.error("No .RAW file to follow in " +
+                             self.client.configfile.getPath('rawdir'))
+                return
+        logger.info("Following " + filename)
+        self.client.followRaw(filename)
+
+        # Check for new scans every RAW_TAIL_INTERVAL msec
+        self.rawTailTimer = QTimer()
+        self.rawTailTimer.timeout.connect(lambda: self.processRawTail())
+        self.rawTailTimer.start(RAW_TAIL_INTERVAL)
+
     def loadJson(self, filename):
         # If there exists an mtpRealTime file with the same proj and fltno as
         # are in the config file, then assume we are restarting this code for
@@ -379,9 +407,10 @@ class MTPviewer(QMainWindow):
                               alignment=Qt.AlignRight)
         self.index = QLineEdit("")
         self.index.setFixedHeight(25)
+        self.index.setToolTip("Scan index, or time as HH:MM:SS")
         self.layout.addWidget(self.index, 3, 3, 1, 1)
         # Add button so user can jump to a specific scan by typing a scan
-        # index in the box and clicking "Go"
+        # index or time in the box and clicking "Go"
         go = QPushButton("Go")
         go.setFixedWidth(50)
         self.layout.addWidget(go, 3, 4, 1, 1, alignment=Qt.AlignVCenter)
@@ -481,8 +510,10 @@ class MTPviewer(QMainWindow):
     def close(self):
         """ Actions to take when Quit button is clicked """
         if self.args.realtime:  # GUI started in real-time mode
-            self.client.close()  # Close UDP connection
-            self.client.closeI()  # Close IWG connection
+            if getattr(self.args, 'follow', None) is None:
+                self.client.close()  # Close UDP connection
+                self.client.closeI()  # Close IWG connection
+            self.client.exportData()  # Save flight to JSON file
         else:                   # post-processing mode
             self.processor.closeRawFile()  # Close raw data file, if open
             self.processor.setQuit()  # Let processor know we want to quit
@@ -508,6 +539,34 @@ class MTPviewer(QMainWindow):
         except Exception:
             return
 
+        self.processNewScan()
+
+        self.updateDataDisplay()  # Update the display
+
+    def processRawTail(self):
+        """
+        Read the scans added to the .RAW file being followed since it was
+        last checked, process each one as processSocket() does, and update
+        the GUI once they are all processed.
+        """
+        count = 0
+        for rawscan in self.client.readRawTail():
+            self.processNewScan()
+            count = count + 1
+
+            # Process any events generated by the GUI so it stays responsive
+            # to the user while catching up.
+            self.app.processEvents()
+
+        if count > 0:
+            self.writeIWG()  # Display the latest IWG packet
+            self.updateDataDisplay()  # Update the display
+
+    def processNewScan(self):
+        """
+        Perform calcs on the scan just read, do the retrieval, and save the
+        scan to the flight
+        """
         # Perform calcs on raw MTP data - converts counts to brightness
         # temperatures and stores everything in a rawscan dictionary
         self.client.processScan()
@@ -524,8 +583,6 @@ class MTPviewer(QMainWindow):
         # and append to JSON file on disk
         self.client.saveData()
 
-        self.updateDataDisplay()  # Update the display
-
     def reportFailedRetrieval(self, err, index=None):
         msg = "Could not perform retrieval"
         if index is not None:
@@ -693,24 +750,32 @@ class MTPviewer(QMainWindow):
         """
 
         # Loop through previous data and add data from each record to
-        # 2-D arrays used by curtain plot
-        for index in range(len(self.client.reader.flightData)-1):
-            thisscan = self.client.reader.flightData[index]
-            time = thisscan['Aline']['values']['TIME']['val']
-            self.ACAlt = thisscan['Aline']['values']['SAPALT']['val']
+        # 2-D arrays used by curtain plot. The values are read from the
+        # flight table so that scans don't have to be decoded (see
+        # LazyFlightData).
+        reader = self.client.reader
+        times = reader.getColumn('Aline', 'TIME')
+        ACAlts = reader.getColumn('Aline', 'SAPALT')
+        temperatures = reader.getColumn('ATP', 'Temperatures')
+        altitudes = reader.getColumn('ATP', 'Altitudes')
+        trops = reader.getColumn('ATP', 'trop', 'altc')
+        MRIs = reader.getColumn('BestWtdRCSet', 'SumLnProb')
+        for index in range(reader.getNumRecs()-1):
+            time = times[index]
+            self.ACAlt = ACAlts[index]
             self.curtain.addACalt(self.ACAlt)
 
-            try:
-                # If retrieval failed, go no further
-                self.client.reader.testATP(index)  # profile has been generated
-                temperature = thisscan['ATP']['Temperatures']
-                self.curtain.addAltTemp(temperature,
-                                        thisscan['ATP']['Altitudes'],
+            # A scan has a profile if its altitudes were saved
+            if (altitudes is not None and
+               not numpy.all(numpy.isnan(altitudes[index]))):
+                temperature = temperatures[index].tolist()
+                self.curtain.addAltTemp(temperature, altitudes[index],
                                         self.ACAlt)
                 self.curtain.addTime(time, temperature)
-                self.curtain.addTrop(thisscan['ATP']['trop']['val'][0])
-                self.curtain.addMRI(thisscan['BestWtdRCSet']['SumLnProb'])
-            except Exception:
+                self.curtain.addTrop({'altc': trops[index][0]})
+                self.curtain.addMRI(MRIs[index] if MRIs is not None
+                                    else numpy.nan)
+            else:
                 # profile was not generated
                 logger.info("While generating curtain plot, found that " +
                             "temperature profile doesn't exist for scan " +
@@ -1028,11 +1093,18 @@ class MTPviewer(QMainWindow):
             self.updateDisplay()
 
     def clickGo(self):
-        """ Go to scan selected by user and show plots and data """
+        """
+        Go to scan selected by user and show plots and data. The user can
+        enter a scan index, or a time as HH:MM:SS to go to the scan nearest
+        that time.
+        """
 
         if self.index.text() == "":
             # If text field is empty, return without doing anything
             return
+        elif ':' in self.index.text():
+            self.goToTime(self.index.text())
+            return
         elif self.index.text() == str(0):
             # If user entered index of zero assume they meant 1. This
             # interface is for scientists, not SEs, so the interface shows
@@ -1050,3 +1122,22 @@ class MTPviewer(QMainWindow):
                          str(self.currentScanIndex+1))
         else:
             self.updateDisplay()
+
+    def goToTime(self, timestr):
+        """ Go to the scan nearest to timestr (HH:MM:SS) """
+        try:
+            [hours, minutes, seconds] = [int(val) for val in
+                                         timestr.split(':')]
+        except ValueError:
+            logger.error("Enter a scan index or a time as HH:MM:SS")
+            return
+
+        index = self.client.reader.getTimeIndex().getIndex(
+            hours * 3600 + minutes * 60 + seconds)
+        if index is None or index > self.currentScanIndex:
+            logger.error("No scans yet. Can't go to " + timestr)
+            return
+
+        self.viewScanIndex = index
+        logger.debug("Go to scan " + str(self.viewScanIndex))
+        self.updateDisplay()
@@ -0,0 +1,105 @@
+###############################################################################
+# Script to measure the memory allocated, and time taken, each time a scan,
+# an IWG packet, a weighted average RC set or a retrieved profile is copied
+# or saved. Useful for checking that the per-scan hot paths don't copy more
+# than they need to. It is not a unit test, so isn't run with them.
+#
+# Uses the DEEPWAVE test data in Data/NGV/DEEPWAVE and tests/test_data.
+#
+# To use:
+# > cd src
+# > python3 ../tests/benchmark_scan_copy.py
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+from lib.rootdir import getrootdir  # noqa: E402
+from util.readmtp import readMTP  # noqa: E402
+from util.rcf import RetrievalCoefficientFile  # noqa: E402
+from util.retriever import Retriever  # noqa: E402
+from ctrl.util.iwg import MTPiwg  # noqa: E402
+
+
+def measure(label, func, count):
+    """
+    Call func count times and report the number of memory blocks and bytes
+    still allocated per call afterwards, and the time per call. Anything
+    func returns is kept so that it is counted.
+    """
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(count):
+        kept.append(func())
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+
+    start = time.perf_counter()
+    for i in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+
+    print("%-26s %8.1f blocks %10.1f bytes %9.1f us per call" %
+          (label, blocks / count, size / count, 1e6 * elapsed / count))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure allocations per scan in the copy hot paths")
+    parser.add_argument('--count', type=int, default=200,
+                        help="Number of calls to average over")
+    args = parser.parse_args()
+
+    datadir = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE')
+
+    # A processed scan, with TBs, a profile and an RC set reference
+    reader = readMTP()
+    with open(os.path.join(getrootdir(), 'tests', 'test_data',
+                           'DEEPWAVErf01.mtpRealTime.json')) as f:
+        reader.curscan.update(json.loads(f.readline()))
+    reader.resetRawscan()
+    measure("readMTP.archive()", reader.archive, args.count)
+
+    # The IWG packets received during a scan
+    iwg = MTPiwg()
+    iwg.initIWG(os.path.join(datadir, 'config', 'ascii_parms'))
+    with open(os.path.join(datadir, '20140606', 'NG20140606.RAW')) as f:
+        iwg.dataI = next(line.rstrip('\n') for line in f
+                         if line.startswith('IWG1'))
+    measure("MTPiwg.saveIWG()", iwg.saveIWG, args.count)
+
+    # One template averaged between two flight levels
+    rcf = RetrievalCoefficientFile(os.path.join(datadir, 'RC',
+                                                'NRCDE067.RCF'))
+    [Top, Bot, BotWt] = rcf.getFlightLevelBracket(10.0)
+    measure("getRCAvgWtSet()",
+            lambda: rcf.getRCAvgWtSet(Top, Bot, BotWt), args.count)
+
+    # Retrieving the profile of the processed scan and saving it to the scan
+    retriever = Retriever(os.path.join(datadir, 'RC'))
+    tbi = reader.curscan['tbi']
+    BestWtdRCSet = retriever.getRCSet(tbi, 10.0)
+
+    def saveProfile():
+        reader.saveATP(retriever.retrieve(tbi, BestWtdRCSet))
+        return reader.getATP()
+    measure("retrieve() and saveATP()", saveProfile, args.count)
+
+
+if __name__ == "__main__":
+    main()
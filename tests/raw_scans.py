@@ -0,0 +1,42 @@
+###############################################################################
+# Test data shared by the tests that read a RAW file: the first scans of the
+# DEEPWAVE RF01 raw data file.
+#
+# This is not a test file itself. The tests import it from the tests
+# directory, which unittest discover puts on the path.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+from lib.rootdir import getrootdir
+
+RAWFILE = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE', '20140606',
+                       'NG20140606.RAW')
+
+
+def readRawScans(numscans, partial=False):
+    """
+    Return the start of the raw data file up to the end of scan numscans, as
+    bytes. If partial is True, the lines of the next scan before its B line
+    are included too, so that the last scan is incomplete.
+    """
+    with open(RAWFILE, 'rb') as f:
+        data = f.read()
+    end = 0
+    for i in range(numscans + 1):
+        end = data.find(b'\nA ', end + 1)
+    if partial:
+        end = data.find(b'\nB ', end + 1)
+    return data[0:end + 1]
+
+
+def copyRawScans(numscans, dest, partial=False):
+    """
+    Write the first numscans scans of the raw data file (see readRawScans())
+    to the file dest, e.g. in a temporary directory. Returns dest.
+    """
+    with open(dest, 'wb') as f:
+        f.write(readRawScans(numscans, partial))
+    return dest
@@ -4,23 +4,36 @@
 
 Set-Location ..\src
 python -m unittest discover -s ..\tests -v -p test_1messageHandler.py
+python -m unittest discover -s ..\tests -v -p test_batch.py
 python -m unittest discover -s ..\tests -v -p test_calcTB.py
+python -m unittest discover -s ..\tests -v -p test_campaign.py
 python -m unittest discover -s ..\tests -v -p test_eng1.py
 python -m unittest discover -s ..\tests -v -p test_eng2.py
 python -m unittest discover -s ..\tests -v -p test_eng3.py
+python -m unittest discover -s ..\tests -v -p test_flight_store.py
+python -m unittest discover -s ..\tests -v -p test_flight_table.py
 python -m unittest discover -s ..\tests -v -p test_icartt.py
+python -m unittest discover -s ..\tests -v -p test_ingest.py
 python -m unittest discover -s ..\tests -v -p test_iwg.py
+python -m unittest discover -s ..\tests -v -p test_lazy_flight_data.py
+python -m unittest discover -s ..\tests -v -p test_logger.py
 python -m unittest discover -s ..\tests -v -p test_MTPclient.py
 python -m unittest discover -s ..\tests -v -p test_MTPprocessor.py
 python -m unittest discover -s ..\tests -v -p test_MTPviewer.py
 python -m unittest discover -s ..\tests -v -p test_MTPviewer2.py
 python -m unittest discover -s ..\tests -v -p test_quit.py
+python -m unittest discover -s ..\tests -v -p test_raw_index.py
+python -m unittest discover -s ..\tests -v -p test_raw_tail.py
 python -m unittest discover -s ..\tests -v -p test_rcf_set.py
+python -m unittest discover -s ..\tests -v -p test_rcf_stack.py
 python -m unittest discover -s ..\tests -v -p test_rcf.py
 python -m unittest discover -s ..\tests -v -p test_readascii_parms.py
 python -m unittest discover -s ..\tests -v -p test_readGVnc.py
 python -m unittest discover -s ..\tests -v -p test_readmtp.py
+python -m unittest discover -s ..\tests -v -p test_retrieval_cache.py
+python -m unittest discover -s ..\tests -v -p test_retrieve.py
 python -m unittest discover -s ..\tests -v -p test_retriever.py
 python -m unittest discover -s ..\tests -v -p test_tempresist.py
+python -m unittest discover -s ..\tests -v -p test_time_index.py
 python -m unittest discover -s ..\tests -v -p test_tropopause.py
 python -m unittest discover -s ..\tests -v -p test_udp.py
@@ -84,6 +84,11 @@ class TESTMTPclient(unittest.TestCase):
         BestWtdRCSet = self.client.retriever.getRCSet(tbi, acaltkm)
         ATP = self.client.getProfile(tbi, BestWtdRCSet)
 
+        # By default every template is ranked
+        self.assertEqual(
+            len(BestWtdRCSet['RCFArray']),
+            len(self.client.retriever.rcf_set.getRCFVector()))
+
         tempc = [201.6476707, 214.7501833, 293.0145730,
                  284.0193997, 276.0955620, 270.5628039,
                  268.4503728, 270.254762, 267.6712243,
@@ -59,6 +59,22 @@ class TESTMTPiwg(unittest.TestCase):
         self.assertTrue(numpy.isnan(
             self.MTPiwg.iwgrecord['values'][self.MTPiwg.lon]['val']))
 
+    def test_saveIWG(self):
+        # Test that only the values are saved for each packet
+        self.MTPiwg.dataI = "IWG1,20140606T062250,-43.3061,172.455," + \
+            "3281.97,,10508.5,,149.998,164.027,,0.502512,3.11066,283.283," + \
+            "281.732,-1.55388,3.46827,0.0652588,-0.258496,2.48881," + \
+            "-5.31801,-5.92311,7.77836,683.176,127.248,1010.48,14.6122," + \
+            "297.157," + \
+            "0.303804,104.277,,-72.1708,"
+        self.MTPiwg.saveIWG()
+        self.MTPiwg.saveIWG()
+        self.assertEqual(len(self.MTPiwg.scanIWGlist), 2)
+        self.assertEqual(self.MTPiwg.scanIWGlist[0]['values']['GGLAT'],
+                         {'val': '-43.3061'})
+        self.assertEqual(self.MTPiwg.getVals(self.MTPiwg.lat),
+                         [-43.3061, -43.3061])
+
     def test_averageIWG_nodata(self):
         # Test no data
         self.assertEqual(self.MTPiwg.averageIWG(), False)
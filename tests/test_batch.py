@@ -0,0 +1,207 @@
+###############################################################################
+# Test proc/batch.py
+#
+# This test uses the first scans of the DEEPWAVE RF01 raw data file as test
+# input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import sys
+import numpy
+import tempfile
+import unittest
+import subprocess
+from unittest.mock import patch
+from proc.batch import MTPbatch
+from util.calcTBs import BrightnessTemperature
+from lib.rootdir import getrootdir
+from raw_scans import copyRawScans
+
+import logging
+from io import StringIO
+from EOLpython.logger.messageHandler import Logger
+
+logger = Logger("EOLlogger")
+
+
+class TESTbatch(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        self.projdir = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE')
+        self.configfile = os.path.join(self.projdir, 'config', 'proj.yml')
+
+        # Copy the first 50 scans of the raw data file
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rawfile = copyRawScans(50, os.path.join(self.tmpdir.name,
+                                                     'test.RAW'))
+
+    def testFlightFiles(self):
+        """ Test finding the files for a flight from its setup file """
+        batch = MTPbatch(self.configfile)
+        [rawfile, ncfile] = batch.getFlightFiles('rf01')
+        self.assertEqual(rawfile, os.path.join(self.projdir, 'Raw',
+                                               'N2014060606.22'))
+        self.assertEqual(ncfile, os.path.join(self.projdir, 'NG',
+                                              'DEEPWAVErf01.nc'))
+        with self.assertRaises(FileNotFoundError):
+            batch.getFlightFiles('rf99')
+
+    def testRun(self):
+        """ Test processing a flight from the RAW file to ICARTT """
+        batch = MTPbatch(self.configfile)
+        client = batch.client
+        storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        jsonfile = os.path.join(self.tmpdir.name, 'test.json')
+        icarttfile = os.path.join(self.tmpdir.name, 'test.ict')
+        ncfile = os.path.join(self.tmpdir.name, 'missing.nc')
+        with patch.object(client, 'getFlightStoreFilename',
+                          return_value=storefile), \
+             patch.object(client, 'getMtpRealTimeFilename',
+                          return_value=jsonfile):
+            self.assertTrue(batch.run(self.rawfile, ncfile, icarttfile))
+
+        self.assertEqual(len(client.reader.flightData), 50)
+        self.assertNotEqual(client.reader.flightData[0]['ATP'], "")
+        self.assertIn("NetCDF file " + ncfile + " doesn't exist",
+                      self.stream.getvalue())
+
+        self.assertEqual([stage for [stage, seconds] in batch.timing],
+                         ["Read RAW file", "Retrievals and tropopause",
+                          "Export JSON", "Write ICARTT"])
+        report = batch.getTimingReport().split("\n")
+        self.assertEqual(len(report), 5)
+        self.assertTrue(report[-1].startswith("Total"))
+
+        with open(jsonfile) as f:
+            self.assertEqual(len(f.readlines()), 50)
+        with open(icarttfile) as f:
+            lines = f.readlines()
+        # One dependent unbounded line, which starts with the right-aligned
+        # start time, for each scan. The header starts with the number of
+        # header lines.
+        nheader = int(lines[0].split(',')[0])
+        data = [line for line in lines[nheader:] if line.startswith(' ')]
+        self.assertEqual(len(data), 50)
+
+    def testFlightTB(self):
+        """ Test calibrating every scan in a flight at once """
+        batch = MTPbatch(self.configfile)
+        client = batch.client
+        storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        client.getFlightStoreFilename = lambda: storefile
+        batch.readRawFile(self.rawfile)
+
+        # Matches the brightness temperatures calculated as each scan was
+        # read
+        stored = [list(scan['Bline']['values']['SCNT']['tb'])
+                  for scan in client.reader.flightData]
+        tbs = client.calcFlightTB()
+        self.assertEqual(tbs.shape, (50, 30))
+        self.assertTrue(numpy.array_equal(tbs, stored, equal_nan=True))
+
+        # A different calibration changes the results, but not flightData
+        calibration = BrightnessTemperature(client.configfile)
+        calibration.setGainConstants(42, [[19.43, 0.2], [22.44, 0.2],
+                                          [25.29, 0.2]])
+        self.assertFalse(numpy.array_equal(
+            client.calcFlightTB(calibration), tbs, equal_nan=True))
+        self.assertEqual(client.reader.flightData[0]['Bline']['values'][
+            'SCNT']['tb'], stored[0])
+
+        # A flight loaded from the flight store is calibrated from the
+        # flight table, without decoding the scans
+        client.reader.flightData = []
+        client.reader.load(storefile)
+        self.assertTrue(numpy.array_equal(client.calcFlightTB(), tbs,
+                                          equal_nan=True))
+        self.assertEqual(client.reader.flightData._scans, {})
+
+    def testRecalibrateFlight(self):
+        """ Test saving a new calibration of a flight to the scans """
+        batch = MTPbatch(self.configfile)
+        client = batch.client
+        storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        client.getFlightStoreFilename = lambda: storefile
+        batch.readRawFile(self.rawfile)
+
+        calibration = BrightnessTemperature(client.configfile)
+        calibration.setGainConstants(42, [[19.43, 0.2], [22.44, 0.2],
+                                          [25.29, 0.2]])
+        tbs = client.calcFlightTB(calibration)
+        client.recalibrateFlight(calibration)
+        self.assertIs(client.getCalibration(), calibration)
+
+        # The scans, flight table and flight store all have the new
+        # brightness temperatures, and the inverted ones match invertArray()
+        client.reader.flightData = []
+        client.reader.load(storefile)
+        for index in range(len(tbs)):
+            scan = client.reader.flightData[index]
+            tb = scan['Bline']['values']['SCNT']['tb']
+            self.assertTrue(numpy.array_equal(tb, tbs[index],
+                                              equal_nan=True))
+            self.assertEqual(scan['tbi'], client.invertArray(tb))
+        self.assertTrue(numpy.array_equal(
+            client.reader.getColumn('Bline', 'SCNT', 'tb'), tbs,
+            equal_nan=True))
+
+    def testUpdateCalibration(self):
+        """ Test picking up new gain constants from the config file """
+        batch = MTPbatch(self.configfile)
+        client = batch.client
+        storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        client.getFlightStoreFilename = lambda: storefile
+        batch.readRawFile(self.rawfile)
+        tbs = client.calcFlightTB()
+
+        # Nothing changes until the gain constants in the config file do
+        self.assertFalse(client.updateCalibration())
+
+        configfile = os.path.join(self.tmpdir.name, 'proj.yml')
+        with open(self.configfile) as f:
+            lines = [line.replace('GOF: 40.6', 'GOF: 42')
+                     for line in f.readlines()]
+        with open(configfile, 'w') as f:
+            f.writelines(lines)
+        client.configfile.yamlfile = configfile
+
+        self.assertTrue(client.updateCalibration())
+        self.assertEqual(client.configfile.getVal('GOF'), '42')
+        newtbs = numpy.array([scan['Bline']['values']['SCNT']['tb']
+                              for scan in client.reader.flightData])
+        self.assertFalse(numpy.array_equal(newtbs, tbs, equal_nan=True))
+        self.assertTrue(numpy.array_equal(newtbs, client.calcFlightTB(),
+                                          equal_nan=True))
+        self.assertFalse(client.updateCalibration())
+
+    def testHeadless(self):
+        """
+        Test that batch processing doesn't import PyQt, matplotlib or the
+        EOLpython logger that opens message boxes, even once it has logged
+        """
+        code = "\n".join([
+            "import sys, MTPbatch",
+            "from proc.batch import logger",
+            "logger.info('Logging from the batch processor')",
+            "print(sorted(m for m in sys.modules if m.split('.')[0] in " +
+            "{'PyQt5', 'PyQt6', 'PyQT6', 'matplotlib'} or " +
+            "m.startswith('EOLpython.Qlogger')))"])
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[]")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
@@ -21,6 +21,7 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
+import numpy
 from lib.rootdir import getrootdir
 from lib.config import config
 import unittest
@@ -63,6 +64,7 @@ class TESTcalcTBs(unittest.TestCase):
         Tifa = self.rawscan['Ptline']['values']['TMIXCNTP']['temperature']
         OAT = self.rawscan['Aline']['values']['SAAT']['val']
         scnt = self.rawscan['Bline']['values']['SCNT']['val']
+        self.scan = [Tifa, OAT, scnt]
 
         # Read gain constants from the config file
         self.config = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE',
@@ -70,9 +72,9 @@ class TESTcalcTBs(unittest.TestCase):
         configfile = config(self.config)
 
         # Calculate the brightness temperatures
-        tb = BrightnessTemperature(configfile)
+        self.tb = BrightnessTemperature(configfile)
         self.rawscan['Bline']['values']['SCNT']['tb'] = \
-            tb.TBcalculationRT(Tifa, OAT, scnt)
+            self.tb.TBcalculationRT(Tifa, OAT, scnt)
 
     def testTBcalculationRT(self):
         """ Test that brightness temperatures are calculated correctly """
@@ -91,3 +93,41 @@ class TESTcalcTBs(unittest.TestCase):
             self.assertEqual(
                 "%8.4f" % self.rawscan['Bline']['values']['SCNT']['tb'][i],
                 tb[i])
+
+    def testTBbatch(self):
+        """ Test that a batch of scans matches one scan at a time """
+        [Tifa, OAT, scnt] = self.scan
+        scnt = [int(C) for C in scnt]
+        # The last mixer temperature makes every gain too small, so the
+        # gains are masked and the brightness temperatures are NaN
+        scans = [[Tifa, OAT, scnt],
+                 [Tifa + 2.5, float(OAT) - 10.0, scnt[::-1]],
+                 [-200.0, OAT, scnt]]
+
+        tbs = self.tb.TB_batch([scan[0] for scan in scans],
+                               [float(scan[1]) for scan in scans],
+                               [scan[2] for scan in scans])
+        self.assertEqual(tbs.shape, (3, 30))
+        for i in range(len(scans)):
+            self.assertTrue(numpy.array_equal(
+                tbs[i], self.tb.TBcalculationRT(*scans[i]), equal_nan=True))
+        self.assertTrue(numpy.isnan(tbs[2]).all())
+        self.assertFalse(numpy.isnan(tbs[0:2]).any())
+
+        # Each scan gets its own list of brightness temperatures
+        self.assertIsNot(self.tb.TBcalculationRT(*scans[0]),
+                         self.tb.TBcalculationRT(*scans[0]))
+
+    def testSetGainConstants(self):
+        """ Test that a different calibration changes the results """
+        [Tifa, OAT, scnt] = self.scan
+        tb = self.rawscan['Bline']['values']['SCNT']['tb']
+
+        self.tb.setGainConstants(42, [[19.43, 0.2], [22.44, 0.2],
+                                      [25.29, 0.2]])
+        newtb = self.tb.TBcalculationRT(Tifa, OAT, scnt)
+        self.assertNotEqual(newtb, tb)
+        self.assertEqual(self.tb.TB_batch([Tifa], [float(OAT)],
+                                          [scnt]).tolist(), [newtb])
+        # The horizontal scan is the OAT whatever the calibration
+        self.assertEqual(newtb[15:18], tb[15:18])
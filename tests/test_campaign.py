@@ -0,0 +1,165 @@
+###############################################################################
+# Test proc/campaign.py
+#
+# This test builds a small project from the DEEPWAVE config and RCFs, with
+# two flights made from the first scans of the DEEPWAVE RF01 raw data file.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from proc.campaign import MTPcampaign, processFlight
+from util.readmtp import readMTP
+from lib.rootdir import getrootdir
+from raw_scans import copyRawScans
+from EOLpython.logger.messageHandler import Logger
+
+logger = Logger("EOLlogger")
+
+
+class TESTcampaign(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        # Copy the DEEPWAVE config and RCFs to a new project
+        deepwave = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.projdir = os.path.join(self.tmpdir.name, 'TEST')
+        os.makedirs(os.path.join(self.projdir, 'config', 'Production'))
+        for filename in ['proj.yml', 'ascii_parms']:
+            shutil.copy2(os.path.join(deepwave, 'config', filename),
+                         os.path.join(self.projdir, 'config'))
+        for dirname in ['RC', 'RC.RCFcache']:
+            src = os.path.join(deepwave, dirname)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(self.projdir, dirname))
+            elif os.path.isfile(src):
+                shutil.copy2(src, self.projdir)
+        for dirname in ['Raw', 'final', 'logs']:
+            os.mkdir(os.path.join(self.projdir, dirname))
+        self.configfile = os.path.join(self.projdir, 'config', 'proj.yml')
+
+        # Make flight rf01 from the first 20 scans and rf02 from the first
+        # 40 scans of the raw data file
+        self.addFlight('rf01', 20)
+        self.addFlight('rf02', 40)
+
+    def addFlight(self, fltno, numscans):
+        """ Add a flight holding the first numscans scans """
+        copyRawScans(numscans,
+                     os.path.join(self.projdir, 'Raw', fltno + '.RAW'))
+        with open(os.path.join(self.projdir, 'config', 'Production',
+                               'setup_' + fltno + '.yml'), 'w') as f:
+            f.write("raw_file: 'Raw/" + fltno + ".RAW'\n")
+            f.write("nc_file: 'NG/DEEPWAVE" + fltno + ".nc'\n")
+
+    def getJobFlights(self, campaign, rerun=False):
+        """ Return the flight numbers of the jobs still to do, in order """
+        return [job[1] for job in campaign.getJobs(rerun)]
+
+    def testJobs(self):
+        """ Test that the largest flights are processed first """
+        campaign = MTPcampaign(self.configfile)
+        self.assertEqual([flight[0] for flight in campaign.getFlights()],
+                         ['rf01', 'rf02'])
+        self.assertEqual(self.getJobFlights(campaign), ['rf02', 'rf01'])
+        self.assertEqual(campaign.manifest,
+                         os.path.join(self.projdir, 'final',
+                                      'MTPcampaign.json'))
+
+    def testRun(self):
+        """ Test processing every flight, two at a time """
+        campaign = MTPcampaign(self.configfile, 2)
+        self.assertTrue(campaign.run())
+
+        for [fltno, numscans] in [['rf01', 20], ['rf02', 40]]:
+            with open(readMTP().getJson(self.projdir, 'DEEPWAVE',
+                                        fltno)) as f:
+                self.assertEqual(len(f.readlines()), numscans)
+
+        with open(campaign.manifest) as f:
+            flights = json.load(f)['flights']
+        self.assertEqual(sorted(flights), ['rf01', 'rf02'])
+        for state in flights.values():
+            self.assertEqual(state['status'], 'done')
+            self.assertEqual(state['timing'][0][0], "Read RAW file")
+
+        self.assertEqual(len(campaign.getReport().split("\n")), 2)
+
+    def testResume(self):
+        """ Test that only unfinished or changed flights are processed """
+        campaign = MTPcampaign(self.configfile)
+        self.assertTrue(campaign.run())
+
+        campaign = MTPcampaign(self.configfile)
+        self.assertEqual(self.getJobFlights(campaign), [])
+        self.assertEqual(self.getJobFlights(campaign, True),
+                         ['rf02', 'rf01'])
+
+        # Interrupt rf02, and add more scans to rf01
+        campaign.flights['rf02']['status'] = 'pending'
+        campaign.writeManifest()
+        self.addFlight('rf01', 30)
+
+        campaign = MTPcampaign(self.configfile)
+        self.assertEqual(self.getJobFlights(campaign), ['rf02', 'rf01'])
+        self.assertTrue(campaign.run())
+        self.assertEqual(self.getJobFlights(campaign), [])
+
+    def testWorkers(self):
+        """
+        Test that only flights processed in a pool are limited to one
+        process, and that flights run serially use the config file workers
+        """
+        job = [self.configfile, 'rf01', 'rf01.RAW', 'rf01.nc']
+        with patch('proc.campaign.MTPbatch') as batch:
+            processFlight(job)
+            batch.assert_called_with(self.configfile, None)
+            processFlight(job, workers=1)
+            batch.assert_called_with(self.configfile, 1)
+
+            MTPcampaign(self.configfile).run()
+            batch.assert_called_with(self.configfile, None)
+
+    def testNoRCFs(self):
+        """
+        Test that listing the flights doesn't read the RCFs, so a missing
+        RCF dir is only reported by the flights themselves
+        """
+        shutil.rmtree(os.path.join(self.projdir, 'RC'))
+        campaign = MTPcampaign(self.configfile)
+        self.assertEqual(self.getJobFlights(campaign), ['rf02', 'rf01'])
+        self.assertNotIn("Retrievals will not be done",
+                         self.stream.getvalue())
+
+    def testMissing(self):
+        """ Test that a flight without a RAW file is reported as failed """
+        self.addFlight('rf03', 10)
+        os.remove(os.path.join(self.projdir, 'Raw', 'rf03.RAW'))
+        campaign = MTPcampaign(self.configfile)
+        self.assertEqual(self.getJobFlights(campaign), ['rf02', 'rf01'])
+        self.assertFalse(campaign.run())
+        self.assertEqual(campaign.flights['rf03']['status'], 'failed')
+        self.assertEqual(campaign.flights['rf01']['status'], 'done')
+        self.assertIn("rf03.RAW for flight rf03 doesn't exist",
+                      self.stream.getvalue())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
@@ -0,0 +1,125 @@
+###############################################################################
+# Test util/flight_store.py
+#
+# This test uses the JSON file in test_data as test input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import logging
+import tempfile
+import unittest
+from io import StringIO
+from util.readmtp import readMTP
+from util.flight_store import FlightStore, ENTRY
+from lib.rootdir import getrootdir
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTflightStore(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        self.jsonfile = os.path.join(getrootdir(), 'tests', 'test_data',
+                                     'DEEPWAVErf01.mtpRealTime.json')
+        self.reader = readMTP()
+        with open(self.jsonfile) as f:
+            self.scans = [self.reader.copyValues(json.loads(line))
+                          for line in f]
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        self.store = FlightStore(self.storefile)
+
+    def sameScan(self, scan1, scan2):
+        """ Compare scans as JSON so that NaNs compare equal """
+        self.assertEqual(json.dumps(scan1), json.dumps(scan2))
+
+    def testAppend(self):
+        """ Test that scans read back the same as they were written """
+        self.assertFalse(self.store.exists())
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.readAll(), [])
+
+        for i, scan in enumerate(self.scans[0:3]):
+            self.assertEqual(self.store.append(scan), i)
+        self.assertEqual(self.store.extend(self.scans[3:]), len(self.scans))
+        self.assertEqual(len(self.store), len(self.scans))
+
+        for scan1, scan2 in zip(self.store.readAll(), self.scans):
+            self.sameScan(scan1, scan2)
+        self.sameScan(self.store.read(5), self.scans[5])
+        # Lists of floats are stored as floats, other lists keep their type
+        scan = self.store.read(0)
+        self.assertIsInstance(scan['tbi'][0], float)
+        self.assertEqual(scan['Bline']['values']['SCNT']['val'][0], '018963')
+
+        with self.assertRaises(IndexError):
+            self.store.read(len(self.scans))
+
+    def testUpdate(self):
+        """ Test that updating a scan doesn't change the others """
+        self.store.extend(self.scans)
+        size = os.path.getsize(self.storefile)
+
+        # A record that fits is updated in place
+        scan = self.store.read(3)
+        scan['ATP']['Temperatures'][0] = 200.0
+        self.store.update(3, scan)
+        self.assertEqual(os.path.getsize(self.storefile), size)
+        self.assertEqual(self.store.read(3)['ATP']['Temperatures'][0], 200.0)
+
+        # A record that doesn't fit is moved to the end of the file
+        scan['Aline']['data'] = scan['Aline']['data'] + ' extra'
+        self.store.update(3, scan)
+        self.assertGreater(os.path.getsize(self.storefile), size)
+        self.assertEqual(len(self.store), len(self.scans))
+
+        scans = self.store.readAll()
+        self.sameScan(scans[3], scan)
+        self.sameScan(scans[2], self.scans[2])
+        self.sameScan(scans[4], self.scans[4])
+
+    def testPartialIndex(self):
+        """ Test that a partly written index entry is dropped """
+        self.store.extend(self.scans[0:2])
+        with open(self.storefile + '.idx', 'ab') as f:
+            f.write(b'\x00' * (ENTRY.size // 2))
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.append(self.scans[2]), 2)
+        self.assertIn("Dropping partial entry", self.stream.getvalue())
+        self.sameScan(self.store.read(2), self.scans[2])
+
+    def testLoad(self):
+        """ Test reloading flightData from a store and exporting to JSON """
+        self.reader.convertJSON(self.jsonfile, self.storefile)
+        self.assertTrue(self.reader.load(self.storefile))
+        self.assertEqual(self.reader.getNumRecs(), len(self.scans))
+        self.assertEqual(len(self.reader.getColumn('Aline', 'SAPALT')),
+                         len(self.scans))
+
+        jsonfile = os.path.join(self.tmpdir.name, 'test.json')
+        self.store.exportJSON(jsonfile)
+        with open(jsonfile) as f:
+            for line, scan in zip(f, self.scans):
+                self.sameScan(json.loads(line), scan)
+
+        self.store.remove()
+        self.assertFalse(self.store.exists())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
@@ -0,0 +1,98 @@
+###############################################################################
+# Test util/flight_table.py
+#
+# This test uses the JSON file in test_data as test input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import copy
+import numpy
+import unittest
+from util.readmtp import readMTP
+from util.flight_table import FlightTable
+from lib.rootdir import getrootdir
+
+
+class TESTflightTable(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = readMTP()
+        self.reader.load(os.path.join(getrootdir(), 'tests', 'test_data',
+                                      'DEEPWAVErf01.mtpRealTime.json'))
+        self.flightData = self.reader.flightData
+
+    def testColumns(self):
+        """ Test that each column matches the values in flightData """
+        table = self.reader.getFlightTable()
+        self.assertEqual(len(table), len(self.flightData))
+
+        self.assertEqual(table.getColumn('Aline', 'DATE')[0], '20140606')
+        pitch = [float(scan['Aline']['values']['SAPITCH']['val'])
+                 for scan in self.flightData]
+        self.assertEqual(table.getColumn('Aline', 'SAPITCH').tolist(), pitch)
+
+        volts = [scan['M01line']['values']['VM08CNTE']['volts']
+                 for scan in self.flightData]
+        self.assertEqual(table.getColumn('M01line', 'VM08CNTE',
+                                         'volts').tolist(), volts)
+
+        tcnt = table.getColumn('Eline', 'TCNT')
+        self.assertEqual(tcnt.shape, (len(self.flightData), 6))
+        self.assertEqual(tcnt[0, 0], 21506)
+        self.assertEqual(self.reader.getVarArrayi('Eline', 'TCNT', 0),
+                         tcnt[:, 0].tolist())
+
+        temps = numpy.array([scan['ATP']['Temperatures']
+                             for scan in self.flightData])
+        numpy.testing.assert_array_equal(
+            table.getColumn('ATP', 'Temperatures'), temps)
+
+        # A variable that isn't in the table
+        self.assertIsNone(table.getColumn('Aline', 'NOTAVAR'))
+
+    def testAppend(self):
+        """ Test that the table grows and that columns are views """
+        table = FlightTable(capacity=4)
+        table.extend(self.flightData[0:3])
+        column = table.getColumn('Bline', 'SCNT')
+        self.assertTrue(numpy.shares_memory(
+            column, table.getColumn('Bline', 'SCNT')))
+
+        for scan in self.flightData[3:10]:
+            table.append(scan)
+        self.assertEqual(len(table), 10)
+        scnt = [[float(val) for val in scan['Bline']['values']['SCNT']['val']]
+                for scan in self.flightData[0:10]]
+        self.assertEqual(table.getColumn('Bline', 'SCNT').tolist(), scnt)
+
+    def testUpdate(self):
+        """ Test that updating a scan updates its row in the table """
+        scan = copy.deepcopy(self.flightData[5])
+        scan['ATP']['Temperatures'] = [200.0] * \
+            len(scan['ATP']['Temperatures'])
+        self.reader.flightData[5] = scan
+        self.reader.setRawscan(5)
+        self.reader.updateFlightTable()
+        self.reader.resetRawscan()
+
+        temps = self.reader.getColumn('ATP', 'Temperatures')
+        self.assertTrue(numpy.all(temps[5] == 200.0))
+        self.assertFalse(numpy.all(temps[4] == 200.0))
+
+    def testClear(self):
+        """ Test that the table follows the flightData list """
+        scans = list(self.flightData)
+        self.reader.clearFlightData()
+        self.assertEqual(len(self.reader.flightTable), 0)
+        self.assertIsNone(self.reader.getColumn('Aline', 'SAPITCH'))
+
+        # flightData replaced without going through archive()
+        self.reader.flightData = scans[0:2]
+        self.assertEqual(len(self.reader.getColumn('Aline', 'SAPITCH')), 2)
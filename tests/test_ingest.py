@@ -0,0 +1,115 @@
+###############################################################################
+# Test proc/ingest.py
+#
+# This test uses the first scans of the DEEPWAVE RF01 raw data file as test
+# input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from viewer.MTPclient import MTPclient
+from proc.ingest import splitRawFile, ingestRawFile
+from util.flight_store import FlightStore
+from lib.rootdir import getrootdir
+from raw_scans import copyRawScans
+
+import logging
+from io import StringIO
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+# Set environment var to indicate we are in testing mode
+# Need this to logger won't try to open message boxes
+logger.setDisableMessageBox(True)
+
+
+class TESTingest(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        self.configfile = os.path.join(getrootdir(), 'Data', 'NGV',
+                                       'DEEPWAVE', 'config', 'proj.yml')
+
+        # Copy the first 100 scans of the raw data file, and the first lines
+        # of the next scan so that the last scan is incomplete.
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rawfile = copyRawScans(100, os.path.join(self.tmpdir.name,
+                                                      'test.RAW'),
+                                    partial=True)
+
+    def readSerial(self, client):
+        """ Read the raw data file one scan at a time, as setFile() does """
+        for rawscan in client.reader.iter_scans(self.rawfile):
+            packet = client.reader.getAsciiPacket()
+            try:
+                client.reader.parseAsciiPacket(packet)
+            except Exception:
+                continue
+            client.processScan()
+            client.createRecord()
+            client.reader.archive()
+
+    def testSplit(self):
+        """ Test that each chunk starts at an A line """
+        with open(self.rawfile, 'rb') as f:
+            data = f.read()
+
+        chunks = splitRawFile(self.rawfile, 8)
+        self.assertEqual(len(chunks), 8)
+        self.assertEqual(chunks[0][1], 0)
+        self.assertEqual(chunks[-1][2], len(data))
+        for chunk, next_chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(chunk[2], next_chunk[1])
+            self.assertEqual(data[next_chunk[1]:next_chunk[1] + 2], b'A ')
+            self.assertEqual(next_chunk[3],
+                             data.count(b'\n', 0, next_chunk[1]) + 1)
+
+        # More chunks than scans
+        self.assertEqual(len(splitRawFile(self.rawfile, 1000)), 101)
+
+    def testIngest(self):
+        """ Test that reading in parallel gives the same records in order """
+        # Set up the clients as MTPclient.config() does, including the IWG
+        # section of each scan
+        serial = MTPclient()
+        serial.readConfig(self.configfile)
+        serial.initIWG()
+        self.readSerial(serial)
+        self.assertEqual(len(serial.reader.flightData), 100)
+
+        client = MTPclient()
+        client.readConfig(self.configfile)
+        client.initIWG()
+        storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        counts = []
+        with patch.object(client, 'getFlightStoreFilename',
+                          return_value=storefile):
+            skipped = ingestRawFile(client, self.rawfile, 2, counts.append)
+
+        self.assertEqual(skipped, 1)
+        self.assertEqual(len(counts), 8)
+        self.assertEqual(counts[-1], 100)
+        self.assertEqual([json.dumps(scan) for scan in
+                          client.reader.flightData],
+                         [json.dumps(scan) for scan in
+                          serial.reader.flightData])
+        self.assertEqual(len(client.reader.getFlightTable()), 100)
+        self.assertEqual(len(FlightStore(storefile)), 100)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
@@ -0,0 +1,102 @@
+###############################################################################
+# Test util/lazy_flight_data.py
+#
+# This test uses the JSON file in test_data as test input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from util.readmtp import readMTP
+from util.lazy_flight_data import LazyFlightData
+from lib.rootdir import getrootdir
+
+
+class TESTlazyFlightData(unittest.TestCase):
+
+    def setUp(self):
+        self.jsonfile = os.path.join(getrootdir(), 'tests', 'test_data',
+                                     'DEEPWAVErf01.mtpRealTime.json')
+        with open(self.jsonfile) as f:
+            self.scans = [json.loads(line) for line in f]
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def testJSON(self):
+        """ Test that scans are only decoded when they are indexed """
+        flightData = LazyFlightData(self.jsonfile)
+        self.assertEqual(len(flightData), len(self.scans))
+        self.assertEqual(flightData._scans, {})
+
+        # The parts used by the plots are decoded up front
+        parts = flightData.getTableScans()
+        self.assertEqual(len(parts), len(self.scans))
+        self.assertEqual(sorted(parts[0]),
+                         ['ATP', 'Aline', 'BestWtdRCSet', 'Bline', 'Eline',
+                          'M01line', 'M02line', 'Ptline', 'tbi'])
+        self.assertEqual(parts[0]['Aline'], self.scans[0]['Aline'])
+        self.assertEqual(parts[0]['BestWtdRCSet']['SumLnProb'],
+                         self.scans[0]['BestWtdRCSet']['SumLnProb'])
+
+        self.assertEqual(flightData[3], self.scans[3])
+        self.assertEqual(flightData[-1], self.scans[-1])
+        self.assertEqual(sorted(flightData._scans), [3, len(self.scans) - 1])
+        with self.assertRaises(IndexError):
+            flightData[len(self.scans)]
+
+        # Changes to a decoded scan are kept
+        flightData[3]['tbi'] = ""
+        self.assertEqual(flightData[3]['tbi'], "")
+
+        # Scans added after the file was read
+        flightData.append(self.scans[0])
+        self.assertEqual(len(flightData), len(self.scans) + 1)
+        self.assertIs(flightData[len(self.scans)], self.scans[0])
+        self.assertEqual(len(flightData.getTableScans()), len(self.scans) + 1)
+
+        flightData.clear()
+        self.assertEqual(len(flightData), 0)
+
+    def testStore(self):
+        """ Test reading a flight store lazily """
+        reader = readMTP()
+        storefile = os.path.join(self.tmpdir.name, 'test.mtpstore')
+        reader.convertJSON(self.jsonfile, storefile)
+
+        flightData = LazyFlightData(storefile)
+        self.assertEqual(len(flightData), len(self.scans))
+        parts = flightData.getTableScans()
+        # Compare as JSON so that NaNs compare equal
+        self.assertEqual(json.dumps(parts[2]['ATP']['Temperatures']),
+                         json.dumps(self.scans[2]['ATP']['Temperatures']))
+        self.assertEqual(flightData[2]['Aline']['values']['SAPALT'],
+                         {'val': self.scans[2]['Aline']['values']['SAPALT']
+                          ['val']})
+
+    def testLoad(self):
+        """ Test that readMTP loads lazily and can export to the same file """
+        jsonfile = os.path.join(self.tmpdir.name, 'test.json')
+        shutil.copyfile(self.jsonfile, jsonfile)
+
+        reader = readMTP()
+        self.assertTrue(reader.load(jsonfile))
+        self.assertIsInstance(reader.flightData, LazyFlightData)
+        self.assertEqual(reader.getNumRecs(), len(self.scans))
+        self.assertEqual(len(reader.getColumn('ATP', 'Temperatures')),
+                         len(self.scans))
+
+        reader.exportJSON(jsonfile)
+        with open(jsonfile) as f:
+            self.assertEqual([json.loads(line) for line in f], self.scans)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
@@ -0,0 +1,55 @@
+###############################################################################
+# Test lib/logger.py
+#
+# Each test runs in a new python process, since which EOLpython logger is
+# used depends on the modules that have been imported.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import sys
+import unittest
+import subprocess
+
+
+class TESTlogger(unittest.TestCase):
+
+    def getLoggerModule(self, imports):
+        """ Return the module of the logger MTPlogger uses after imports """
+        code = "\n".join([
+            imports,
+            "from lib.logger import MTPlogger",
+            "logger = MTPlogger('EOLlogger')",
+            "print(type(logger.getLogger()).__module__)",
+            "print('EOLpython.Qlogger.messageHandler' in sys.modules)"])
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+        return output.stdout.split()
+
+    def testHeadless(self):
+        """ Test that the plain logger is used when PyQt isn't loaded """
+        [module, qlogger] = self.getLoggerModule("import sys")
+        self.assertEqual(module, 'EOLpython.logger.messageHandler')
+        self.assertEqual(qlogger, 'False')
+
+    def testGUI(self):
+        """ Test that QLogger is used once a GUI has loaded PyQt """
+        qlogger = self.getLoggerModule("import sys, PyQt6")[1]
+        self.assertEqual(qlogger, 'True')
+
+    def testDelegate(self):
+        """ Test that logging calls are passed on to the logger """
+        code = "\n".join([
+            "import sys",
+            "from lib.logger import MTPlogger",
+            "from EOLpython.logger.messageHandler import Logger",
+            "Logger('EOLlogger').initStream(sys.stdout)",
+            "MTPlogger('EOLlogger').info('Logged by MTPlogger')"])
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+        self.assertIn('Logged by MTPlogger', output.stdout)
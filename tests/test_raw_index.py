@@ -0,0 +1,102 @@
+###############################################################################
+# Test util/raw_index.py
+#
+# This test uses the first scans of the DEEPWAVE RF01 raw data file as test
+# input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import logging
+import tempfile
+import unittest
+from io import StringIO
+from util.readmtp import readMTP
+from util.raw_index import RawIndex
+from raw_scans import readRawScans
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTrawIndex(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        # Copy the first 50 scans of the raw data file, leaving the E line
+        # out of scan 10 and ending with the first lines of the next scan, so
+        # there are two incomplete scans.
+        data = readRawScans(50, partial=True)
+        eline = data.find(b'\nE ', len(readRawScans(10)),
+                          len(readRawScans(11))) + 1
+        eend = data.find(b'\n', eline) + 1
+        data = data[0:eline] + data[eend:]
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rawfile = os.path.join(self.tmpdir.name, 'test.RAW')
+        with open(self.rawfile, 'wb') as f:
+            f.write(data)
+
+        # The scans as read by iter_scans()
+        reader = readMTP()
+        self.scans = []
+        for rawscan in reader.iter_scans(self.rawfile):
+            reader.parseAsciiPacket(reader.getAsciiPacket())
+            self.scans.append(json.dumps(reader.copyValues(rawscan)))
+
+        self.reader = readMTP()
+        self.index = RawIndex(self.rawfile)
+
+    def testBuild(self):
+        """ Test that the index finds the complete and incomplete scans """
+        self.assertEqual(len(self.index), 49)
+        self.assertEqual(len(self.scans), 49)
+        entries = self.index.getEntries()
+        self.assertEqual(len(entries), 51)
+        self.assertEqual(entries['complete'].tolist().count(0), 2)
+        self.assertEqual(entries['complete'][10], 0)
+        self.assertEqual(entries['time'][0], 6 * 3600 + 22 * 60 + 52)
+
+        # The index is saved and reused until the .RAW file changes
+        self.assertTrue(os.path.isfile(self.rawfile + '.idx'))
+        self.assertTrue(self.index.isCurrent())
+        with open(self.rawfile, 'a') as f:
+            f.write("\n")
+        self.assertFalse(self.index.isCurrent())
+        self.assertEqual(len(RawIndex(self.rawfile)), 49)
+
+    def testReadScan(self):
+        """ Test that a scan read from the index matches the serial read """
+        for index in [0, 10, 48]:
+            rawscan = self.index.readScan(self.reader, index)
+            self.assertEqual(json.dumps(self.reader.copyValues(rawscan)),
+                             self.scans[index])
+        with self.assertRaises(IndexError):
+            self.index.readScan(self.reader, 49)
+
+        scans = [json.dumps(self.reader.copyValues(rawscan)) for rawscan in
+                 self.index.readScans(self.reader, 5, 15)]
+        self.assertEqual(scans, self.scans[5:15])
+
+    def testReadTimeRange(self):
+        """ Test reading the scans in a time range """
+        start = self.index.getEntry(20)[2]
+        end = self.index.getEntry(30)[2]
+        scans = [json.dumps(self.reader.copyValues(rawscan)) for rawscan in
+                 self.index.readTimeRange(self.reader, start, end - 1)]
+        self.assertEqual(scans, self.scans[20:30])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
@@ -0,0 +1,137 @@
+###############################################################################
+# Test util/raw_tail.py
+#
+# This test uses the first scans of the DEEPWAVE RF01 raw data file as test
+# input, written to a new file a piece at a time as mtp_client would.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import logging
+import tempfile
+import unittest
+from io import StringIO
+from viewer.MTPclient import MTPclient
+from util.readmtp import readMTP
+from util.raw_tail import RawTail
+from lib.rootdir import getrootdir
+from raw_scans import RAWFILE, readRawScans
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTrawTail(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        # The first 30 scans of the raw data file
+        self.data = readRawScans(30)
+
+        # The scans as read by iter_scans()
+        reader = readMTP()
+        self.scans = []
+        for rawscan in reader.iter_scans(RAWFILE):
+            reader.parseAsciiPacket(reader.getAsciiPacket())
+            self.scans.append(json.dumps(reader.copyValues(rawscan)))
+            if len(self.scans) == 30:
+                break
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rawfile = os.path.join(self.tmpdir.name, 'N2014060606.22')
+        open(self.rawfile, 'wb').close()
+
+    def write(self, start, end):
+        """ Append part of the test data to the raw file """
+        with open(self.rawfile, 'ab') as f:
+            f.write(self.data[start:end])
+
+    def readNew(self, tail, reader):
+        """ Return the new scans read by tail, as JSON """
+        scans = []
+        for rawscan in tail.readNewScans(reader):
+            reader.parseAsciiPacket(reader.getAsciiPacket())
+            scans.append(json.dumps(reader.copyValues(rawscan)))
+        return scans
+
+    def testFollow(self):
+        """ Test that each scan is read once, when it is complete """
+        tail = RawTail(self.rawfile)
+        reader = readMTP()
+        self.assertEqual(self.readNew(tail, reader), [])
+
+        # Write the file in pieces that split lines and scans
+        scans = []
+        for start in range(0, len(self.data), 300):
+            self.write(start, start + 300)
+            new = self.readNew(tail, reader)
+            self.assertLessEqual(len(new), 1)
+            scans.extend(new)
+
+            # Only whole scans are read
+            self.assertLessEqual(tail.offset, start + 300)
+
+        self.assertEqual(scans, self.scans)
+        self.assertEqual(self.readNew(tail, reader), [])
+        self.assertEqual(tail.incompleteScans, 0)
+
+    def testIncomplete(self):
+        """ Test that a scan missing a line is skipped once it has ended """
+        # Leave out the B line of the second scan
+        starts = [self.data.find(b'\nA ', 0) + 1]
+        starts.append(self.data.find(b'\nA ', starts[0]) + 1)
+        starts.append(self.data.find(b'\nA ', starts[1]) + 1)
+        bline = self.data.find(b'\nB ', starts[1]) + 1
+        bend = self.data.find(b'\n', bline) + 1
+        self.write(0, bline)
+
+        tail = RawTail(self.rawfile)
+        reader = readMTP()
+        self.assertEqual(self.readNew(tail, reader), self.scans[0:1])
+
+        # The scan is only skipped once the A line of the next scan is
+        # written
+        aend = self.data.find(b'\n', starts[2]) + 1
+        self.write(bend, aend - 1)
+        self.assertEqual(self.readNew(tail, reader), [])
+        self.assertEqual(tail.incompleteScans, 0)
+        self.write(aend - 1, aend)
+        self.assertEqual(self.readNew(tail, reader), [])
+        self.assertEqual(tail.incompleteScans, 1)
+
+        self.write(aend, len(self.data))
+        self.assertEqual(self.readNew(tail, reader), self.scans[2:])
+
+    def testRestart(self):
+        """ Test that the client skips scans already in flightData """
+        self.write(0, len(self.data))
+        client = MTPclient()
+        client.readConfig(os.path.join(getrootdir(), 'Data', 'NGV',
+                                       'DEEPWAVE', 'config', 'proj.yml'))
+        client.initIWG()
+        client.reader.flightData.extend(
+            [json.loads(scan) for scan in self.scans[0:10]])
+
+        client.followRaw(self.rawfile)
+        dates = [rawscan['Aline']['date'] for rawscan in client.readRawTail()]
+        self.assertEqual(dates, [json.loads(scan)['Aline']['date']
+                                 for scan in self.scans[10:]])
+
+        # The IWG packet is parsed too
+        self.assertNotEqual(client.reader.rawscan['IWG1line']['values']
+                            ['TIME']['val'], '')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
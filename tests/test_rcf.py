@@ -420,5 +420,69 @@ class TESTrcf(unittest.TestCase):
                                  self.rcf.NUM_BRT_TEMPS + i],
                                  RCwt[j * self.rcf.NUM_BRT_TEMPS + i])
 
+    def testFLArrays(self):
+        """ Test flight level arrays match the flight level dictionaries """
+        FLArrays = self.rcf.getFL_RC_Arrays()
+        self.assertEqual(FLArrays['sOBav'].shape,
+                         (self.numFlightLevels, self.rcf.NUM_BRT_TEMPS))
+        self.assertEqual(FLArrays['Src'].shape,
+                         (self.numFlightLevels, self.rcf.NUM_RETR_LVLS,
+                          self.rcf.NUM_BRT_TEMPS))
+        for i in range(self.RCFHdr['NFL']):
+            self.assertEqual(FLArrays['sBP'][i], self.RCFFl[i]['sBP'])
+            self.assertEqual(list(FLArrays['sRTav'][i]),
+                             list(self.RCFFl[i]['sRTav']))
+            # Src is [retrieval level][observable]
+            self.assertEqual(FLArrays['Src'][i][1][2],
+                             self.RCFFl[i]['Src'][self.rcf.NUM_BRT_TEMPS + 2])
+
+    def testFlightLevelBracket(self):
+        """ Test flight levels bracketing a given PAltKm """
+        self.assertEqual(self.rcf.getFlightLevelBracket(15), [0, 0, 0.0])
+        self.assertEqual(self.rcf.getFlightLevelBracket(-1), [12, 12, 1.0])
+        [Top, Bot, BotWt] = self.rcf.getFlightLevelBracket(5.3473)
+        self.assertEqual([Top, Bot], [4, 5])
+        self.assertEqual('%.4f' % BotWt, '0.6527')
+
+    def testRCAvgWtCache(self):
+        """ Test caching of weighted average RC sets """
+        # Cache is off by default
+        self.assertIsNot(self.rcf.getRCAvgWt(5.3473),
+                         self.rcf.getRCAvgWt(5.3473))
+        self.assertEqual(self.rcf.getRCAvgWtCacheStats()['maxsize'], 0)
+
+        self.rcf.setRCAvgWtCache(2, 0.0)
+        RcSetAvWt = self.rcf.getRCAvgWt(5.3473)
+        self.assertIs(self.rcf.getRCAvgWt(5.3473), RcSetAvWt)
+        # Different weight between same flight levels is a miss
+        self.assertIsNot(self.rcf.getRCAvgWt(5.3474), RcSetAvWt)
+        stats = self.rcf.getRCAvgWtCacheStats()
+        self.assertEqual([stats['hits'], stats['misses'], stats['size']],
+                         [1, 2, 2])
+
+        # Least recently used set is dropped when cache is full
+        self.rcf.getRCAvgWt(15)
+        self.rcf.getRCAvgWt(5.3473)
+        stats = self.rcf.getRCAvgWtCacheStats()
+        self.assertEqual([stats['hits'], stats['misses'], stats['size']],
+                         [1, 4, 2])
+
+        # With a tolerance, nearby altitudes share a set
+        self.rcf.setRCAvgWtCache(tolerance=0.01)
+        RcSetAvWt = self.rcf.getRCAvgWt(5.3473)
+        self.assertIs(self.rcf.getRCAvgWt(5.3474), RcSetAvWt)
+        # Set is calculated at the quantized weight, so is close but not
+        # exact
+        self.assertAlmostEqual(RcSetAvWt['sBP'], 516.44, delta=0.5)
+        stats = self.rcf.getRCAvgWtCacheStats()
+        self.assertEqual([stats['hits'], stats['misses'], stats['maxsize']],
+                         [1, 1, 2])
+
+        # Turn cache off
+        self.rcf.setRCAvgWtCache(0)
+        self.assertIsNot(self.rcf.getRCAvgWt(5.3473),
+                         self.rcf.getRCAvgWt(5.3473))
+        self.assertEqual(self.rcf.getRCAvgWtCacheStats()['size'], 0)
+
     def tearDown(self):
         logger.delHandler()
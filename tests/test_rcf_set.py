@@ -20,6 +20,10 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import os
+import json
+import shutil
+import tempfile
 import unittest
 from util.rcf_set import RetrievalCoefficientFileSet
 
@@ -162,6 +166,43 @@ class TESTrcfSet(unittest.TestCase):
                          '-1.63965')
         self.assertEqual(len(BestWtdRCSet['FL_RCs']['Src']), 990)
 
+    def testCompactRCSet(self):
+        """ Save a compact reference to an RC set and rebuild it """
+        self.rcf = RetrievalCoefficientFileSet()
+        self.rcf.getRCFs(self.Directory)
+
+        ACAltKm = 8.206
+        scanBTs = [238.371, 240.351, 241.809, 243.789, 246.028, 248.06,
+                   249.414, 250.665, 252.123, 254.207, 240.948, 241.837,
+                   242.815, 244.682, 246.238, 248.06, 248.682, 249.749,
+                   250.238, 251.438, 243.099, 244.25, 245.044, 245.639,
+                   246.79, 248.06, 248.893, 249.608, 250.679, 251.433]
+        BestWtdRCSet = self.rcf.getBestWeightedRCSet(scanBTs, ACAltKm, 0.0)
+        expected = json.loads(json.dumps(BestWtdRCSet))
+
+        # The reference has no RCs, so is much smaller
+        RCSetRef = self.rcf.compactRCSet(BestWtdRCSet)
+        self.assertNotIn('FL_RCs', RCSetRef)
+        self.assertLess(len(json.dumps(RCSetRef)) * 10,
+                        len(json.dumps(BestWtdRCSet)))
+
+        # Rebuilding the set after a round trip through JSON gives the
+        # original set
+        RCSetRef = json.loads(json.dumps(RCSetRef))
+        self.assertEqual(self.rcf.expandRCSet(RCSetRef), expected)
+
+        # Sets that already have RCs are returned as is
+        self.assertIs(self.rcf.expandRCSet(expected), expected)
+
+        # Fall back to finding the RCF by id
+        RCSetRef['RCFIndex'] = len(self.rcf.getRCFVector())
+        self.assertEqual(self.rcf.expandRCSet(RCSetRef)['FL_RCs'],
+                         expected['FL_RCs'])
+
+        RCSetRef['RCFId'] = 'NRCXX000'
+        with self.assertRaises(ValueError):
+            self.rcf.expandRCSet(RCSetRef)
+
     def testgetBestWeightedRCSetSort(self):
         # Initialize with a valid RCF directory and empty filelist so get
         # everything
@@ -212,5 +253,90 @@ class TESTrcfSet(unittest.TestCase):
         self.assertEqual(BestWtdRCSet['RCFArray'][1][1], 4.72683160362011)
         self.assertEqual(BestWtdRCSet['RCFArray'][2][1], 5.368689246096905)
 
+    def testTopK(self):
+        """ Test that only the best k templates are ranked when requested """
+        self.rcf = RetrievalCoefficientFileSet()
+        self.rcf.getRCFs(self.Directory + "/RC")
+
+        ACAltKm = 8.206
+        scanBTs = [238.371, 240.351, 241.809, 243.789, 246.028, 248.06,
+                   249.414, 250.665, 252.123, 254.207, 240.948, 241.837,
+                   242.815, 244.682, 246.238, 248.06, 248.682, 249.749,
+                   250.238, 251.438, 243.099, 244.25, 245.044, 245.639,
+                   246.79, 248.06, 248.893, 249.608, 250.679, 251.433]
+        self.assertIsNone(self.rcf.getTopK())
+        ranking = self.rcf.getRCFRanking(scanBTs, ACAltKm)
+        self.assertEqual([entry[0] for entry in ranking],
+                         ["NRCDG067", "NRCDE067", "NRCDF067"])
+
+        self.rcf.setTopK(2)
+        BestWtdRCSet = self.rcf.getBestWeightedRCSet(scanBTs, ACAltKm, 0.0)
+        self.assertEqual(BestWtdRCSet['RCFId'], "NRCDG067")
+        self.assertEqual(BestWtdRCSet['SumLnProb'], 4.363823941531192)
+        self.assertEqual(BestWtdRCSet['RCFArray'], ranking[:2])
+
+        # k passed in overrides the set's k
+        BestWtdRCSet = self.rcf.getBestWeightedRCSet(scanBTs, ACAltKm, 0.0, 1)
+        self.assertEqual(BestWtdRCSet['RCFArray'], ranking[:1])
+
+        # The full ranking is still available
+        self.assertEqual(self.rcf.getRCFRanking(scanBTs, ACAltKm), ranking)
+
+        # 0 ranks everything
+        self.rcf.setTopK(0)
+        self.assertIsNone(self.rcf.getTopK())
+
+    def testCache(self):
+        """ Test that RCF set cache is written, read and rebuilt """
+        tmpdir = tempfile.mkdtemp()
+        RCdir = os.path.join(tmpdir, "RC")
+        shutil.copytree(self.Directory + "/RC", RCdir)
+        scanBTs = [238.371, 240.351, 241.809, 243.789, 246.028, 248.06,
+                   249.414, 250.665, 252.123, 254.207, 240.948, 241.837,
+                   242.815, 244.682, 246.238, 248.06, 248.682, 249.749,
+                   250.238, 251.438, 243.099, 244.25, 245.044, 245.639,
+                   246.79, 248.06, 248.893, 249.608, 250.679, 251.433]
+
+        try:
+            # First time through, cache is written next to the RC dir
+            rcfset = RetrievalCoefficientFileSet()
+            rcfset.getRCFs(RCdir)
+            cachefile = rcfset.getCacheFileName(RCdir)
+            self.assertEqual(cachefile, os.path.join(tmpdir, "RC.RCFcache"))
+            self.assertTrue(os.path.isfile(cachefile))
+            key = rcfset.getCacheKey(RCdir)
+            self.assertEqual(len(rcfset.readCache(RCdir, key)), 3)
+            Best = rcfset.getBestWeightedRCSet(scanBTs, 8.206, 0.0)
+            RCFArray = [list(elem) for elem in Best['RCFArray']]
+
+            # Second time through, RCFs come from the cache and give the same
+            # result
+            rcfset = RetrievalCoefficientFileSet()
+            rcfset.getRCFs(RCdir)
+            Best = rcfset.getBestWeightedRCSet(scanBTs, 8.206, 0.0)
+            self.assertEqual(Best['RCFArray'], RCFArray)
+            self.assertEqual(Best['RCFArray'][0][1], 4.363823941531192)
+
+            # A different filelist or a modified RCF file invalidates the
+            # cache
+            self.assertEqual(rcfset.readCache(
+                RCdir, rcfset.getCacheKey(RCdir, ["NRCDE067"])), {})
+            stat = os.stat(RCdir + "/NRCDE067.RCF")
+            os.utime(RCdir + "/NRCDE067.RCF",
+                     ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+            self.assertNotEqual(rcfset.getCacheKey(RCdir), key)
+            self.assertEqual(rcfset.readCache(
+                RCdir, rcfset.getCacheKey(RCdir)), {})
+
+            # and it is rebuilt on the next read
+            rcfset = RetrievalCoefficientFileSet()
+            rcfset.getRCFs(RCdir, ["NRCDE067", "NRCDF067"])
+            self.assertEqual(len(rcfset.getRCFVector()), 2)
+            key = rcfset.getCacheKey(RCdir, ["NRCDE067", "NRCDF067"])
+            self.assertEqual(sorted(rcfset.readCache(RCdir, key)),
+                             ["NRCDE067.RCF", "NRCDF067.RCF"])
+        finally:
+            shutil.rmtree(tmpdir)
+
     def tearDown(self):
         logger.delHandler()
@@ -0,0 +1,118 @@
+###############################################################################
+# Test util/rcf_stack.py
+#
+# This test uses the RCF files in test_data/RC as test input files.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import numpy
+import unittest
+import logging
+from io import StringIO
+from util.rcf_set import RetrievalCoefficientFileSet
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTrcfStack(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        self.rcfset = RetrievalCoefficientFileSet()
+        self.rcfset.getRCFs("../tests/test_data/RC", cache=False)
+        self.stack = self.rcfset.getStack()
+
+        self.scanBTs = [238.371, 240.351, 241.809, 243.789, 246.028, 248.06,
+                        249.414, 250.665, 252.123, 254.207, 240.948, 241.837,
+                        242.815, 244.682, 246.238, 248.06, 248.682, 249.749,
+                        250.238, 251.438, 243.099, 244.25, 245.044, 245.639,
+                        246.79, 248.06, 248.893, 249.608, 250.679, 251.433]
+
+    def testStackable(self):
+        """ Test that the RCF templates are stacked """
+        self.assertTrue(self.stack.isStackable())
+        self.assertEqual(self.stack.sOBav.shape, (3, 13, 30))
+        self.assertEqual(self.stack.sOBrms.shape, (3, 13, 30))
+
+    def testFlightLevelBrackets(self):
+        """ Test brackets match the brackets from each RCF """
+        for PAltKm in [15, 13.0, 8.206, 5.0, 0.25, 0.0, -1]:
+            [Top, Bot, BotWt] = self.stack.getFlightLevelBrackets(PAltKm)
+            for i, rcf in enumerate(self.rcfset.getRCFVector()):
+                self.assertEqual([Top[i], Bot[i], BotWt[i]],
+                                 rcf.getFlightLevelBracket(PAltKm))
+
+        # No bracket can be found for a missing altitude
+        self.assertIsNone(self.stack.getFlightLevelBrackets(float('nan')))
+
+    def testLnP(self):
+        """ Test stacked scores are identical to scoring one RCF at a time """
+        for PAltKm in [15, 8.206, 5.3473, 2.0, -1]:
+            lnP = self.stack.getLnP(self.scanBTs, PAltKm)
+            RCFIndex_lnP_Array = [[int(index), lnP[index].item()]
+                                  for index in self.stack.rank(lnP)]
+            self.assertEqual(RCFIndex_lnP_Array,
+                             self.rcfset.getRCFIndex_lnP_Array(self.scanBTs,
+                                                               PAltKm))
+
+        # Order of RCFs in the set depends on the OS, so check by RCF Id
+        lnP = self.stack.getLnP(self.scanBTs, 8.206)
+        RCFs = self.rcfset.getRCFVector()
+        self.assertEqual([RCFs[index].getId()
+                          for index in self.stack.rank(lnP)],
+                         ["NRCDG067", "NRCDE067", "NRCDF067"])
+        self.assertEqual(min(lnP), 4.363823941531192)
+
+    def testRankTopK(self):
+        """ Test that the top k RCFs are the first k of the full ranking """
+        for PAltKm in [15, 8.206, 5.3473, -1]:
+            lnP = self.stack.getLnP(self.scanBTs, PAltKm)
+            ranking = self.rcfset.getRCFIndex_lnP_Array(self.scanBTs, PAltKm)
+            for k in [1, 2, 3]:
+                self.assertEqual(list(self.stack.rank(lnP, k)),
+                                 list(self.stack.rank(lnP)[:k]))
+                # Scoring one RCF at a time with pruning gives the same RCFs
+                self.assertEqual(self.rcfset.getRCFIndex_lnP_Array(
+                    self.scanBTs, PAltKm, k), ranking[:k])
+
+        # Ties are broken by RCF order, missing scores come last, and each
+        # scan is ranked separately
+        lnP = numpy.array([[3.0, 1.0, numpy.nan, 1.0, 0.5, 1.0],
+                           [numpy.nan, 2.0, 2.0, 2.0, 2.0, 1.0]])
+        self.assertEqual(self.stack.rank(lnP, 3).tolist(),
+                         [[4, 1, 3], [5, 1, 2]])
+        self.assertEqual(self.stack.rank(lnP[1], 6).tolist(),
+                         [5, 1, 2, 3, 4, 0])
+
+    def testShare(self):
+        """ Test that a stack attached to shared memory gives the same lnP """
+        shared = self.stack.share()
+        try:
+            attached = type(self.stack).attach(shared)
+            self.assertEqual(attached.getRCFIds(), self.stack.getRCFIds())
+            self.assertEqual(attached.getRCFFileNames(),
+                             self.stack.getRCFFileNames())
+            self.assertTrue(numpy.array_equal(attached.Src, self.stack.Src))
+            self.assertFalse(attached.Src.flags.writeable)
+            for PAltKm in [15, 8.206, 5.3473, -1]:
+                self.assertTrue(numpy.array_equal(
+                    attached.getLnP(self.scanBTs, PAltKm),
+                    self.stack.getLnP(self.scanBTs, PAltKm)))
+            attached.close()
+            self.assertFalse(attached.isStackable())
+        finally:
+            self.stack.unlink()
+
+    def tearDown(self):
+        logger.delHandler()
@@ -16,6 +16,10 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import os
+import shutil
+import netCDF4
+import tempfile
 import unittest
 from random import seed
 from random import randint
@@ -186,6 +190,43 @@ class TESTreadgvnc(unittest.TestCase):
         seconds = self.reader.NGseconds()
         self.assertEqual(seconds.iloc[row], testtime)
 
+    def test_getTimeIndex(self):
+        """ Test that the time index follows the file and leaves ncdata """
+        filename = "../tests/test_data/DEEPWAVE/LRT/V1.0_20150324/" + \
+                   "RF01.20140606.061800_133700.PNI.nc"
+        ncdata = self.reader.getNGvalues(filename, ["PALT_A"])
+        seconds = self.reader.NGseconds().tolist()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ncfile = os.path.join(tmpdir, 'test.nc')
+            shutil.copy2(filename, ncfile)
+            index = self.reader.getTimeIndex(ncfile)
+            self.assertEqual(index.getIndex(seconds[10]), 10)
+            self.assertIs(self.reader.getTimeIndex(ncfile), index)
+
+            # Looking up times doesn't replace the data that was read
+            self.assertIs(self.reader.ncdata, ncdata)
+            self.assertEqual(self.reader.varlist, ["PALT_A"])
+
+            # Shift the times in the file, so the index is read again
+            with netCDF4.Dataset(ncfile, mode='a') as nc:
+                nc.variables["Time"][:] = nc.variables["Time"][:] + 5
+            stat = os.stat(ncfile)
+            os.utime(ncfile, ns=(stat.st_atime_ns,
+                                 stat.st_mtime_ns + 1000000000))
+            index = self.reader.getTimeIndex(ncfile)
+            self.assertEqual(index.getIndex(seconds[10] + 5), 10)
+
+    def test_getValAtTime_day(self):
+        """ Test that a time on the wrong day is not found """
+        filename = "../tests/test_data/DEEPWAVE/LRT/V1.0_20150324/" + \
+                   "RF01.20140606.061800_133700.PNI.nc"
+        # The time is in the file, but the same time the day before is not
+        self.reader.getValAtTime(filename, "PALT_A", "2014-06-06 09:00:00")
+        with self.assertRaises(IndexError):
+            self.reader.getValAtTime(filename, "PALT_A",
+                                     "2014-06-05 09:00:00")
+
 #   def test_NGseconds_rollover(self):
 #        """
 #        Test conversion to seconds during midnight rollover
@@ -157,6 +157,30 @@ class TESTreadmtp(unittest.TestCase):
         self.mtp.createEdata()
         self.assertEqual(self.mtp.getEline(), self.Eline)
 
+    def test_typedValues(self):
+        """ Test that packet values are converted to numbers when parsed """
+        self.mtp.parseAsciiPacket(self.udp)
+        self.assertEqual(self.mtp.getTypedValues('Bline').dtype, int)
+        self.assertEqual(self.mtp.getTypedValues('Bline')[0], 18089)
+        self.assertEqual(self.mtp.getTypedValues('Ptline').tolist(),
+                         [2175, 13808, 13811, 10259, 13368, 13416, 13310,
+                          14460])
+        self.assertEqual(self.mtp.getTypedVar('Aline', 'SAAT'), 263.32)
+        self.assertEqual(self.mtp.getTypedVar('M02line', 'TNCCNTE'), 4095)
+        self.assertEqual(self.mtp.getTypedVar('Eline', 'TCNT'),
+                         [20890, 22318, 22138, 19200, 20582, 20097])
+
+        # The typed values aren't archived with the strings
+        self.assertNotIn('typed',
+                         self.mtp.copyValues(self.mtp.getRawscan())['Bline'])
+
+        # If a value is missing, the line is converted when it is used
+        values = self.M01line.split()[1:]
+        values[1] = ''
+        self.mtp.assignM01values(values)
+        self.assertIsNone(self.mtp.getTypedValues('M01line'))
+        self.assertEqual(self.mtp.getTypedVar('M01line', 'VM08CNTE'), 2928)
+
     def test_getVarArray(self):
         """ Test getting an array of values for a variable """
         # Save some test data to the dictionary
@@ -192,6 +216,30 @@ class TESTreadmtp(unittest.TestCase):
         vals = self.mtp.getVarArray('Eline', 'TCNT')
         self.assertEqual(vals, None)
 
+    def test_archive(self):
+        """ Test that archived scans only hold their values """
+        self.mtp.parseAsciiPacket(self.udp)
+        self.mtp.archive()
+        scan = self.mtp.getRecord(0)
+
+        self.assertNotIn('re', scan['Aline'])
+        self.assertEqual(scan['asciiPacket'], self.udp)
+        self.assertEqual(scan['Aline']['values']['SAPITCH'], {'val': '+06.49'})
+        self.assertEqual(scan['M01line']['values']['VM08CNTE']['val'], '2928')
+        self.assertTrue(numpy.isnan(
+            scan['M01line']['values']['VM08CNTE']['volts']))
+
+        # Changing the current scan doesn't change the archived scan
+        self.mtp.parseAsciiPacket(self.udp.replace('+06.49', '+07.00'))
+        self.assertEqual(scan['Aline']['values']['SAPITCH']['val'], '+06.49')
+
+        # Metadata is still available while viewing the archived scan
+        self.mtp.setRawscan(0)
+        self.assertEqual(self.mtp.get_metadata('Aline', 'SAPITCH', 'units'),
+                         'degree')
+        self.assertEqual(self.mtp.getName('M01line', 'VM08CNTE'), '-8V  PS')
+        self.mtp.resetRawscan()
+
     def test_getVarList(self):
         """ Test getting list of vars from an MTP line """
         vars = self.mtp.getVarList('Eline')
@@ -319,6 +367,38 @@ class TESTreadmtp(unittest.TestCase):
                 self.assertTrue(numpy.isnan(self.mtp.rawscan['Eline']
                                 ['values'][key]['val'][i]))
 
+    def testIterScans(self):
+        """ Test that iter_scans yields the same scans as readRawScan """
+        selectedRawFile = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE',
+                                       'Raw', 'N2014060606.22')
+        reader = readMTP()
+        with open(selectedRawFile) as raw_data_file:
+            for rawscan in self.mtp.iter_scans(selectedRawFile):
+                self.assertTrue(reader.readRawScan(raw_data_file))
+                for linetype in ['Aline', 'IWG1line', 'Bline', 'M01line',
+                                 'M02line', 'Ptline', 'Eline']:
+                    self.assertEqual(rawscan[linetype],
+                                     reader.rawscan[linetype])
+            self.assertFalse(reader.readRawScan(raw_data_file))
+        self.assertEqual(self.mtp.incompleteScans, 0)
+
+        # A scan missing its B line, and a scan cut off at the end of the
+        # file, are skipped and reported
+        lines = [self.Aline, self.Bline, self.M01line, self.M02line,
+                 self.Ptline, self.Eline]
+        iwg = "IWG1,20140606T062416,-43.2897,172.281,3351.27"
+        scans = [lines[0:1] + [iwg] + lines[1:],
+                 lines[0:1] + [iwg] + lines[2:],
+                 lines[0:1] + [iwg] + lines[1:],
+                 lines[0:1] + [iwg] + lines[1:3]]
+        raw_data_file = StringIO("\n\n".join(["\n".join(scan)
+                                              for scan in scans]) + "\n")
+        self.assertEqual(len(list(self.mtp.iter_scans(raw_data_file))), 2)
+        self.assertEqual(self.mtp.incompleteScans, 2)
+        self.assertIn("Missing Bline", self.stream.getvalue())
+        self.assertIn("Missing M02line, Ptline, Eline",
+                      self.stream.getvalue())
+
     def testClearFlightData(self):
         # Read in some data
         # selectedRawFile is the Raw file listed in the Production dir setup
@@ -0,0 +1,159 @@
+###############################################################################
+# Test util/retrieval_cache.py
+#
+# This test uses the first scans of the DEEPWAVE RF01 raw data file as test
+# input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import logging
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from proc.batch import MTPbatch
+from util.retrieval_cache import RetrievalCache, getCodeFingerprint
+from lib.rootdir import getrootdir
+from raw_scans import copyRawScans
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTretrievalCache(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cachefile = os.path.join(self.tmpdir.name, 'RC.retrievals')
+        self.tbi = [250.0 + i / 10 for i in range(30)]
+
+    def testGetPut(self):
+        """ Test that results are found by scan and RCF set """
+        cache = RetrievalCache(self.cachefile, 1000000, "RCF set 1")
+        key = cache.getKey(self.tbi, '+03.18')
+        self.assertIsNone(cache.get(key))
+        ATP = {'Temperatures': [float('nan'), 283.1], 'RCFIndex': 4}
+        cache.put(key, {'RCFId': 'NRCKA068'}, ATP)
+        cache.close()
+
+        cache = RetrievalCache(self.cachefile, 1000000, "RCF set 1")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(json.dumps(cache.get(key)),
+                         json.dumps([{'RCFId': 'NRCKA068'}, ATP]))
+        self.assertEqual(cache.getStats(),
+                         "1 hits, 0 misses (100.0% hit rate)")
+
+        # A different scan, altitude or RCF set has a different key
+        tbi = list(self.tbi)
+        tbi[29] = 253.0
+        self.assertNotEqual(cache.getKey(tbi, '+03.18'), key)
+        self.assertNotEqual(cache.getKey(self.tbi, '+03.19'), key)
+        other = RetrievalCache(self.cachefile, 1000000, "RCF set 2")
+        self.assertNotEqual(other.getKey(self.tbi, '+03.18'), key)
+
+        cache.get(cache.getKey(tbi, '+03.18'))
+        self.assertEqual(cache.getStats(),
+                         "1 hits, 1 misses (50.0% hit rate)")
+        cache.resetStats()
+        self.assertEqual(cache.getStats(), "0 hits, 0 misses (0.0% hit rate)")
+
+    def testCodeFingerprint(self):
+        """ Test that results made by other retrieval code are not used """
+        cache = RetrievalCache(self.cachefile, 1000000, "RCF set 1")
+        key = cache.getKey(self.tbi, '+03.18')
+        with patch('util.retrieval_cache.getCodeFingerprint',
+                   return_value='changed'):
+            other = RetrievalCache(self.cachefile, 1000000, "RCF set 1")
+        self.assertNotEqual(other.getKey(self.tbi, '+03.18'), key)
+
+        # The fingerprint changes with the source of any file
+        source = os.path.join(self.tmpdir.name, 'retriever.py')
+        with open(source, 'w') as f:
+            f.write("RETRIEVAL_LEVELS = 33\n")
+        fingerprint = getCodeFingerprint(['util/rcf.py', source])
+        self.assertEqual(getCodeFingerprint(['util/rcf.py', source]),
+                         fingerprint)
+        with open(source, 'w') as f:
+            f.write("RETRIEVAL_LEVELS = 34\n")
+        self.assertNotEqual(getCodeFingerprint(['util/rcf.py', source]),
+                            fingerprint)
+
+        # If the code can't be read, nothing is cached
+        with patch('util.retrieval_cache.getCodeFingerprint',
+                   return_value=None):
+            cache = RetrievalCache(self.cachefile, 1000000, "RCF set 1")
+        cache.put(key, False, {})
+        self.assertIsNone(cache.get(key))
+        self.assertIn("Could not read the retrieval code",
+                      self.stream.getvalue())
+
+    def testEvict(self):
+        """ Test that the results used longest ago are removed first """
+        cache = RetrievalCache(self.cachefile, 1000000, "")
+        keys = []
+        for i in range(20):
+            self.tbi[0] = i
+            keys.append(cache.getKey(self.tbi, '+03.18'))
+            cache.put(keys[-1], False, {'values': "x" * 1000})
+            cache.flush()
+        size = cache.getSize()
+        self.assertEqual(len(cache), 20)
+
+        # Use the first result, then shrink the cache
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.flush()
+        cache._maxsize = size // 2
+        cache.evict()
+        self.assertLessEqual(cache.getSize(), size // 2)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[19]))
+
+    def testReprocess(self):
+        """ Test that reprocessing a flight reuses the results """
+        projdir = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE')
+        testfile = copyRawScans(20, os.path.join(self.tmpdir.name,
+                                                 'test.RAW'))
+
+        flights = []
+        for run in range(2):
+            batch = MTPbatch(os.path.join(projdir, 'config', 'proj.yml'), 1)
+            client = batch.client
+            # The cache is off unless the project turns it on
+            self.assertIsNone(client.retrievalCache)
+            client.retrievalCache = RetrievalCache(self.cachefile, 1000000,
+                                                   "DEEPWAVE")
+            storefile = os.path.join(self.tmpdir.name, str(run) + '.store')
+            client.getFlightStoreFilename = lambda: storefile
+            batch.readRawFile(testfile)
+            self.assertEqual(batch.processFlight(), 0)
+            flights.append(json.dumps(client.reader.flightData))
+
+            # Real-time retrievals don't use the cache
+            client.reader.setRawscan(0)
+            client.createProfile()
+            self.assertEqual(client.retrievalCache.getStats(),
+                             "0 hits, 0 misses (0.0% hit rate)")
+
+        self.assertEqual(flights[1], flights[0])
+        self.assertIn("Retrieval cache: 0 hits, 20 misses",
+                      self.stream.getvalue())
+        self.assertIn("Retrieval cache: 20 hits, 0 misses",
+                      self.stream.getvalue())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
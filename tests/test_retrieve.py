@@ -0,0 +1,169 @@
+###############################################################################
+# Test proc/retrieve.py
+#
+# This test uses the first scans of the DEEPWAVE RF01 raw data file as test
+# input.
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import logging
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from proc.batch import MTPbatch
+from proc import retrieve
+from proc.retrieve import splitScans, retrieveScans, retrieveFlight
+from util.flight_store import FlightStore
+from lib.rootdir import getrootdir
+from raw_scans import copyRawScans
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTretrieve(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        projdir = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE')
+        self.configfile = os.path.join(projdir, 'config', 'proj.yml')
+
+        # Copy the first 40 scans of the raw data file
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rawfile = copyRawScans(40, os.path.join(self.tmpdir.name,
+                                                     'test.RAW'))
+
+    def readFlight(self, name):
+        """ Read the test scans into a new client, with its own store """
+        batch = MTPbatch(self.configfile, 1)
+        client = batch.client
+        storefile = os.path.join(self.tmpdir.name, name + '.mtpstore')
+        client.getFlightStoreFilename = lambda: storefile
+        jsonfile = os.path.join(self.tmpdir.name, name + '.json')
+        client.getMtpRealTimeFilename = lambda: jsonfile
+        # Do every retrieval, rather than use saved results
+        client.retrievalCache = None
+        batch.readRawFile(self.rawfile)
+        return [batch, storefile]
+
+    def createProfiles(self, client, storefile):
+        """ Do the retrievals one scan at a time, as in real time """
+        for index in range(len(client.reader.flightData)):
+            client.reader.setRawscan(index)
+            client.createProfile()
+            client.reader.updateStore(storefile, index)
+        client.reader.resetRawscan()
+
+    def testSplitScans(self):
+        """ Test that the chunks hold every scan once, in order """
+        [batch, storefile] = self.readFlight('split')
+        chunks = splitScans(batch.client, 6)
+        self.assertEqual(len(chunks), 6)
+        indices = [scan[0] for chunk in chunks for scan in chunk]
+        self.assertEqual(indices, list(range(40)))
+        self.assertEqual(chunks[0][0][1],
+                         batch.client.reader.flightData[0]['tbi'])
+
+        # No more chunks than scans
+        self.assertEqual(len(splitScans(batch.client, 100)), 40)
+
+        # Only the given scans
+        chunks = splitScans(batch.client, 2, [3, 5, 7])
+        self.assertEqual([[scan[0] for scan in chunk] for chunk in chunks],
+                         [[3], [5, 7]])
+        self.assertEqual(splitScans(batch.client, 2, []), [])
+
+    def testRetrieveFlight(self):
+        """ Test that the results match doing one scan at a time """
+        [serial, serialstore] = self.readFlight('serial')
+        self.createProfiles(serial.client, serialstore)
+        reader = serial.client.reader
+        self.assertNotEqual(reader.flightData[0]['ATP'], "")
+
+        for workers in [1, 2]:
+            [batch, storefile] = self.readFlight('batch' + str(workers))
+            counts = []
+            self.assertEqual(
+                retrieveFlight(batch.client, workers, counts.append), [])
+            self.assertEqual(counts[-1], 40)
+            self.assertEqual(counts, sorted(counts))
+
+            self.assertEqual(json.dumps(batch.client.reader.flightData),
+                             json.dumps(reader.flightData))
+
+            # The flight stores match too
+            self.assertEqual(
+                json.dumps(FlightStore(storefile).readAll()),
+                json.dumps(FlightStore(serialstore).readAll()))
+
+    def testWorker(self):
+        """ Test that a worker retrieves using the shared templates """
+        [batch, storefile] = self.readFlight('worker')
+        retriever = batch.client.retriever
+        chunk = splitScans(batch.client, 4)[1]
+
+        stack = retriever.rcf_set.getStack()
+        shared = stack.share()
+        try:
+            retrieve.initWorker(shared, retriever.rcf_set.getTopK())
+            # The worker doesn't read the RCF files
+            self.assertEqual(retrieve._retriever.rcf_set.getRCFVector(), [])
+            self.assertEqual(json.dumps(retrieve.retrieveChunk(chunk)),
+                             json.dumps(retrieveScans(retriever, chunk)))
+            retrieve._retriever.rcf_set.getStack().close()
+        finally:
+            retrieve._retriever = None
+            stack.unlink()
+
+    def testRetrieveScans(self):
+        """ Test that a scan that can't be retrieved only fails itself """
+        [batch, storefile] = self.readFlight('scans')
+        retriever = batch.client.retriever
+        chunk = splitScans(batch.client, 4)[0]
+        results = retrieveScans(retriever, chunk)
+
+        # A scan without brightness temperatures stops the batch, so the
+        # scans are done one at a time
+        chunk[2][1] = ''
+        failed = retrieveScans(retriever, chunk)
+        self.assertEqual(failed[2][0:3], [chunk[2][0], None, None])
+        self.assertIsNotNone(failed[2][3])
+        self.assertEqual(json.dumps(failed[0:2] + failed[3:]),
+                         json.dumps(results[0:2] + results[3:]))
+
+    def testFailed(self):
+        """ Test that scans the retrieval fails for are reported """
+        [batch, storefile] = self.readFlight('failed')
+        batch.client.reader.flightData[3]['Aline']['values']['SAPALT'][
+            'val'] = ''
+        failed = retrieveFlight(batch.client, 2)
+        self.assertEqual([index for [index, err] in failed], [3])
+        self.assertEqual(batch.client.reader.flightData[3]['ATP'], "")
+        self.assertNotEqual(batch.client.reader.flightData[4]['ATP'], "")
+
+    def testBatch(self):
+        """ Test that the batch processor uses workers if asked to """
+        [batch, storefile] = self.readFlight('batch')
+        batch.client.retrievalWorkers = 2
+        with patch('proc.batch.retrieveFlight',
+                   wraps=retrieveFlight) as mock:
+            self.assertEqual(batch.processFlight(), 0)
+        mock.assert_called_once()
+        self.assertIn("Processed 40 of 40 scans", self.stream.getvalue())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logger.delHandler()
@@ -21,13 +21,23 @@
 import numpy
 import unittest
 import logging
+import multiprocessing
 from io import StringIO
 from util.retriever import Retriever
+from util.rcf_stack import RetrievalCoefficientStack
 from EOLpython.Qlogger.messageHandler import QLogger
 
 logger = QLogger("EOLlogger")
 
 
+def retrieveShared(shared, ScanBTs, ACAltKm):
+    """ Retrieve scans in a worker process using the shared templates """
+    stack = RetrievalCoefficientStack.attach(shared)
+    Profiles = Retriever.fromStack(stack).retrieve_batch(ScanBTs, ACAltKm)
+    stack.close()
+    return Profiles
+
+
 class TESTretriever(unittest.TestCase):
 
     def setUp(self):
@@ -132,5 +142,103 @@ class TESTretriever(unittest.TestCase):
         # Should only read in the RCF dir once, so check than len still just 1
         self.assertEqual(len(Rtr.rcf_set._RCFs), 1)
 
+        # Each retrieval gets a new profile, so it can be saved without
+        # copying it
+        ATP = Rtr.retrieve(self.scanBTs, BestWtdRcSet)
+        self.assertIsNot(ATP, self.ATP)
+        self.assertIsNot(ATP['trop']['val'][0], self.ATP['trop']['val'][0])
+        self.assertIsNot(ATP['RCFMRIndex'], self.ATP['RCFMRIndex'])
+        ATP['trop']['val'][0]['idx'] = 28
+        self.assertTrue(numpy.isnan(self.ATP['trop']['val'][0]['idx']))
+
+    def test_retrieve_batch(self):
+        """ Validate batch retrieval against single scan retrieval """
+        Rtr = Retriever(self.RCFdir)
+        ACAltKm = [self.ACAltKm, 5.3473, 14.0, 0.0, numpy.nan, -1]
+        ScanBTs = [[bt + i for bt in self.scanBTs]
+                   for i in range(len(ACAltKm))]
+        Profiles = Rtr.retrieve_batch(ScanBTs, ACAltKm)
+
+        self.assertEqual(Profiles['Temperatures'].shape, (6, 33))
+        self.assertEqual(Profiles['Altitudes'].shape, (6, 33))
+        for i in range(4):
+            BestWtdRCSet = Rtr.getRCSet(ScanBTs[i], ACAltKm[i])
+            self.assertEqual(Profiles['RCSetRefs'][i],
+                             Rtr.rcf_set.compactRCSet(BestWtdRCSet))
+            ATP = Rtr.retrieve(ScanBTs[i], BestWtdRCSet)
+            self.assertTrue(numpy.array_equal(Profiles['Temperatures'][i],
+                                              ATP['Temperatures'],
+                                              equal_nan=True))
+            self.assertTrue(numpy.array_equal(Profiles['Altitudes'][i],
+                                              ATP['Altitudes'],
+                                              equal_nan=True))
+            self.assertEqual(Profiles['RCFIndex'][i], ATP['RCFIndex'])
+            self.assertEqual(Profiles['RCFMRIndex'][i],
+                             ATP['RCFMRIndex']['val'])
+            self.assertTrue(numpy.array_equal(
+                [Profiles['RCFALT1Index'][i], Profiles['RCFALT2Index'][i]],
+                [ATP['RCFALT1Index'], ATP['RCFALT2Index']], equal_nan=True))
+
+        self.assertEqual('%7.3f' % Profiles['Temperatures'][0][5], '269.615')
+
+        # Scans with missing or negative altitude have no profile
+        for i in [4, 5]:
+            self.assertEqual(Profiles['RCFIndex'][i], -1)
+            self.assertIsNone(Profiles['RCSetRefs'][i])
+            self.assertTrue(numpy.all(numpy.isnan(
+                Profiles['Temperatures'][i])))
+
+    def test_retrieve_shared(self):
+        """ Retrieve in worker processes attached to shared templates """
+        Rtr = Retriever(self.RCFdir)
+        ACAltKm = [self.ACAltKm, 5.3473, 14.0, 0.0, numpy.nan]
+        ScanBTs = [[bt + i for bt in self.scanBTs]
+                   for i in range(len(ACAltKm))]
+        Profiles = Rtr.retrieve_batch(ScanBTs, ACAltKm)
+
+        stack = Rtr.rcf_set.getStack()
+        shared = stack.share()
+        try:
+            with multiprocessing.Pool(2) as pool:
+                results = pool.starmap(retrieveShared,
+                                       [(shared, ScanBTs[0:3], ACAltKm[0:3]),
+                                        (shared, ScanBTs[3:], ACAltKm[3:])])
+        finally:
+            stack.unlink()
+
+        for key in Profiles:
+            if key == 'RCSetRefs':
+                self.assertEqual(Profiles[key],
+                                 results[0][key] + results[1][key])
+                continue
+            self.assertTrue(numpy.array_equal(
+                Profiles[key],
+                numpy.concatenate([result[key] for result in results]),
+                equal_nan=True))
+        self.assertEqual(shared['RCFIds'], ['NRCKA068'])
+
+    def test_Pressure2Km(self):
+        """ Test conversion of pressure to altitude """
+        Rtr = Retriever(self.RCFdir)
+        # Pressures at the boundaries of the standard atmosphere layers
+        Pressures = [1013.25, 226.3206, 54.7488, 8.680185, 1.109063,
+                     0.6693885, 0.03956419]
+        Altitudes = [0.0, 11.0, 20.0, 32.0, 47.0, 51.0, 71.0]
+        for alt, expected in zip(Rtr.Pressure2Km(Pressures), Altitudes):
+            self.assertAlmostEqual(alt, expected, places=4)
+
+        # Pressure that is zero or negative is converted as if it were
+        # 0.000001
+        self.assertEqual(Rtr.Pressure2Km([0, -1]), Rtr.Pressure2Km([1e-6]*2))
+
+        # Rows of a 2-D array are converted the same as individually
+        Altitudes = Rtr.Pressure2KmArray([Pressures, Pressures[::-1],
+                                          Pressures])
+        self.assertEqual(Altitudes.shape, (3, 7))
+        self.assertEqual(list(Altitudes[0]), Rtr.Pressure2Km(Pressures))
+        self.assertEqual(list(Altitudes[1]),
+                         Rtr.Pressure2Km(Pressures[::-1]))
+        self.assertEqual(list(Altitudes[2]), list(Altitudes[0]))
+
     def tearDown(self):
         logger.delHandler()
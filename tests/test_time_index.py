@@ -0,0 +1,97 @@
+###############################################################################
+# Test util/time_index.py
+#
+# To run these tests:
+#     cd src/
+#     python3 -m unittest discover -s ../tests -v
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2024
+###############################################################################
+import os
+import json
+import logging
+import unittest
+from io import StringIO
+from util.readmtp import readMTP
+from util.time_index import TimeIndex
+from lib.rootdir import getrootdir
+from EOLpython.Qlogger.messageHandler import QLogger
+
+logger = QLogger("EOLlogger")
+
+
+class TESTtimeIndex(unittest.TestCase):
+
+    def setUp(self):
+        # For testing, we want to capture the log messages in a buffer so we
+        # can compare the log output to what we expect.
+        self.stream = StringIO()  # Set output stream to buffer
+        self.log = logger.initStream(self.stream, logging.INFO)
+
+        # Scans every 17 seconds across midnight
+        self.times = [86360, 86377, 86394, 11, 28, 45]
+        self.index = TimeIndex(self.times)
+
+    def testRollover(self):
+        """ Test that times after midnight have a day added """
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.getTime(2), 86394)
+        self.assertEqual(self.index.getTime(3), 86411)
+        self.assertEqual(self.index.addTime(62), 86462)
+        self.assertEqual(self.stream.getvalue(), "")
+
+    def testGetIndex(self):
+        """ Test finding the scan nearest a time """
+        self.assertEqual(self.index.getIndex(86360), 0)
+        self.assertEqual(self.index.getIndex(86385), 1)
+        self.assertEqual(self.index.getIndex(86386), 2)
+        self.assertEqual(self.index.getIndex(5), 3)
+        self.assertEqual(self.index.getIndex(3600), 5)
+        self.assertIsNone(TimeIndex().getIndex(0))
+
+        self.assertEqual(self.index.findTime(28), 4)
+        self.assertIsNone(self.index.findTime(29))
+        # Without rollover, the time must already count the days
+        self.assertIsNone(self.index.findTime(28, rollover=False))
+        self.assertEqual(self.index.findTime(86428, rollover=False), 4)
+
+    def testGetRange(self):
+        """ Test finding the scans in a time range """
+        self.assertEqual(self.index.getRange(86377, 28), slice(1, 5))
+        self.assertEqual(self.index.getRange(86380, 10), slice(2, 3))
+        self.assertEqual(self.index.getRange(100, 200), slice(6, 6))
+
+    def testOutOfOrder(self):
+        """ Test that a missing or out of order time keeps the index sorted """
+        self.index.addTime(float('nan'))
+        self.assertEqual(self.index.getTime(6), 86445)
+        self.index.addTime(40)
+        self.assertIn("Scan 7 is earlier", self.stream.getvalue())
+
+    def testReader(self):
+        """ Test that the reader's index follows flightData """
+        reader = readMTP()
+        jsonfile = os.path.join(getrootdir(), 'tests', 'test_data',
+                                'DEEPWAVErf01.mtpRealTime.json')
+        with open(jsonfile) as f:
+            scans = [json.loads(line) for line in f]
+        times = [scan['Aline']['values']['TIME']['val'] for scan in scans]
+
+        reader.flightData.extend(scans[0:10])
+        index = reader.getTimeIndex()
+        self.assertEqual(len(index), 10)
+
+        # Scans archived later are added to the same index
+        reader.flightData.extend(scans[10:])
+        reader.flightTable.extend(scans[10:])
+        self.assertIs(reader.getTimeIndex(), index)
+        self.assertEqual(len(index), len(scans))
+        self.assertEqual(index.getIndex(times[20] + 3), 20)
+
+        reader.clearFlightData()
+        self.assertEqual(len(reader.getTimeIndex()), 0)
+
+    def tearDown(self):
+        logger.delHandler()
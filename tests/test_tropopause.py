@@ -16,11 +16,15 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import os
 import unittest
 import numpy
 import logging
+import tempfile
 from io import StringIO
-from util.tropopause import Tropopause
+from proc.batch import MTPbatch
+from util.tropopause import Tropopause, TropopauseBatch
+from lib.rootdir import getrootdir
 from EOLpython.Qlogger.messageHandler import QLogger
 
 logger = QLogger("EOLlogger")
@@ -123,6 +127,20 @@ class TESTtropopause(unittest.TestCase):
         self.assertTrue(numpy.isnan(altctrop))
         self.assertTrue(numpy.isnan(tempctrop))
 
+    def test_findTropopauseRunOff(self):
+        """ Profile that ends less than 2km above a possible tropopause """
+        # Squeeze the levels above the tropopause into less than 2km
+        alts = numpy.array(self.ATP['Altitudes'])
+        alts = numpy.where(alts > 15.1, 15.0862 + (alts - 15.0862) * 0.15,
+                           alts)
+        trop = Tropopause({'Temperatures': self.ATP['Temperatures'],
+                           'Altitudes': list(alts)}, self.NUM_RETR_LVLS)
+        [startidx, trop, altctrop, tempctrop] = trop.findTropopause(0)
+        self.assertEqual(startidx, 28)
+        self.assertTrue(numpy.isnan(trop))
+        self.assertTrue(numpy.isnan(altctrop))
+        self.assertTrue(numpy.isnan(tempctrop))
+
     def test_findTwoTropopauses(self):
         """ If there should be two tropopauses, make sure they are found """
         self.startTropIndex = 0
@@ -209,5 +227,75 @@ class TESTtropopause(unittest.TestCase):
         self.assertEqual(self.ATP2['trop']['val'][1]['tempc'],
                          204.03224961220323)
 
+    def test_TropopauseBatch(self):
+        """ Find tropopauses of a batch of profiles """
+        temps = numpy.array(self.ATP['Temperatures'])
+        alts = numpy.array(self.ATP['Altitudes'])
+        # The sample profile, a missing profile, the sample profile cooled
+        # above 12km so there is a second tropopause, and the sample profile
+        # ending less than 2km above the tropopause
+        Temperatures = numpy.array([temps, numpy.full(33, numpy.nan),
+                                    numpy.where(alts > 12, temps - 4 *
+                                                (alts - 12), temps),
+                                    temps])
+        Altitudes = numpy.array([alts, numpy.full(33, numpy.nan), alts,
+                                 numpy.where(alts > 15.1, 15.0862 +
+                                             (alts - 15.0862) * 0.15, alts)])
+
+        trop = TropopauseBatch(Temperatures, Altitudes).findTropopauses()
+        self.assertEqual(trop['idx'][0, 0], 28)
+        self.assertEqual(trop['altc'][0, 0], 15.086201553731398)
+        self.assertEqual(trop['tempc'][0, 0], 186.83304535834557)
+        self.assertTrue(numpy.isnan(trop['idx'][0, 1]))
+        self.assertTrue(numpy.all(numpy.isnan(trop['idx'][1])))
+        self.assertEqual(trop['idx'][2, 1], 31)
+        self.assertTrue(numpy.all(numpy.isnan(trop['idx'][3])))
+
+        # Results match finding the tropopauses one profile at a time
+        self.assertMatchesScalar(trop, Temperatures, Altitudes)
+
+    def test_TropopauseBatchFlight(self):
+        """ Batch results match one profile at a time for a whole flight """
+        projdir = os.path.join(getrootdir(), 'Data', 'NGV', 'DEEPWAVE')
+        batch = MTPbatch(os.path.join(projdir, 'config', 'proj.yml'), 1)
+        client = batch.client
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storefile = os.path.join(tmpdir, 'test.mtpstore')
+            client.getFlightStoreFilename = lambda: storefile
+            batch.readRawFile(os.path.join(projdir, '20140606',
+                                           'NG20140606.RAW'))
+
+        flightData = client.reader.flightData
+        ACAltKm = [float(scan['Aline']['values']['SAPALT']['val'])
+                   for scan in flightData]
+        Profiles = client.retriever.retrieve_batch(
+            [scan['tbi'] for scan in flightData], ACAltKm)
+
+        trop = TropopauseBatch(Profiles['Temperatures'],
+                               Profiles['Altitudes']).findTropopauses()
+        self.assertEqual(len(trop['idx']), 1533)
+        self.assertGreater(numpy.count_nonzero(~numpy.isnan(
+            trop['idx'][:, 1])), 0)
+        self.assertMatchesScalar(trop, Profiles['Temperatures'],
+                                 Profiles['Altitudes'])
+
+    def assertMatchesScalar(self, trop, Temperatures, Altitudes):
+        """
+        Check that the tropopauses found by TropopauseBatch match finding
+        them one profile at a time, as MTPclient.getProfile() does
+        """
+        NUM_RETR_LVLS = len(Altitudes[0])
+        for n in range(len(Altitudes)):
+            scalar = Tropopause({'Temperatures': list(Temperatures[n]),
+                                 'Altitudes': list(Altitudes[n])},
+                                NUM_RETR_LVLS)
+            [startidx, *first] = scalar.findTropopause(0)
+            second = [numpy.nan] * 3
+            if not numpy.isnan(first[0]):
+                [startidx, *second] = scalar.findTropopause(startidx)
+            numpy.testing.assert_array_equal(
+                [trop['idx'][n], trop['altc'][n], trop['tempc'][n]],
+                numpy.transpose([first, second]), err_msg="scan " + str(n))
+
     def tearDown(self):
         logger.delHandler()